@@ -1,5 +1,7 @@
 import streamlit as st
-from core.data_loader import fetch_reports_from_github, load_local_reports
+from config import WATCH_REPORTS
+from core.data_loader import fetch_reports_from_github
+from core.dataset import get_shared_dataset
 
 st.set_page_config(
     page_title="ML Threat Intelligence",
@@ -24,4 +26,7 @@ st.write("Use the left sidebar to navigate between **Dashboard**, **ML Intellige
 
 # Optionally pre-fetch reports from GitHub
 fetch_reports_from_github()
-_ = load_local_reports()  # just to validate presence
+_ = get_shared_dataset()  # validates presence and warms the shared copy
+if WATCH_REPORTS:
+    from core.watcher import start_watcher
+    start_watcher()
@@ -0,0 +1,183 @@
+"""
+Benchmark Runner
+----------------
+Generates synthetic report folders at several scales and times the ingest
+and analytics hot paths, recording wall time and peak traced memory per
+stage to a JSON file that can be compared against a previous run.
+
+    python -m benchmarks.run_benchmarks --scales small medium
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/previous.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from core import reporting
+from core.data_loader import (load_local_reports, get_ttp_and_country_columns, melt_ttp_country, flatten_ttp_values,
+                              read_excel_report, read_excel_report_pandas, REQUIRED_COLUMNS)
+from config import DEDUP_TEXT_COLUMNS
+from core.ml_models import ml_cluster_threat_patterns, ml_forecast_time_series, ml_forecast_by_attack_type
+from core.nlp_intel import extract_nlp_intelligence
+from core.recommendations import recommend_courses
+from .synthetic import generate_reports
+
+SCALES = {
+    "small": {"weeks": 4, "rows": 60, "ttp_columns": 8, "country_columns": 17, "vocabulary": 60},
+    "medium": {"weeks": 26, "rows": 200, "ttp_columns": 8, "country_columns": 17, "vocabulary": 400},
+    "large": {"weeks": 104, "rows": 500, "ttp_columns": 12, "country_columns": 24, "vocabulary": 2000},
+}
+
+
+def _latest(items):
+    return items[items["report_date"] == items["report_date"].max()]
+
+
+def _melt_pipeline(items, ttp_columns, country_columns):
+    melted = melt_ttp_country(_latest(items), ttp_columns, country_columns)
+    melted.groupby("TTP", observed=True).size()
+    melted.groupby("country", observed=True).size()
+    return melted.groupby(["country", "TTP"], observed=True).size()
+
+
+def stages(folder, cache_folder):
+    """
+    (name, callable) pairs; each callable takes the loaded context dict.
+    Per-report analytics run on the latest week, as the pages do; history
+    analytics (NLP, recommendations, forecasts) run on the full archive.
+    """
+    workbooks = sorted(glob.glob(os.path.join(folder, "ttp_reports_*.xlsx")))
+    excel = [
+        ("read_excel_streaming",
+         lambda ctx: [read_excel_report(f, REQUIRED_COLUMNS + DEDUP_TEXT_COLUMNS) for f in workbooks]),
+        ("read_excel_pandas", lambda ctx: [read_excel_report_pandas(f) for f in workbooks]),
+    ] if workbooks else []
+    return excel + [
+        ("load_local_reports", lambda ctx: load_local_reports(folder, use_cache=False)),
+        ("load_local_reports_cached", lambda ctx: load_local_reports(folder, cache_folder=cache_folder)),
+        ("melt_groupby_latest", lambda ctx: _melt_pipeline(ctx["items"], ctx["ttp_columns"], ctx["country_columns"])),
+        ("extract_nlp_intelligence", lambda ctx: extract_nlp_intelligence(ctx["items"], ctx["ttp_columns"])),
+        ("recommend_courses", lambda ctx: recommend_courses(ctx["items"], ctx["ttp_columns"], 1.0)),
+        ("ml_cluster_threat_patterns_latest",
+         lambda ctx: ml_cluster_threat_patterns(flatten_ttp_values(_latest(ctx["items"]), ctx["ttp_columns"]))),
+        ("ml_forecast_time_series", lambda ctx: ml_forecast_time_series(ctx["items"])),
+        ("ml_forecast_by_attack_type", lambda ctx: ml_forecast_by_attack_type(ctx["items"], ctx["ttp_columns"])),
+    ]
+
+
+def measure(fn, ctx, repeat):
+    """
+    Time `fn` `repeat` times untraced, then once under tracemalloc for peak memory.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(ctx)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "peak_bytes": peak,
+    }
+
+
+def run_scale(name, params, fmt, repeat, workdir, only=None):
+    folder = os.path.join(workdir, f"{name}_{fmt}")
+    generate_reports(folder, fmt=fmt, **params)
+    cache_folder = os.path.join(workdir, f"{name}_{fmt}_cache")
+    items = load_local_reports(folder, cache_folder=cache_folder)
+    ttp_columns, country_columns = get_ttp_and_country_columns(items)
+    ctx = {"items": items, "ttp_columns": ttp_columns, "country_columns": country_columns}
+
+    results = []
+    for stage, fn in stages(folder, cache_folder):
+        if only and stage not in only:
+            continue
+        result = measure(fn, ctx, repeat)
+        results.append({"stage": stage, "scale": name, "format": fmt, "rows": len(items), **params, **result})
+        print(f"{name:>8} {fmt:>4} {stage:<36} {result['seconds_median'] * 1000:10.1f} ms "
+              f"{result['peak_bytes'] / 2**20:9.1f} MiB", flush=True)
+    timed = {r["stage"]: r for r in results}
+    if {"read_excel_streaming", "read_excel_pandas"} <= timed.keys():
+        streaming, baseline = timed["read_excel_streaming"], timed["read_excel_pandas"]
+        print(f"{name:>8} {fmt:>4} {'streaming vs pandas Excel reader':<36} "
+              f"time x{streaming['seconds_median'] / baseline['seconds_median']:5.2f}  "
+              f"memory x{streaming['peak_bytes'] / max(baseline['peak_bytes'], 1):5.2f}", flush=True)
+    return results
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    baseline = {(r["stage"], r["scale"], r["format"]): r for r in previous["results"]}
+    print(f"\nComparison against {previous_path} (ratio current / previous):")
+    for r in current:
+        old = baseline.get((r["stage"], r["scale"], r["format"]))
+        if not old:
+            continue
+        t_ratio = r["seconds_median"] / old["seconds_median"] if old["seconds_median"] else float("nan")
+        m_ratio = r["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("nan")
+        print(f"{r['scale']:>8} {r['format']:>4} {r['stage']:<36} time x{t_ratio:5.2f}  memory x{m_ratio:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingest and analytics hot paths.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=sorted(SCALES))
+    parser.add_argument("--formats", nargs="+", default=["xlsx"], choices=["xlsx", "csv"])
+    parser.add_argument("--stages", nargs="*", default=None, help="Only run these stages.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Result JSON path (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", default=None, help="Previous result JSON to compare against.")
+    parser.add_argument("--workdir", default=None, help="Where to write synthetic reports (default: a temp dir).")
+    args = parser.parse_args(argv)
+
+    reporting.set_reporter(reporting.LoggingReporter())
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cti-bench-")
+
+    results = []
+    for scale in args.scales:
+        for fmt in args.formats:
+            results.extend(run_scale(scale, SCALES[scale], fmt, args.repeat, workdir, only=args.stages))
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", time.strftime("bench_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "sklearn": sklearn.__version__,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Synthetic Report Generator
+--------------------------
+Writes `ttp_reports_DDMMYY` workbooks or CSVs shaped like the real weekly
+exports (a `Human_Attacks` sheet with `ttp_desc_*` and `country_*` columns)
+at configurable sizes, for benchmarking the ingest and analytics paths.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pycountry
+
+BASE_TECHNIQUES = [
+    "Phishing (T1566.002)",
+    "Spearphishing Attachment (T1566.001)",
+    "Impersonation (T1656)",
+    "Social Engineering (T1566 / TA0001)",
+    "Malware (TA0002/TA0003)",
+    "Ransomware (T1486)",
+    "Credential Harvesting (T1056)",
+    "Valid Accounts (T1078)",
+    "Exploit Public-Facing Application (T1190)",
+    "Supply Chain Compromise (T1195)",
+    "Cloud Account Takeover (T1078.004)",
+    "Deepfake Voice Phishing (T1566.004)",
+    "Lateral Movement (TA0008)",
+    "Privilege Escalation (TA0004)",
+    "Data Exfiltration (TA0010)",
+    "Mobile App Trojan (T1476)",
+]
+
+ACTION_WORDS = ["Targeted", "Automated", "AI-generated", "Credential", "Cloud", "Mobile", "Vendor", "Insider"]
+
+
+def _vocabulary(size, rng):
+    techniques = list(BASE_TECHNIQUES)
+    i = 0
+    while len(techniques) < size:
+        base = BASE_TECHNIQUES[i % len(BASE_TECHNIQUES)]
+        word = ACTION_WORDS[rng.integers(len(ACTION_WORDS))]
+        techniques.append(f"{word} {base.split(' (')[0]} Variant {i} (T{1000 + i})")
+        i += 1
+    return np.array(techniques[:size], dtype=object)
+
+
+def generate_report_frame(rows, ttp_columns=8, country_columns=17, vocabulary=200, seed=0, report_date=None):
+    """
+    One synthetic report as a DataFrame. Each row fills a random number of its
+    TTP and country slots (Zipf-weighted so a few values dominate, as in the
+    real feeds) and leaves the rest empty.
+    """
+    rng = np.random.default_rng(seed)
+    techniques = _vocabulary(vocabulary, rng)
+    countries = np.array([c.name for c in pycountry.countries], dtype=object)
+    sources = np.array([f"source{i}.example.com" for i in range(40)], dtype=object)
+
+    ttp_weights = 1.0 / np.arange(1, len(techniques) + 1)
+    ttp_weights /= ttp_weights.sum()
+    country_weights = 1.0 / np.arange(1, len(countries) + 1) ** 0.8
+    country_weights /= country_weights.sum()
+
+    def fill(values, weights, width, mean_filled):
+        counts = np.clip(rng.poisson(mean_filled, size=rows), 1, width)
+        grid = rng.choice(values, size=(rows, width), p=weights).astype(object)
+        grid[np.arange(width)[None, :] >= counts[:, None]] = None
+        return grid
+
+    ttp_grid = fill(techniques, ttp_weights, ttp_columns, 3)
+    country_grid = fill(countries, country_weights, country_columns, 2)
+    published = pd.Timestamp(report_date or "2025-01-01") - pd.to_timedelta(rng.integers(0, 7 * 24 * 3600, rows), unit="s")
+
+    df = pd.DataFrame({
+        "url": [f"https://news.example.com/{seed}/{i}" for i in range(rows)],
+        "title": [f"Incident {seed}-{i}" for i in range(rows)],
+        "published_utc": published,
+        "source": rng.choice(sources, size=rows),
+        "threat_actor": None,
+    })
+    for j in range(country_columns):
+        df[f"country_{j + 1}"] = country_grid[:, j]
+    for j in range(ttp_columns):
+        df[f"ttp_desc_{j + 1}"] = ttp_grid[:, j]
+    return df
+
+
+def generate_reports(folder, weeks=4, rows=100, ttp_columns=8, country_columns=17,
+                     vocabulary=200, fmt="xlsx", start="2025-01-03", seed=0):
+    """
+    Write `weeks` weekly reports into `folder` and return their paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for week, report_date in enumerate(pd.date_range(start=start, periods=weeks, freq="7D")):
+        df = generate_report_frame(rows, ttp_columns, country_columns, vocabulary,
+                                   seed=seed + week, report_date=report_date)
+        name = f"ttp_reports_{report_date.strftime('%d%m%y')}.{fmt}"
+        path = os.path.join(folder, name)
+        if fmt == "xlsx":
+            with pd.ExcelWriter(path) as writer:
+                df.to_excel(writer, sheet_name="Human_Attacks", index=False)
+                df.head(0).to_excel(writer, sheet_name="General_Attacks", index=False)
+        else:
+            df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
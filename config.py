@@ -3,3 +3,27 @@ import os
 REPORTS_FOLDER = os.getenv("REPORTS_FOLDER", "reports")
 API_URL = os.getenv("API_URL", "")  # if you still want GitHub API listing
 ML_AVAILABLE = True  # toggled in ml_models if import fails
+FIGURE_CACHE_MAX_BYTES = int(os.getenv("FIGURE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+INSTRUMENTATION_ENABLED = os.getenv("CTI_INSTRUMENT", "0") == "1"
+INSTRUMENTATION_MEMORY = os.getenv("CTI_INSTRUMENT_MEMORY", "0") == "1"
+CACHE_FOLDER = os.getenv("CACHE_FOLDER", ".cache")
+CSV_CHUNKSIZE = int(os.getenv("CSV_CHUNKSIZE", "50000"))
+EXCEL_STREAMING = os.getenv("EXCEL_STREAMING", "1") == "1"  # stream the sheet XML with zipfile/ElementTree; "0" uses pd.read_excel
+REPORT_COLUMNS = [c for c in os.getenv("REPORT_COLUMNS", "source").split(",") if c]
+LOAD_OPTIMIZED = os.getenv("LOAD_OPTIMIZED", "1") == "1"
+DATASET_MEMORY_BUDGET_MB = int(os.getenv("DATASET_MEMORY_BUDGET_MB", "1024"))
+DATASET_REFRESH_SECONDS = float(os.getenv("DATASET_REFRESH_SECONDS", "5"))
+WATCH_INTERVAL_SECONDS = float(os.getenv("WATCH_INTERVAL_SECONDS", "5"))
+WATCH_REPORTS = os.getenv("WATCH_REPORTS", "0") == "1"  # poll REPORTS_FOLDER from the Streamlit process
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8600"))
+API_CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DEDUP_MODE = os.getenv("DEDUP_MODE", "flag")  # "off", "flag" (is_duplicate column) or "collapse" (drop)
+DEDUP_TEXT_COLUMNS = [c for c in os.getenv("DEDUP_TEXT_COLUMNS", "title,url,threat_actor").split(",") if c]
+TTP_CANONICALIZE = os.getenv("TTP_CANONICALIZE", "1") == "1"
+TTP_SIMILARITY_THRESHOLD = float(os.getenv("TTP_SIMILARITY_THRESHOLD", "0.9"))
+ATTACK_DATA_PATH = os.getenv("ATTACK_DATA_PATH", "")  # default: data/enterprise-attack.json or data/attack_techniques.csv
+GEOIP_RANGES_PATH = os.getenv("GEOIP_RANGES_PATH", "")  # default: data/ip_country.csv, GeoLite2 CSVs or the .mmdb
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "4"))
+SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "12"))  # 2**p registers, ~1.04 / sqrt(2**p) error
+SKETCH_TOP_CAPACITY = int(os.getenv("SKETCH_TOP_CAPACITY", "256"))  # counters per heavy-hitter summary
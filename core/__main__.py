@@ -0,0 +1,123 @@
+"""
+Command-line entry point: `python -m core <command> ...`.
+"""
+
+import argparse
+import contextlib
+import logging
+import sys
+
+from config import REPORTS_FOLDER, WATCH_INTERVAL_SECONDS, API_HOST, API_PORT
+from . import instrumentation, reporting
+
+
+def _run(args):
+    from .batch import run_batch
+    if args.metrics or args.flamegraph:
+        instrumentation.enable(track_memory=args.memory)
+    with contextlib.ExitStack() as stack:
+        if args.profile:
+            stack.enter_context(instrumentation.profile(args.profile))
+        run_batch(args.reports, args.output, fmt=args.format,
+                  selected_countries=args.countries, periods=args.periods)
+    if args.metrics:
+        instrumentation.dump_json(args.metrics)
+    if args.flamegraph:
+        instrumentation.dump_collapsed(args.flamegraph)
+    return 0
+
+
+def _watch(args):
+    from .batch import run_analytics, write_results, check_output_format
+    from .dataset import get_shared_dataset
+    from .watcher import ReportWatcher, warm_artifacts
+
+    if args.output:
+        check_output_format(args.format)
+
+    def publish(dataset, changes=None):
+        if args.output:
+            results = run_analytics(dataset, selected_countries=args.countries, periods=args.periods)
+            written = write_results(results, args.output, fmt=args.format)
+            reporting.info(f"Wrote {len(written)} files to {args.output} for version {dataset.version}")
+        else:
+            warm_artifacts(dataset)
+
+    publish(get_shared_dataset(args.reports, refresh=False))
+    watcher = ReportWatcher(args.reports, args.interval, on_publish=publish)
+    reporting.info(f"Watching {args.reports}/ every {args.interval:g}s")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _serve(args):
+    from .api import make_server
+    from .dataset import get_shared_dataset
+
+    get_shared_dataset(args.reports)
+    server = make_server(args.host, args.port, args.reports)
+    reporting.info(f"Serving the JSON API on http://{args.host}:{server.server_port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m core", description="Headless threat intelligence analytics.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug output.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run all analytics and write the results.")
+    run.add_argument("--reports", default=REPORTS_FOLDER, help="Folder containing ttp_reports_* files.")
+    run.add_argument("--output", default="output", help="Directory for the result files.")
+    run.add_argument("--format", choices=["json", "parquet"], default="json",
+                     help="Format for tabular outputs; nested outputs are always JSON.")
+    run.add_argument("--countries", nargs="*", default=None, help="Geographic filter applied to the risk scores.")
+    run.add_argument("--periods", type=int, default=4, help="Number of weeks to forecast.")
+    run.add_argument("--metrics", help="Write per-stage timing/memory JSON to this path.")
+    run.add_argument("--memory", action="store_true", help="Track the peak increase of traced memory per stage (slower).")
+    run.add_argument("--flamegraph", help="Write stage self-times in collapsed-stack format to this path.")
+    run.add_argument("--profile", help="Write cProfile stats for the whole run to this path.")
+    run.set_defaults(handler=_run)
+
+    watch = commands.add_parser("watch", help="Refresh cached aggregates whenever report files change.")
+    watch.add_argument("--reports", default=REPORTS_FOLDER, help="Folder containing ttp_reports_* files.")
+    watch.add_argument("--interval", type=float, default=WATCH_INTERVAL_SECONDS, help="Seconds between polls.")
+    watch.add_argument("--output", help="Also rewrite the headless run results to this directory on each change.")
+    watch.add_argument("--format", choices=["json", "parquet"], default="json",
+                       help="Format for tabular outputs with --output.")
+    watch.add_argument("--countries", nargs="*", default=None, help="Geographic filter applied to the risk scores.")
+    watch.add_argument("--periods", type=int, default=4, help="Number of weeks to forecast.")
+    watch.set_defaults(handler=_watch)
+
+    serve = commands.add_parser("serve", help="Serve scores, counts and forecasts as a read-only JSON API.")
+    serve.add_argument("--reports", default=REPORTS_FOLDER, help="Folder containing ttp_reports_* files.")
+    serve.add_argument("--host", default=API_HOST, help="Address to bind.")
+    serve.add_argument("--port", type=int, default=API_PORT, help="Port to listen on.")
+    serve.set_defaults(handler=_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    reporting.set_reporter(reporting.LoggingReporter())
+    try:
+        return args.handler(args)
+    except reporting.ReportsUnavailableError:
+        return 1
+    except ImportError as e:
+        reporting.error(f"Missing optional dependency: {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+"""
+HTTP API
+--------
+Read-only JSON endpoints over the shared dataset for tools that cannot use
+the Streamlit pages (SIEMs, reporting jobs). Every response is built from
+the same core functions as the Dashboard and kept in a bounded LRU cache
+keyed by dataset version, path and query, so repeated queries are served
+without recomputation; responses carry a strong ETag and `If-None-Match`
+revalidation answers 304. Requests are handled on one thread each.
+
+    GET /api/version
+    GET /api/scores?date=&countries=
+    GET /api/top-ttps?date=|start=&end=&countries=&n=
+    GET /api/countries?date=|start=&end=&countries=
+    GET /api/rollup?by=&measure=&date=|start=&end=&countries=&ttps=&sources=
+    GET /api/range-summary?start=&end=&n=
+    GET /api/deltas?date=&kind=
+    GET /api/forecast?periods=
+    GET /api/attack-forecasts?periods=&top_n=
+    GET /api/recommendations?by=week&date=|by=country|source&group=&periods=
+
+`date` defaults to the latest report; list parameters are comma-separated.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+import pandas as pd
+
+from config import REPORTS_FOLDER, API_HOST, API_PORT, API_CACHE_MAX_BYTES
+from . import reporting
+from .bitmaps import get_country_bitmaps
+from .cube import get_count_cube, MEASURES
+from .dataset import get_shared_dataset
+from .deltas import get_weekly_deltas, deltas_for_week
+from .instrumentation import stage
+from .ml_models import ml_forecast_from_counts, ml_forecast_by_attack_type_from_counts
+from .recommendations import batch_recommendations, GROUPINGS
+from .risk_scoring import score_report_from_cube, score_range_from_sketches
+from .sketches import get_range_sketches
+
+logger = logging.getLogger(__name__)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _is_date(value):
+    return isinstance(value, (pd.Timestamp, datetime.date)) or value is pd.NaT
+
+
+def _isoformat(value):
+    """
+    ISO string of a date or timestamp; midnight timestamps (report dates)
+    format as plain dates. NaT becomes None.
+    """
+    if pd.isna(value):
+        return None
+    if isinstance(value, datetime.datetime) and value == value.replace(hour=0, minute=0, second=0, microsecond=0) \
+            and not getattr(value, "nanosecond", 0):
+        value = value.date()
+    return value.isoformat()
+
+
+def to_jsonable(value):
+    """
+    `value` with frames, numpy and pandas values converted to plain JSON
+    types; NaN becomes null.
+    """
+    if isinstance(value, pd.DataFrame):
+        dates = [c for c in value.columns if pd.api.types.is_datetime64_any_dtype(value[c])
+                 or (value[c].dtype == object and value[c].map(_is_date).any())]
+        if dates:
+            value = value.assign(**{c: value[c].map(lambda v: _isoformat(v) if _is_date(v) else v)
+                                    for c in dates})
+        return json.loads(value.to_json(orient="records"))
+    if isinstance(value, pd.Series):
+        return to_jsonable(value.to_dict())
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray, pd.Index)):
+        values = sorted(value) if isinstance(value, (set, frozenset)) else list(value)
+        return [to_jsonable(v) for v in values]
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return _isoformat(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+# -------------------------------
+# Query parameters
+# -------------------------------
+def _list(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def _int(params, name, default, lo=1, hi=1000):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"'{name}' must be an integer")
+    if not lo <= value <= hi:
+        raise BadRequest(f"'{name}' must be between {lo} and {hi}")
+    return value
+
+
+def _day(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value).date()
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a date (YYYY-MM-DD)")
+
+
+def _report_date(dataset, params):
+    date = _day(params, "date")
+    if date is None:
+        if not dataset.report_dates:
+            raise BadRequest("No reports loaded")
+        return dataset.report_dates[-1]
+    if date not in dataset.report_dates:
+        raise BadRequest(f"No report dated {date.isoformat()}")
+    return date
+
+
+def _window(dataset, params):
+    """
+    (start, end) from `date` (one report) or `start`/`end` (a range);
+    defaults to the latest report.
+    """
+    if "start" in params or "end" in params:
+        return _day(params, "start"), _day(params, "end")
+    date = _report_date(dataset, params)
+    return date, date
+
+
+def _report_countries(dataset, date):
+    return get_country_bitmaps(dataset).countries_in(*dataset.row_range(date, date))
+
+
+# -------------------------------
+# Endpoints: (dataset, params) -> JSON-able value
+# -------------------------------
+def version(dataset, params):
+    stats = dataset.stats()
+    return {
+        "version": stats["version"],
+        "rows": stats["rows"],
+        "reports": stats["reports"],
+        "report_dates": dataset.report_dates,
+    }
+
+
+def scores(dataset, params):
+    date = _report_date(dataset, params)
+    metrics = score_report_from_cube(get_count_cube(dataset), date, _report_countries(dataset, date),
+                                     _list(params, "countries"))
+    metrics.pop("unique_techniques")
+    return {"report_date": date, **metrics}
+
+
+def top_ttps(dataset, params):
+    start, end = _window(dataset, params)
+    return get_count_cube(dataset).top("TTP", _int(params, "n", 10), start=start, end=end,
+                                       where={"country": _list(params, "countries")})
+
+
+def countries(dataset, params):
+    start, end = _window(dataset, params)
+    return get_count_cube(dataset).rollup(["country"], start=start, end=end,
+                                          where={"country": _list(params, "countries")})
+
+
+def rollup(dataset, params):
+    measure = params.get("measure", "pairs")
+    if measure not in MEASURES:
+        raise BadRequest(f"'measure' must be one of {sorted(MEASURES)}")
+    by = _list(params, "by") or []
+    where = {dim: _list(params, name) for dim, name in (("TTP", "ttps"), ("country", "countries"),
+                                                          ("source", "sources"))}
+    where = {dim: values for dim, values in where.items() if values is not None}
+    start, end = _window(dataset, params)
+    try:
+        result = get_count_cube(dataset).rollup(by, measure, start=start, end=end, where=where or None)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return {"total": result} if not by else result
+
+
+def range_summary(dataset, params):
+    start, end = _day(params, "start"), _day(params, "end")
+    sketches = get_range_sketches(dataset)
+    n = _int(params, "n", 10)
+    return {
+        "start": start,
+        "end": end,
+        "scores": score_range_from_sketches(sketches, start, end),
+        "top_ttps": sketches.top("TTP", n, start, end),
+        "top_countries": sketches.top("country", n, start, end),
+    }
+
+
+def deltas(dataset, params):
+    kind = params.get("kind")
+    if kind not in (None, "ttp", "country"):
+        raise BadRequest("'kind' must be 'ttp' or 'country'")
+    date = _report_date(dataset, params)
+    return deltas_for_week(get_weekly_deltas(dataset), date, kind)
+
+
+def forecast(dataset, params):
+    daily_counts = get_count_cube(dataset).rollup(["report_date"], "rows")
+    result, trend = ml_forecast_from_counts(daily_counts, periods=_int(params, "periods", 4, hi=52))
+    return {"forecast": result if result is not None else [], "trend": trend}
+
+
+def attack_forecasts(dataset, params):
+    counts = get_count_cube(dataset).rollup(["report_date", "TTP"], "ttps")
+    return ml_forecast_by_attack_type_from_counts(counts, top_n=_int(params, "top_n", 5, hi=50),
+                                                  periods=_int(params, "periods", 4, hi=52)) or {}
+
+
+def recommendations(dataset, params):
+    by = params.get("by", "week")
+    if by not in GROUPINGS:
+        raise BadRequest(f"'by' must be one of {GROUPINGS}")
+    groups = batch_recommendations(dataset, by, _int(params, "periods", 4, hi=52))
+    if by == "week":
+        date = _report_date(dataset, params)
+        return {"report_date": date, **groups[date]}
+    if "group" not in params:
+        return groups
+    if params["group"] not in groups:
+        raise BadRequest(f"No {by} '{params['group']}'")
+    return {by: params["group"], **groups[params["group"]]}
+
+
+ROUTES = {
+    "/api/version": version,
+    "/api/scores": scores,
+    "/api/top-ttps": top_ttps,
+    "/api/countries": countries,
+    "/api/rollup": rollup,
+    "/api/range-summary": range_summary,
+    "/api/deltas": deltas,
+    "/api/forecast": forecast,
+    "/api/attack-forecasts": attack_forecasts,
+    "/api/recommendations": recommendations,
+}
+
+
+# -------------------------------
+# Response cache
+# -------------------------------
+class ResponseCache:
+    """
+    LRU of (etag, body) by (dataset version, path, query), bounded by body
+    bytes. Concurrent misses on one key compute the response once.
+    """
+
+    def __init__(self, max_bytes=API_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None:
+                return entry
+            key_lock = self._building.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._get(key)
+                if entry is not None:
+                    return entry
+            try:
+                body = build()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            entry = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+            with self._lock:
+                # Store before releasing the key, so no request rebuilds it in between.
+                self.misses += 1
+                if len(body) <= self.max_bytes:
+                    replaced = self._entries.pop(key, None)
+                    if replaced is not None:
+                        self.bytes -= len(replaced[1])
+                    self._entries[key] = entry
+                    self.bytes += len(body)
+                    while self.bytes > self.max_bytes:
+                        _, (_, evicted) = self._entries.popitem(last=False)
+                        self.bytes -= len(evicted)
+                self._building.pop(key, None)
+            return entry
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+def matches_etag(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches `etag`: `*`, or any listed tag
+    under weak comparison (a `W/` prefix is ignored).
+    """
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags]
+
+
+# -------------------------------
+# Server
+# -------------------------------
+class APIRequestHandler(BaseHTTPRequestHandler):
+    server_version = "CTI-API/1"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _not_allowed(self):
+        self._send(HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Read-only API: use GET"}, extra={"Allow": "GET, HEAD"})
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = _not_allowed
+
+    def _send(self, status, payload=None, body=None, etag=None, extra=None, send_body=True):
+        if body is None and payload is not None:
+            body = json.dumps(payload).encode()
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body and body is not None:
+            self.wfile.write(body)
+
+    def _respond(self, send_body):
+        url = urlsplit(self.path)
+        endpoint = ROUTES.get(url.path.rstrip("/") or "/")
+        if endpoint is None:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {url.path}", "paths": sorted(ROUTES)},
+                       send_body=send_body)
+            return
+        params = dict(parse_qsl(url.query))
+        try:
+            dataset = get_shared_dataset(self.server.folder)
+            key = (dataset.version, url.path, tuple(sorted(params.items())))
+
+            def build():
+                with stage(f"api.{endpoint.__name__}"):
+                    return json.dumps(to_jsonable(endpoint(dataset, params))).encode()
+
+            etag, body = self.server.cache.get_or_build(key, build)
+        except BadRequest as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(e)}, send_body=send_body)
+            return
+        except reporting.ReportsUnavailableError as e:
+            self._send(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}, send_body=send_body)
+            return
+        except Exception as e:
+            logger.exception("API request %s failed", self.path)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}, send_body=send_body)
+            return
+
+        extra = {"X-Dataset-Version": dataset.version}
+        if matches_etag(self.headers.get("If-None-Match", ""), etag):
+            self._send(HTTPStatus.NOT_MODIFIED, etag=etag, extra=extra, send_body=False)
+        else:
+            self._send(HTTPStatus.OK, body=body, etag=etag, extra=extra, send_body=send_body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(host=API_HOST, port=API_PORT, folder=REPORTS_FOLDER, cache=None):
+    """
+    A ThreadingHTTPServer serving ROUTES for `folder`; call
+    `serve_forever()` on it.
+    """
+    server = ThreadingHTTPServer((host, port), APIRequestHandler)
+    server.daemon_threads = True
+    server.folder = folder
+    server.cache = cache or ResponseCache()
+    return server
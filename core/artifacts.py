@@ -0,0 +1,49 @@
+"""
+Artifact Store
+--------------
+On-disk cache for structures derived from a dataset version (deltas,
+indexes, cubes, sketches, ...), stored next to the per-report cache as
+`<CACHE_FOLDER>/<name>/<version>.pkl`.
+"""
+
+import glob
+import os
+import pickle
+
+from config import CACHE_FOLDER
+from . import reporting
+
+
+def artifact_path(name, version, cache_folder=CACHE_FOLDER):
+    return os.path.join(cache_folder, name, f"{version}.pkl")
+
+
+def load_artifact(name, version, cache_folder=CACHE_FOLDER):
+    path = artifact_path(name, version, cache_folder)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def save_artifact(name, version, value, cache_folder=CACHE_FOLDER, keep_previous=False):
+    """
+    Atomically write `value` for `version`; older versions of `name` are
+    removed unless `keep_previous`.
+    """
+    path = artifact_path(name, version, cache_folder)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not keep_previous:
+            for stale in glob.glob(os.path.join(os.path.dirname(path), "*.pkl")):
+                if stale != path:
+                    os.remove(stale)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        reporting.warning(f"Could not persist {name}: {e}")
@@ -0,0 +1,258 @@
+"""
+MITRE ATT&CK Resolution
+-----------------------
+Resolves free-text TTP descriptions to ATT&CK technique and tactic IDs.
+Explicit IDs in the text ("Phishing (T1566.002)", "Malware (TA0002/TA0003)")
+are taken as-is; otherwise technique names and aliases from a local ATT&CK
+reference file in data/ are matched with one compiled pattern. Without a
+reference file only explicit IDs resolve.
+
+Resolutions are computed once per distinct string and kept in the artifact
+store per reference file version, so only new strings are matched.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from config import CACHE_FOLDER, ATTACK_DATA_PATH
+from .artifacts import load_artifact, save_artifact
+from .data_loader import stack_columns
+from .instrumentation import instrument
+
+RESOLUTION_ARTIFACT = "attack_resolution"
+MATCHER_VERSION = "v1"
+REFERENCE_FILES = ("enterprise-attack.json", "attack_techniques.csv")
+UNMAPPED = "Unmapped"
+
+TECHNIQUE_PATTERN = re.compile(r"\bT\d{4}(?:\.\d{3})?\b")
+TACTIC_PATTERN = re.compile(r"\bTA\d{4}\b")
+
+ENTERPRISE_TACTICS = {
+    "TA0043": ("reconnaissance", "Reconnaissance"),
+    "TA0042": ("resource-development", "Resource Development"),
+    "TA0001": ("initial-access", "Initial Access"),
+    "TA0002": ("execution", "Execution"),
+    "TA0003": ("persistence", "Persistence"),
+    "TA0004": ("privilege-escalation", "Privilege Escalation"),
+    "TA0005": ("defense-evasion", "Defense Evasion"),
+    "TA0006": ("credential-access", "Credential Access"),
+    "TA0007": ("discovery", "Discovery"),
+    "TA0008": ("lateral-movement", "Lateral Movement"),
+    "TA0009": ("collection", "Collection"),
+    "TA0011": ("command-and-control", "Command and Control"),
+    "TA0010": ("exfiltration", "Exfiltration"),
+    "TA0040": ("impact", "Impact"),
+}
+
+
+def find_reference_file(path=ATTACK_DATA_PATH, data_folder="data"):
+    if path:
+        return path if os.path.exists(path) else None
+    for name in REFERENCE_FILES:
+        candidate = os.path.join(data_folder, name)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def reference_version(path):
+    if path is None:
+        return f"{MATCHER_VERSION}-builtin"
+    stat = os.stat(path)
+    key = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{MATCHER_VERSION}-{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}"
+
+
+def _split(value):
+    if not isinstance(value, str):
+        return ()
+    return tuple(v.strip() for v in re.split(r"[;,|]", value) if v.strip())
+
+
+def _read_stix(path):
+    with open(path, encoding="utf-8") as f:
+        bundle = json.load(f)
+    tactics, techniques = {}, []
+    for obj in bundle.get("objects", []):
+        if obj.get("revoked") or obj.get("x_mitre_deprecated"):
+            continue
+        refs = [r for r in obj.get("external_references", []) if r.get("source_name") == "mitre-attack"]
+        if not refs:
+            continue
+        if obj.get("type") == "x-mitre-tactic":
+            tactics[obj.get("x_mitre_shortname")] = (refs[0]["external_id"], obj["name"])
+        elif obj.get("type") == "attack-pattern":
+            techniques.append({
+                "technique_id": refs[0]["external_id"],
+                "name": obj["name"],
+                "tactics": tuple(p["phase_name"] for p in obj.get("kill_chain_phases", [])
+                                 if p.get("kill_chain_name") == "mitre-attack"),
+                "aliases": tuple(obj.get("x_mitre_aliases", ())),
+            })
+    return pd.DataFrame(techniques, columns=["technique_id", "name", "tactics", "aliases"]), tactics
+
+
+def _read_csv(path):
+    """
+    CSV with columns technique_id, name and optionally tactics and aliases
+    (separated by ";"); tactics may be shortnames or TA IDs.
+    """
+    df = pd.read_csv(path, dtype=str)
+    return pd.DataFrame({
+        "technique_id": df["technique_id"].str.strip(),
+        "name": df["name"].str.strip(),
+        "tactics": df["tactics"].map(_split) if "tactics" in df else [()] * len(df),
+        "aliases": df["aliases"].map(_split) if "aliases" in df else [()] * len(df),
+    }), {}
+
+
+@functools.lru_cache(maxsize=4)
+def _load_reference(path, version):
+    techniques, tactics = (_read_stix(path) if path.lower().endswith(".json") else _read_csv(path))
+    return techniques, tactics
+
+
+def load_attack_reference(path=None):
+    """
+    (techniques, tactics): a frame of technique_id, name, tactics and
+    aliases, and {tactic shortname: (TA ID, name)}. Empty without a file.
+    """
+    path = path or find_reference_file()
+    tactics = {short: (tid, name) for tid, (short, name) in ENTERPRISE_TACTICS.items()}
+    if path is None:
+        return pd.DataFrame(columns=["technique_id", "name", "tactics", "aliases"]), tactics
+    techniques, file_tactics = _load_reference(path, reference_version(path))
+    return techniques, {**tactics, **file_tactics}
+
+
+class AttackMatcher:
+    """
+    Compiled technique-name/alias pattern plus technique -> tactic lookups
+    for one reference table.
+    """
+
+    def __init__(self, techniques, tactics):
+        self.names = dict(zip(techniques["technique_id"], techniques["name"]))
+        self.tactic_names = {tid: name for tid, name in tactics.values()}
+        self.technique_tactics = {}
+        for tid, phases in zip(techniques["technique_id"], techniques["tactics"]):
+            self.technique_tactics[tid] = tuple(
+                tactics[p][0] if p in tactics else p for p in phases)
+
+        by_name = {}
+        for tid, name, aliases in zip(techniques["technique_id"], techniques["name"], techniques["aliases"]):
+            for label in (name, *aliases):
+                by_name.setdefault(label.lower(), tid)
+        self.by_name = by_name
+        labels = sorted(by_name, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, labels)) + r")\b") if labels else None
+
+    def tactics_of(self, technique_id):
+        return self.technique_tactics.get(technique_id) or self.technique_tactics.get(technique_id.split(".")[0], ())
+
+    def resolve(self, text):
+        """
+        (technique IDs, tactic IDs) mentioned by or matched in `text`.
+        """
+        text = str(text)
+        techniques = list(dict.fromkeys(TECHNIQUE_PATTERN.findall(text)))
+        if not techniques and self.pattern is not None:
+            techniques = list(dict.fromkeys(self.by_name[m] for m in self.pattern.findall(text.lower())))
+        tactics = list(dict.fromkeys(TACTIC_PATTERN.findall(text)))
+        for tid in techniques:
+            tactics.extend(t for t in self.tactics_of(tid) if t not in tactics)
+        return tuple(techniques), tuple(tactics)
+
+    def technique_label(self, technique_id):
+        name = self.names.get(technique_id)
+        return f"{technique_id} {name}" if name else technique_id
+
+    def tactic_label(self, tactic_id):
+        name = self.tactic_names.get(tactic_id)
+        return f"{tactic_id} {name}" if name else tactic_id
+
+
+@functools.lru_cache(maxsize=4)
+def _matcher(path, version):
+    return AttackMatcher(*load_attack_reference(path))
+
+
+def get_matcher(path=None):
+    path = path or find_reference_file()
+    return _matcher(path, reference_version(path))
+
+
+@instrument(size_arg=None)
+def resolve_ttps(strings, path=None, cache_folder=CACHE_FOLDER):
+    """
+    {string: (technique IDs, tactic IDs)} for `strings`, matching only the
+    strings not already in the cached resolution for this reference file.
+    """
+    path = path or find_reference_file()
+    version = reference_version(path)
+    cached = (load_artifact(RESOLUTION_ARTIFACT, version, cache_folder) if cache_folder else None) or {}
+    missing = [s for s in dict.fromkeys(strings) if s not in cached]
+    if missing:
+        matcher = get_matcher(path)
+        cached.update({s: matcher.resolve(s) for s in missing})
+        if cache_folder:
+            save_artifact(RESOLUTION_ARTIFACT, version, cached, cache_folder)
+    return {s: cached[s] for s in strings}
+
+
+def build_ttp_groups(dataset):
+    """
+    Long (TTP, technique, tactic) label table for every distinct TTP string in
+    `dataset`: one row per technique/tactic combination, UNMAPPED where a
+    string resolves to none.
+    """
+    _, values = stack_columns(dataset.frame, dataset.ttp_columns)
+    strings = pd.unique(values.astype(object))
+    matcher = get_matcher()
+    rows = []
+    for ttp, (techniques, tactics) in resolve_ttps(strings).items():
+        for technique in techniques or (None,):
+            for tactic in tactics or (None,):
+                rows.append((
+                    ttp,
+                    matcher.technique_label(technique) if technique else UNMAPPED,
+                    matcher.tactic_label(tactic) if tactic else UNMAPPED,
+                ))
+    return pd.DataFrame(rows, columns=["TTP", "technique", "tactic"])
+
+
+def get_ttp_groups(dataset):
+    return dataset.artifact("attack_ttp_groups", build_ttp_groups,
+                            size_of=lambda df: df.memory_usage(deep=True).sum())
+
+
+def regroup_ttps(df, groups, level, ttp_col="TTP"):
+    """
+    `df` with `ttp_col` replaced by its ATT&CK `level` ("technique" or
+    "tactic") label. Strings covering several techniques or tactics
+    contribute one row to each.
+    """
+    mapping = groups[["TTP", level]].drop_duplicates().rename(columns={"TTP": ttp_col, level: "_group"})
+    regrouped = df.astype({ttp_col: object}).merge(mapping, how="left", on=ttp_col)
+    regrouped[ttp_col] = regrouped.pop("_group").fillna(UNMAPPED)
+    return regrouped
+
+
+def attack_counts(dataset, level):
+    """
+    Occurrences per report date of each ATT&CK `level` label.
+    """
+    rows, values = stack_columns(dataset.frame, dataset.ttp_columns)
+    dates = pd.Series(dataset.report_dates, dtype=object)
+    occurrences = pd.DataFrame({
+        "report_date": dates.iloc[dataset.row_report_ids()[rows]].values,
+        "TTP": values.astype(object).values,
+    })
+    regrouped = regroup_ttps(occurrences, get_ttp_groups(dataset), level)
+    return (regrouped.groupby(["report_date", "TTP"]).size().reset_index(name="count")
+            .rename(columns={"TTP": level}))
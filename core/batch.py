@@ -0,0 +1,165 @@
+"""
+Headless Batch Runner
+---------------------
+Loads the weekly reports and runs scoring, forecasting, NLP extraction,
+course recommendations and clustering without a Streamlit session, writing
+the results as JSON (or Parquet for the tabular outputs).
+"""
+
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import REPORTS_FOLDER
+from . import reporting
+from .attack import attack_counts
+from .data_loader import load_local_reports, flatten_ttp_values
+from .dataset import Dataset, report_fingerprint
+from .cooccurrence import get_cooccurrence, COOCCURRENCE_AVAILABLE
+from .cube import get_count_cube
+from .ml_models import ml_cluster_threat_patterns, ml_forecast_from_counts, ml_forecast_by_attack_type_from_counts
+from .nlp_intel import extract_nlp_intelligence
+from .recommendations import batch_recommendations
+from .risk_scoring import score_report
+
+
+def _json_default(value):
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating,)):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (pd.Timestamp,)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict(orient="records")
+    return str(value)
+
+
+def _all_countries(report, country_columns):
+    if not country_columns:
+        return []
+    values = pd.concat([report[col] for col in country_columns], ignore_index=True)
+    return sorted(values.dropna().unique().tolist())
+
+
+def run_analytics(dataset, selected_countries=None, periods=4):
+    """
+    Run every headless analytic over a `Dataset`.
+    Returns a dict of tabular results (DataFrames) and nested results (dicts).
+    """
+    items = dataset.frame
+    ttp_columns, country_columns = dataset.ttp_columns, dataset.country_columns
+    report_dates = dataset.report_dates
+    cube = get_count_cube(dataset)
+    daily_counts = cube.rollup(["report_date"], "rows")
+
+    scores = []
+    nlp = {}
+    recommendations = {
+        report_date.isoformat(): courses
+        for report_date, courses in batch_recommendations(dataset, "week", periods).items()
+    }
+    clusters = {}
+    for report_date, report in dataset.iter_reports():
+        key = report_date.isoformat()
+
+        metrics = score_report(report, ttp_columns, _all_countries(report, country_columns), selected_countries)
+        metrics.pop('unique_techniques')
+        scores.append({'report_date': key, **metrics})
+
+        nlp[key] = extract_nlp_intelligence(report, ttp_columns)
+
+        groups, info = ml_cluster_threat_patterns(flatten_ttp_values(report, ttp_columns))
+        clusters[key] = None if groups is None else {
+            str(cid): {'ttps': groups[cid], **info[cid]} for cid in groups
+        }
+
+    forecast, trend = ml_forecast_from_counts(daily_counts, periods=periods)
+    attack_forecasts = ml_forecast_by_attack_type_from_counts(
+        cube.rollup(["report_date", "TTP"], "ttps"), periods=periods) or {}
+    attack_rows = []
+    for ttp, fc in attack_forecasts.items():
+        for fdate, value, lower, upper in zip(fc['forecast_dates'], fc['forecast_values'],
+                                              fc['confidence_lower'], fc['confidence_upper']):
+            attack_rows.append({
+                'TTP': ttp,
+                'report_date': fdate,
+                'count': value,
+                'lower_bound': lower,
+                'upper_bound': upper,
+                'trend_direction': fc['trend_direction'],
+                'change_percentage': fc['change_percentage'],
+            })
+
+    return {
+        'tables': {
+            'scores': pd.DataFrame(scores),
+            'forecast': forecast if forecast is not None else pd.DataFrame(),
+            'attack_forecasts': pd.DataFrame(attack_rows),
+            'techniques': attack_counts(dataset, 'technique'),
+            'tactics': attack_counts(dataset, 'tactic'),
+            'ttp_pairs': (get_cooccurrence(dataset).top_pairs(k=100) if COOCCURRENCE_AVAILABLE
+                          else pd.DataFrame()),
+        },
+        'documents': {
+            'nlp': nlp,
+            'recommendations': recommendations,
+            'clusters': clusters,
+            'summary': {
+                'reports': len(report_dates),
+                'rows': len(items),
+                'first_report': report_dates[0].isoformat() if report_dates else None,
+                'last_report': report_dates[-1].isoformat() if report_dates else None,
+                'forecast_trend': trend,
+            },
+        },
+    }
+
+
+def check_output_format(fmt):
+    """
+    Raise ImportError when `fmt` needs a writer that is not installed, so a
+    run fails before it writes anything.
+    """
+    if fmt == "parquet" and not any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet")):
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow); use --format json without it")
+
+
+def write_results(results, output_dir, fmt="json"):
+    """
+    Write `run_analytics` output to `output_dir`. Tables go to Parquet when
+    `fmt` is "parquet"; nested documents are always JSON.
+    """
+    check_output_format(fmt)
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for name, table in results['tables'].items():
+        if fmt == "parquet":
+            path = os.path.join(output_dir, f"{name}.parquet")
+            table.to_parquet(path, index=False)
+        else:
+            path = os.path.join(output_dir, f"{name}.json")
+            table.to_json(path, orient="records", date_format="iso", indent=2)
+        written.append(path)
+    for name, document in results['documents'].items():
+        path = os.path.join(output_dir, f"{name}.json")
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2, default=_json_default)
+        written.append(path)
+    return written
+
+
+def run_batch(folder=REPORTS_FOLDER, output_dir="output", fmt="json", selected_countries=None, periods=4):
+    check_output_format(fmt)
+    dataset = Dataset(load_local_reports(folder), folder, report_fingerprint(folder))
+    results = run_analytics(dataset, selected_countries=selected_countries, periods=periods)
+    written = write_results(results, output_dir, fmt=fmt)
+    reporting.info(f"Wrote {len(written)} files to {output_dir}")
+    return written
@@ -0,0 +1,180 @@
+"""
+Country Bitmaps
+---------------
+Per-country bitsets of frame row positions, so any combination of the
+Geographic Filter resolves with bitwise OR / AND instead of `isin` over
+the exploded country columns. Bitsets are compressed by keeping only the
+non-zero 64-bit words (word index + word), which suits country columns
+where most countries appear in a small share of the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import stack_columns
+from .instrumentation import instrument
+
+WORD_BITS = 64
+
+
+def _pack(word_index, words):
+    """
+    Merge (word_index, words) pairs with repeated indices by OR-ing their
+    words; the result is sorted by word index.
+    """
+    if not len(word_index):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    order = np.argsort(word_index, kind="stable")
+    word_index, words = word_index[order], words[order]
+    unique, starts = np.unique(word_index, return_index=True)
+    return unique, np.bitwise_or.reduceat(words, starts)
+
+
+class RowBitmap:
+    """
+    Set of frame row positions stored as sorted non-zero 64-bit words.
+    """
+
+    def __init__(self, word_index=None, words=None):
+        self.word_index = np.empty(0, dtype=np.int64) if word_index is None else word_index
+        self.words = np.empty(0, dtype=np.uint64) if words is None else words
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return cls(*_pack(rows >> 6, np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64))))
+
+    @classmethod
+    def union(cls, bitmaps):
+        bitmaps = list(bitmaps)
+        if not bitmaps:
+            return cls()
+        return cls(*_pack(np.concatenate([b.word_index for b in bitmaps]),
+                          np.concatenate([b.words for b in bitmaps])))
+
+    @classmethod
+    def intersection(cls, bitmaps):
+        bitmaps = sorted(bitmaps, key=len)
+        if not bitmaps:
+            return cls()
+        result = bitmaps[0]
+        for other in bitmaps[1:]:
+            result = result & other
+        return result
+
+    def __or__(self, other):
+        return RowBitmap.union([self, other])
+
+    def __and__(self, other):
+        common, a, b = np.intersect1d(self.word_index, other.word_index, assume_unique=True, return_indices=True)
+        words = self.words[a] & other.words[b]
+        keep = words != 0
+        return RowBitmap(common[keep], words[keep])
+
+    def __len__(self):
+        return len(self.words)
+
+    def count(self):
+        if hasattr(np, "bitwise_count"):  # numpy >= 2
+            return int(np.bitwise_count(self.words).sum())
+        return int(np.unpackbits(self.words.astype("<u8").view(np.uint8)).sum(dtype=np.int64))
+
+    def restrict(self, first, stop):
+        """
+        The rows of this bitmap within [first, stop).
+        """
+        if stop <= first:
+            return RowBitmap()
+        lo = np.searchsorted(self.word_index, first >> 6, side="left")
+        hi = np.searchsorted(self.word_index, (stop - 1) >> 6, side="right")
+        word_index, words = self.word_index[lo:hi], self.words[lo:hi].copy()
+        if len(words):
+            if word_index[0] == first >> 6:
+                words[0] &= ~np.uint64(0) << np.uint64(first & 63)
+            if word_index[-1] == (stop - 1) >> 6:
+                words[-1] &= ~np.uint64(0) >> np.uint64(63 - ((stop - 1) & 63))
+        keep = words != 0
+        return RowBitmap(word_index[keep], words[keep])
+
+    def rows(self):
+        """
+        Sorted row positions.
+        """
+        bits = np.unpackbits(self.words.astype("<u8").view(np.uint8), bitorder="little").reshape(-1, WORD_BITS)
+        word, bit = np.nonzero(bits)
+        return self.word_index[word] * WORD_BITS + bit
+
+    def nbytes(self):
+        return self.word_index.nbytes + self.words.nbytes
+
+
+class CountryBitmapIndex:
+    """
+    RowBitmap of every country label in the country columns of one dataset
+    version.
+    """
+
+    def __init__(self, labels, bitmaps, n_rows):
+        self.labels = labels
+        self.bitmaps = bitmaps
+        self.n_rows = n_rows
+
+    def _selected(self, countries):
+        return [self.bitmaps[c] for c in dict.fromkeys(countries) if c in self.bitmaps]
+
+    def any(self, countries):
+        """
+        Rows mentioning at least one of `countries`.
+        """
+        return RowBitmap.union(self._selected(countries))
+
+    def all(self, countries):
+        """
+        Rows mentioning every one of `countries`.
+        """
+        countries = list(dict.fromkeys(countries))
+        selected = self._selected(countries)
+        if not countries or len(selected) < len(countries):
+            return RowBitmap()
+        return RowBitmap.intersection(selected)
+
+    def countries_in(self, first=0, stop=None):
+        """
+        Sorted labels of the countries mentioned in rows [first, stop).
+        """
+        stop = self.n_rows if stop is None else stop
+        if stop <= first:
+            return []
+        return [c for c in self.labels if len(self.bitmaps[c].restrict(first, stop))]
+
+    def nbytes(self):
+        return sum(b.nbytes() for b in self.bitmaps.values())
+
+
+@instrument(size_arg=None)
+def build_country_bitmaps(dataset):
+    """
+    Country bitmap index over `dataset.frame`, built in one vectorized pass.
+    """
+    rows, values = stack_columns(dataset.frame, dataset.country_columns)
+    codes, uniques = pd.factorize(values)
+    rows = rows.astype(np.int64)
+    word_index = rows >> 6
+    bits = np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64))
+
+    # Group (country, word) pairs and OR the bits that share a word.
+    stride = len(dataset.frame) // WORD_BITS + 1
+    keys, words = _pack(codes.astype(np.int64) * stride + word_index, bits)
+    owners, word_index = np.divmod(keys, stride)
+    bounds = np.searchsorted(owners, np.arange(len(uniques) + 1))
+
+    bitmaps = {
+        label: RowBitmap(word_index[bounds[code]:bounds[code + 1]], words[bounds[code]:bounds[code + 1]])
+        for code, label in enumerate(uniques)
+    }
+    return CountryBitmapIndex(sorted(bitmaps), bitmaps, len(dataset.frame))
+
+
+def get_country_bitmaps(dataset):
+    return dataset.artifact("country_bitmaps", build_country_bitmaps, size_of=CountryBitmapIndex.nbytes)
+
@@ -0,0 +1,189 @@
+"""
+TTP Co-occurrence
+-----------------
+Which techniques are reported together in the same incident row. Each
+report contributes the partial product XᵀX of its binary row × TTP
+incidence matrix X; the co-occurrence matrix of any date range is the sum
+of its reports' partials, from which pair counts, lift and PMI follow.
+
+Partials are keyed by a content hash of the report's TTP columns and kept
+in the artifact store, so a new report only multiplies its own rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER
+from .artifacts import load_artifact, save_artifact
+from .data_loader import stack_columns
+from .dataset import report_signature
+from .instrumentation import instrument, stage
+
+try:
+    from scipy import sparse
+    COOCCURRENCE_AVAILABLE = True
+except Exception:
+    COOCCURRENCE_AVAILABLE = False
+
+SEGMENTS_ARTIFACT = "cooccurrence_segments"
+SEGMENTS_VERSION = "v1"
+RANKINGS = ("count", "lift", "pmi")
+
+
+def incidence_matrix(report, ttp_columns):
+    """
+    (X, labels): binary CSR matrix of rows × distinct TTPs of `report`;
+    a TTP listed twice in one row counts once.
+    """
+    rows, values = stack_columns(report, ttp_columns)
+    codes, labels = pd.factorize(values)
+    X = sparse.csr_matrix((np.ones(len(codes), dtype=np.int32), (rows, codes)),
+                          shape=(len(report), len(labels)))
+    X.sum_duplicates()
+    X.data[:] = 1
+    return X, np.asarray(labels, dtype=object)
+
+
+def build_segment(report, ttp_columns):
+    """
+    Upper triangle (diagonal included) of XᵀX for one report as COO arrays
+    over the report's own labels, plus the number of rows with any TTP.
+    """
+    X, labels = incidence_matrix(report, ttp_columns)
+    product = (X.T @ X).tocoo()
+    upper = product.row <= product.col
+    return {
+        "labels": labels,
+        "row": product.row[upper].astype(np.int32),
+        "col": product.col[upper].astype(np.int32),
+        "count": product.data[upper].astype(np.int32),
+        "rows": int((X.getnnz(axis=1) > 0).sum()),
+    }
+
+
+class CooccurrenceIndex:
+    """
+    Per-report upper-triangular co-occurrence partials over one shared TTP
+    vocabulary (`labels`), aligned with `report_dates`.
+    """
+
+    def __init__(self, report_dates, labels, partials, rows):
+        self.report_dates = list(report_dates)
+        self.labels = labels
+        self.partials = partials
+        self.rows = rows
+
+    def nbytes(self):
+        return self.rows.nbytes + sum(p.data.nbytes + p.indices.nbytes + p.indptr.nbytes for p in self.partials)
+
+    def _date_codes(self, start, end):
+        keys = np.array(self.report_dates, dtype="datetime64[D]")
+        lo = 0 if start is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(start).date(), "D"), side="left")
+        hi = len(keys) if end is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(end).date(), "D"), side="right")
+        return lo, hi
+
+    def matrix(self, start=None, end=None):
+        """
+        (C, n_rows): symmetric TTP × TTP co-occurrence counts of the reports
+        dated within [start, end] (the diagonal holds per-TTP row counts)
+        and the number of rows with any TTP.
+        """
+        lo, hi = self._date_codes(start, end)
+        upper = sparse.csr_matrix((len(self.labels), len(self.labels)), dtype=np.int64)
+        for partial in self.partials[lo:hi]:
+            upper = upper + partial
+        full = upper + sparse.triu(upper, k=1).T
+        return full.tocsr(), int(self.rows[lo:hi].sum())
+
+    def top_pairs(self, start=None, end=None, k=20, by="count", min_count=2):
+        """
+        The `k` TTP pairs of [start, end] seen together in at least
+        `min_count` rows, ranked by `by` ("count", "lift" or "pmi"), with
+        columns TTP_a, TTP_b, count, support, lift and pmi.
+        """
+        if by not in RANKINGS:
+            raise ValueError(f"Unknown ranking '{by}', expected one of {RANKINGS}")
+        C, n_rows = self.matrix(start, end)
+        totals = C.diagonal()
+        pairs = sparse.triu(C, k=1).tocoo()
+        keep = pairs.data >= min_count
+        a, b, count = pairs.row[keep], pairs.col[keep], pairs.data[keep]
+        lift = n_rows * count / (totals[a] * totals[b]) if n_rows else np.zeros(len(count))
+        result = pd.DataFrame({
+            "TTP_a": self.labels[a],
+            "TTP_b": self.labels[b],
+            "count": count,
+            "support": count / n_rows if n_rows else np.zeros(len(count)),
+            "lift": lift,
+            "pmi": np.log2(lift, out=np.zeros(len(lift)), where=lift > 0),
+        })
+        order = np.lexsort((-result["count"].values, -result[by].values))
+        return result.iloc[order[:k]].reset_index(drop=True)
+
+    def pair_frame(self, start=None, end=None, top=15):
+        """
+        Long (TTP_a, TTP_b, count) frame of the pairwise counts among the
+        `top` most frequent TTPs of [start, end], both orientations, for a
+        heatmap.
+        """
+        C, _ = self.matrix(start, end)
+        totals = C.diagonal()
+        chosen = np.argsort(-totals, kind="stable")[:top]
+        chosen = chosen[totals[chosen] > 0]
+        block = C[chosen][:, chosen].tocoo()
+        off_diagonal = block.row != block.col
+        return pd.DataFrame({
+            "TTP_a": self.labels[chosen[block.row[off_diagonal]]],
+            "TTP_b": self.labels[chosen[block.col[off_diagonal]]],
+            "count": block.data[off_diagonal],
+        })
+
+    def pair_trend(self, ttp_a, ttp_b):
+        """
+        Rows mentioning both `ttp_a` and `ttp_b`, per report date.
+        """
+        position = {label: i for i, label in enumerate(self.labels)}
+        if ttp_a not in position or ttp_b not in position:
+            counts = np.zeros(len(self.report_dates), dtype=np.int64)
+        else:
+            i, j = sorted((position[ttp_a], position[ttp_b]))
+            counts = np.array([partial[i, j] for partial in self.partials], dtype=np.int64)
+        return pd.DataFrame({"report_date": self.report_dates, "count": counts})
+
+
+@instrument(size_arg=None)
+def build_cooccurrence(dataset, cache_folder=CACHE_FOLDER):
+    """
+    Co-occurrence index for `dataset`, reusing stored partials of unchanged
+    reports.
+    """
+    stored = load_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, cache_folder) or {}
+    segments, current = [], {}
+    for report_date, start, stop in dataset.date_offsets():
+        report = dataset.frame.iloc[start:stop]
+        signature = report_signature(report, dataset.ttp_columns)
+        segment = stored.get(signature)
+        if segment is None:
+            with stage("cooccurrence.build_segment", size=len(report)):
+                segment = build_segment(report, dataset.ttp_columns)
+        current[signature] = segment
+        segments.append(segment)
+    if current.keys() != stored.keys():
+        save_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, current, cache_folder)
+
+    labels = np.asarray(pd.Index(np.concatenate([s["labels"] for s in segments] or [[]]))
+                        .unique().sort_values(), dtype=object)
+    size = len(labels)
+    partials = []
+    for segment in segments:
+        remap = pd.Index(labels).get_indexer(segment["labels"])
+        i, j = remap[segment["row"]], remap[segment["col"]]
+        # Remapping can reorder a pair's labels; keep the upper triangle.
+        partials.append(sparse.csr_matrix(
+            (segment["count"].astype(np.int64), (np.minimum(i, j), np.maximum(i, j))), shape=(size, size)))
+    rows = np.array([s["rows"] for s in segments], dtype=np.int64)
+    return CooccurrenceIndex(dataset.report_dates, labels, partials, rows)
+
+
+def get_cooccurrence(dataset):
+    return dataset.artifact("ttp_cooccurrence", build_cooccurrence, size_of=CooccurrenceIndex.nbytes)
@@ -0,0 +1,212 @@
+"""
+Count Cube
+----------
+Sparse counts over (report_date, TTP, country, source), so charts, risk
+inputs and forecasts aggregate pre-counted cells instead of re-melting and
+grouping row-level data. Four measures are kept:
+
+- "pairs": TTP × country pairings per report row (what the Dashboard
+  charts count), over report_date, TTP, country and source
+- "ttps": TTP occurrences, over report_date, TTP and source
+- "countries": country occurrences, over report_date, country and source
+- "rows": report rows, over report_date and source
+
+The cube is assembled from per-report segments keyed by a content hash of
+the report and kept in the artifact store, so a new report only counts its
+own rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER
+from .artifacts import load_artifact, save_artifact
+from .data_loader import stack_columns
+from .dataset import report_signature
+from .instrumentation import instrument, stage
+
+SEGMENTS_ARTIFACT = "cube_segments"
+SEGMENTS_VERSION = "v1"
+UNKNOWN_SOURCE = "(unknown)"
+MEASURES = {
+    "pairs": ("report_date", "TTP", "country", "source"),
+    "ttps": ("report_date", "TTP", "source"),
+    "countries": ("report_date", "country", "source"),
+    "rows": ("report_date", "source"),
+}
+LABELLED = ("TTP", "country", "source")
+
+
+def _aggregate(codes, sizes):
+    """
+    Unique code tuples of `codes` (parallel arrays) with their counts.
+    """
+    if not len(codes[0]):
+        return [np.empty(0, dtype=np.int32) for _ in codes], np.empty(0, dtype=np.int32)
+    keys = np.ravel_multi_index(codes, sizes)
+    unique, counts = np.unique(keys, return_counts=True)
+    return [c.astype(np.int32) for c in np.unravel_index(unique, sizes)], counts.astype(np.int32)
+
+
+def _factorize(values):
+    codes, uniques = pd.factorize(values)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def build_segment(report, ttp_columns, country_columns):
+    """
+    Counts of one report: {"labels": {dimension: labels}, measure:
+    {dimension: codes, ..., "count": counts}} without the report_date axis.
+    """
+    n = len(report)
+    sources = report["source"] if "source" in report.columns else pd.Series([np.nan] * n)
+    s_codes, s_labels = _factorize(sources.astype(object).fillna(UNKNOWN_SOURCE).values)
+    t_rows, ttps = stack_columns(report, ttp_columns)
+    t_codes, t_labels = _factorize(ttps)
+    c_rows, countries = stack_columns(report, country_columns)
+    c_codes, c_labels = _factorize(countries)
+
+    # Pair every TTP occurrence with every country occurrence of its row.
+    per_row = np.bincount(c_rows, minlength=n)
+    c_order = np.argsort(c_rows, kind="stable")
+    c_start = np.concatenate(([0], np.cumsum(per_row)[:-1]))
+    repeats = per_row[t_rows]
+    pair_t = np.repeat(np.arange(len(t_rows)), repeats)
+    within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    pair_c = c_order[c_start[t_rows[pair_t]] + within]
+
+    ns, nt, nc = max(len(s_labels), 1), max(len(t_labels), 1), max(len(c_labels), 1)
+    segment = {"labels": {"TTP": t_labels, "country": c_labels, "source": s_labels}}
+    for measure, codes, sizes in (
+        ("pairs", [t_codes[pair_t], c_codes[pair_c], s_codes[t_rows[pair_t]]], (nt, nc, ns)),
+        ("ttps", [t_codes, s_codes[t_rows]], (nt, ns)),
+        ("countries", [c_codes, s_codes[c_rows]], (nc, ns)),
+        ("rows", [s_codes], (ns,)),
+    ):
+        cells, counts = _aggregate(codes, sizes)
+        segment[measure] = dict(zip(MEASURES[measure][1:], cells), count=counts)
+    return segment
+
+
+class CountCube:
+    """
+    Sparse cells of every measure: parallel int32 code arrays per dimension
+    plus a count array; `labels` decode TTP, country and source codes and
+    `report_dates` decode report_date codes.
+    """
+
+    def __init__(self, report_dates, labels, facts):
+        self.report_dates = list(report_dates)
+        self.labels = labels
+        self.facts = facts
+
+    def nbytes(self):
+        return sum(a.nbytes for cells in self.facts.values() for a in cells.values())
+
+    def _date_codes(self, start, end):
+        keys = np.array(self.report_dates, dtype="datetime64[D]")
+        lo = 0 if start is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(start).date(), "D"), side="left")
+        hi = len(keys) if end is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(end).date(), "D"), side="right")
+        return lo, hi
+
+    def dice(self, start=None, end=None, where=None):
+        """
+        Sub-cube of the reports dated within [start, end] and the cells whose
+        labels are in `where[dimension]` (for measures that have that
+        dimension; the others are dropped).
+        """
+        lo, hi = self._date_codes(start, end)
+        where = {dim: values for dim, values in (where or {}).items() if values is not None}
+        keep_codes = {dim: np.flatnonzero(pd.Index(self.labels[dim]).isin(list(values)))
+                      for dim, values in where.items()}
+        facts = {}
+        for measure, cells in self.facts.items():
+            if not set(where) <= set(MEASURES[measure]):
+                continue
+            mask = (cells["report_date"] >= lo) & (cells["report_date"] < hi)
+            for dim, codes in keep_codes.items():
+                mask &= np.isin(cells[dim], codes)
+            facts[measure] = {dim: values[mask] for dim, values in cells.items()}
+        return CountCube(self.report_dates, self.labels, facts)
+
+    def rollup(self, by, measure="pairs", start=None, end=None, where=None):
+        """
+        Counts of `measure` grouped by the dimensions in `by` (any of
+        report_date, TTP, country, source), largest first, after dicing to
+        [start, end] and `where`. An empty `by` gives the grand total.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        cube = self.dice(start, end, where) if (start, end, where) != (None, None, None) else self
+        missing = (set(by) | set(where or {})) - set(MEASURES[measure])
+        if missing:
+            raise ValueError(f"Measure '{measure}' has no dimension {sorted(missing)}")
+        cells = cube.facts[measure]
+        if not by:
+            return int(cells["count"].sum())
+        sizes = [len(self.report_dates) if dim == "report_date" else max(len(self.labels[dim]), 1) for dim in by]
+        grouped, counts = _aggregate_weighted([cells[dim] for dim in by], sizes, cells["count"])
+        result = pd.DataFrame({
+            dim: (pd.to_datetime(np.array(self.report_dates, dtype="datetime64[D]")[codes]) if dim == "report_date"
+                  else self.labels[dim][codes])
+            for dim, codes in zip(by, grouped)
+        })
+        result["count"] = counts
+        order = np.lexsort((np.arange(len(result)), -counts))
+        return result.iloc[order].reset_index(drop=True)
+
+    def top(self, dimension, n=10, measure="pairs", start=None, end=None, where=None):
+        return self.rollup([dimension], measure, start, end, where).head(n)
+
+
+def _aggregate_weighted(codes, sizes, weights):
+    keys = np.ravel_multi_index(codes, sizes)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.int64)
+    return list(np.unravel_index(unique, sizes)), counts
+
+
+@instrument(size_arg=None)
+def build_count_cube(dataset, cache_folder=CACHE_FOLDER):
+    """
+    Cube for `dataset`, reusing stored segments of unchanged reports.
+    """
+    columns = dataset.ttp_columns + dataset.country_columns + (["source"] if "source" in dataset.frame else [])
+    stored = load_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, cache_folder) or {}
+    segments, current = [], {}
+    for report_date, start, stop in dataset.date_offsets():
+        report = dataset.frame.iloc[start:stop]
+        signature = report_signature(report, columns)
+        segment = stored.get(signature)
+        if segment is None:
+            with stage("cube.build_segment", size=len(report)):
+                segment = build_segment(report, dataset.ttp_columns, dataset.country_columns)
+        current[signature] = segment
+        segments.append(segment)
+    if current.keys() != stored.keys():
+        save_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, current, cache_folder)
+
+    labels = {
+        dim: np.asarray(pd.Index(np.concatenate([s["labels"][dim] for s in segments] or [[]]))
+                        .unique().sort_values(), dtype=object)
+        for dim in LABELLED
+    }
+    facts = {}
+    for measure, dims in MEASURES.items():
+        parts = {dim: [] for dim in dims}
+        parts["count"] = []
+        for date_code, segment in enumerate(segments):
+            cells = segment[measure]
+            parts["report_date"].append(np.full(len(cells["count"]), date_code, dtype=np.int32))
+            for dim in dims[1:]:
+                remap = pd.Index(labels[dim]).get_indexer(segment["labels"][dim]).astype(np.int32)
+                parts[dim].append(remap[cells[dim]])
+            parts["count"].append(cells["count"])
+        facts[measure] = {
+            dim: np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int32)
+            for dim, arrays in parts.items()
+        }
+    return CountCube(dataset.report_dates, labels, facts)
+
+
+def get_count_cube(dataset):
+    return dataset.artifact("count_cube", build_count_cube, size_of=CountCube.nbytes)
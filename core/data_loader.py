@@ -1,9 +1,20 @@
 import os
 import glob
+import hashlib
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
-import streamlit as st
 import requests
-from config import REPORTS_FOLDER, API_URL
+from . import reporting
+from .reporting import logger
+from .artifacts import load_artifact, save_artifact
+from .instrumentation import instrument, stage
+from .similarity import canonicalize_ttps
+from config import (REPORTS_FOLDER, API_URL, CACHE_FOLDER, CSV_CHUNKSIZE, EXCEL_STREAMING, REPORT_COLUMNS,
+                    LOAD_OPTIMIZED, DEDUP_MODE, DEDUP_TEXT_COLUMNS, TTP_CANONICALIZE, TTP_SIMILARITY_THRESHOLD)
 
 def fetch_reports_from_github(local_folder=REPORTS_FOLDER):
     os.makedirs(local_folder, exist_ok=True)
@@ -14,7 +25,7 @@ def fetch_reports_from_github(local_folder=REPORTS_FOLDER):
         r.raise_for_status()
         files = r.json()
     except Exception as e:
-        st.error(f"Failed to list files from GitHub: {e}")
+        reporting.error(f"Failed to list files from GitHub: {e}")
         return []
 
     downloaded = []
@@ -29,44 +40,540 @@ def fetch_reports_from_github(local_folder=REPORTS_FOLDER):
                     fr.raise_for_status()
                     with open(local_path, "wb") as f:
                         f.write(fr.content)
-                    st.sidebar.success(f"Fetched {name}")
+                    reporting.success(f"Fetched {name}", sidebar=True)
                 except Exception as e:
-                    st.sidebar.warning(f"Failed {name}: {e}")
+                    reporting.warning(f"Failed {name}: {e}", sidebar=True)
                     continue
             downloaded.append(local_path)
     return downloaded
 
-def load_local_reports(folder=REPORTS_FOLDER):
-    files = glob.glob(os.path.join(folder, "ttp_reports_*.*"))
-    all_data = []
+REPORT_CACHE_VERSION = 3
+REQUIRED_COLUMNS = REPORT_COLUMNS
+REQUIRED_PREFIXES = ("ttp_desc", "country_")
+REPORT_SHEET = "Human_Attacks"
+# pandas' default na_values, so both Excel readers agree on missing cells.
+EXCEL_NA_VALUES = frozenset({"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+                             "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"})
+
+def is_report_column(name, columns=REQUIRED_COLUMNS):
+    """
+    Whether `name` is kept when projecting to `columns` (None keeps all).
+    """
+    return columns is None or name in columns or str(name).lower().startswith(REQUIRED_PREFIXES)
+
+def _reader_columns():
+    """
+    Columns `read_report_file` keeps: with LOAD_OPTIMIZED the report and
+    dedup text columns, otherwise every column (None).
+    """
+    return REQUIRED_COLUMNS + DEDUP_TEXT_COLUMNS if LOAD_OPTIMIZED else None
+
+def _reader_config_key():
+    """
+    Short hash of the settings that change what `read_report_file` returns,
+    so cached reports parsed under other settings are not reused.
+    """
+    key = repr((_reader_columns(), EXCEL_STREAMING))
+    return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+def report_date_from_path(path):
+    date_str = os.path.basename(path).replace("ttp_reports_", "").split(".")[0]
+    return pd.to_datetime(date_str, format="%d%m%y", errors="coerce")
+
+def _report_sort_key(path):
+    date = report_date_from_path(path)
+    return (pd.Timestamp.max if pd.isna(date) else date, path)
+
+def _report_cache_path(path, cache_folder):
+    stat = os.stat(path)
+    name = (f"{os.path.basename(path)}.{stat.st_size}.{stat.st_mtime_ns}"
+            f".v{REPORT_CACHE_VERSION}.{_reader_config_key()}.pkl")
+    return os.path.join(cache_folder, "reports", name)
+
+def read_cached_report(path, cache_folder=CACHE_FOLDER):
+    """
+    Parsed frame for `path` from the report cache, or None when the file
+    changed since it was cached (the key includes size and mtime) or was
+    cached under other reader settings.
+    """
+    cache_path = _report_cache_path(path, cache_folder)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with stage("data_loader.read_cache"):
+            return pd.read_pickle(cache_path)
+    except Exception:
+        return None
+
+def write_cached_report(path, df, cache_folder=CACHE_FOLDER):
+    cache_path = _report_cache_path(path, cache_folder)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        for stale in glob.glob(os.path.join(os.path.dirname(cache_path), os.path.basename(path) + ".*.pkl")):
+            os.remove(stale)
+        tmp_path = cache_path + ".tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        reporting.warning(f"Could not cache {path}: {e}")
+
+class _CategoricalBuilder:
+    """
+    Categorical column assembled chunk by chunk: each chunk's codes are
+    remapped onto the categories seen so far (new ones appended, as
+    `union_categoricals` orders them), so only codes and distinct values are
+    kept between chunks.
+    """
+
+    def __init__(self):
+        self.categories = pd.Index([], dtype=object)
+        self.codes = []
+
+    def add(self, values):
+        chunk = pd.Categorical(values)
+        position = self.categories.get_indexer(chunk.categories)
+        if (position < 0).any():
+            self.categories = self.categories.append(chunk.categories[position < 0])
+            position = self.categories.get_indexer(chunk.categories)
+        # Missing values (code -1) pick the trailing -1.
+        self.codes.append(np.append(position, -1).astype(np.int32)[chunk.codes])
+
+    def build(self):
+        codes = np.concatenate(self.codes) if self.codes else np.array([], dtype=np.int32)
+        return pd.Categorical.from_codes(codes, categories=self.categories)
+
+@instrument(size_arg=None)
+def read_csv_report(path, chunksize=CSV_CHUNKSIZE, columns=REQUIRED_COLUMNS):
+    """
+    Stream a CSV report in `chunksize` rows, keeping only report columns
+    (every column when `columns` is None), mapping the "None" sentinel to NaN
+    and merging each chunk into shared categoricals as it arrives, so peak
+    memory tracks one chunk plus the codes and distinct values read so far
+    rather than the file's text.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in header if is_report_column(c, columns)]
+    builders = {col: _CategoricalBuilder() for col in usecols}
+    with pd.read_csv(path, usecols=usecols, dtype={c: str for c in usecols},
+                     na_values=["None"], chunksize=chunksize) as reader:
+        for chunk in reader:
+            for col in usecols:
+                builders[col].add(chunk[col])
+    return pd.DataFrame({col: builders[col].build() for col in usecols})
+
+XLSX_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+CELL_REF = re.compile(r"([A-Z]+)(\d+)$")
+
+class UnsupportedLayout(Exception):
+    """A workbook the streaming Excel reader does not handle."""
+
+def _xlsx_sheet_part(archive, sheet):
+    """
+    Zip member of the worksheet named `sheet` (else the first sheet), read
+    from the workbook and its relationships only.
+    """
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    sheets = [(s.get("name"), s.get(f"{XLSX_REL}id")) for s in workbook.iter(f"{XLSX_MAIN}sheet")]
+    if not sheets:
+        raise UnsupportedLayout("no sheets")
+    rel_id = next((rid for name, rid in sheets if name == sheet), sheets[0][1])
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    target = next((r.get("Target") for r in rels if r.get("Id") == rel_id), None)
+    if target is None:
+        raise UnsupportedLayout("sheet relationship missing")
+    return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+def _xlsx_text(element):
+    """Plain text of a shared or inline string item (rich-text runs joined)."""
+    direct = element.find(f"{XLSX_MAIN}t")
+    if direct is not None:
+        return direct.text or ""
+    return "".join(run.findtext(f"{XLSX_MAIN}t") or "" for run in element.iter(f"{XLSX_MAIN}r"))
+
+def _xlsx_shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    for _, element in ET.iterparse(archive.open("xl/sharedStrings.xml")):
+        if element.tag == f"{XLSX_MAIN}si":
+            strings.append(_xlsx_text(element))
+            element.clear()
+    return strings
+
+def _column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+def _xlsx_rows(archive, part):
+    """
+    Yield (row number, {column index: cell element}) for each worksheet row
+    holding at least one value; row numbers start at 1.
+    """
+    for _, element in ET.iterparse(archive.open(part)):
+        if element.tag != f"{XLSX_MAIN}row":
+            continue
+        cells, number = {}, None
+        for cell in element.iter(f"{XLSX_MAIN}c"):
+            match = CELL_REF.match(cell.get("r", ""))
+            if match is None:
+                raise UnsupportedLayout("cell without a reference")
+            if cell.find(f"{XLSX_MAIN}v") is not None or cell.find(f"{XLSX_MAIN}is") is not None:
+                cells[_column_index(match.group(1))] = cell
+                number = int(match.group(2))
+        if cells:
+            yield number, cells
+        element.clear()
+
+def _xlsx_string(cell, shared):
+    """
+    Text value of a cell; anything that is not a string cell is unsupported
+    so typed columns go through pandas' conversions instead.
+    """
+    kind = cell.get("t")
+    if kind == "s":
+        return shared[int(cell.findtext(f"{XLSX_MAIN}v"))]
+    if kind == "inlineStr":
+        return _xlsx_text(cell.find(f"{XLSX_MAIN}is"))
+    if kind == "str":
+        return cell.findtext(f"{XLSX_MAIN}v") or ""
+    raise UnsupportedLayout(f"non-text cell {cell.get('r')}")
+
+@instrument(size_arg=None)
+def read_excel_report(path, columns=REQUIRED_COLUMNS, sheet=REPORT_SHEET):
+    """
+    Stream the `sheet` (else the first) worksheet of an .xlsx report straight
+    from the zip archive: only the workbook index, shared strings and that
+    sheet are read, row by row, and only report columns are decoded (every
+    column when `columns` is None). Raises
+    UnsupportedLayout for sheets that are not a header row of unique names
+    over text cells, so callers can fall back to `pd.read_excel`.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared = _xlsx_shared_strings(archive)
+        rows = _xlsx_rows(archive, _xlsx_sheet_part(archive, sheet))
+        number, header = next(rows, (None, None))
+        if number != 1:
+            raise UnsupportedLayout("no header in the first row")
+        names = {i: _xlsx_string(cell, shared) for i, cell in header.items()}
+        if len(set(names.values())) != len(names):
+            raise UnsupportedLayout("duplicate column names")
+        positions = [i for i in sorted(names) if is_report_column(names[i], columns)]
+        if not positions:
+            raise UnsupportedLayout("no report columns")
+        values = {i: [] for i in positions}
+        expected = 2
+        for number, cells in rows:
+            # Blank rows between data rows stay as empty rows, as in pd.read_excel.
+            for i in positions:
+                values[i].extend([None] * (number - expected))
+            expected = number + 1
+            for i in positions:
+                cell = cells.get(i)
+                value = None if cell is None else _xlsx_string(cell, shared)
+                values[i].append(None if value in EXCEL_NA_VALUES else value)
+    return pd.DataFrame({names[i]: pd.Series(values[i], dtype=object) for i in positions})
+
+def read_excel_report_pandas(path, sheet=REPORT_SHEET):
+    xls = pd.ExcelFile(path)
+    sheet_name = sheet if sheet in xls.sheet_names else xls.sheet_names[0]
+    return pd.read_excel(xls, sheet_name=sheet_name)
+
+def read_report_file(path):
+    if path.lower().endswith(".xlsx"):
+        with stage("data_loader.read_excel"):
+            df = None
+            if EXCEL_STREAMING:
+                try:
+                    df = read_excel_report(path, columns=_reader_columns())
+                except (UnsupportedLayout, KeyError, ValueError, IndexError, ET.ParseError) as e:
+                    logger.info(f"Streaming Excel reader skipped {path} ({e}); using pandas")
+            if df is None:
+                df = read_excel_report_pandas(path)
+    else:
+        with stage("data_loader.read_csv"):
+            df = read_csv_report(path, columns=_reader_columns())
+    df["report_date"] = report_date_from_path(path)
+    return df
+
+def _category_groups(columns):
+    ttp_columns, country_columns = get_ttp_and_country_columns(pd.DataFrame(columns=columns))
+    grouped = set(ttp_columns) | set(country_columns) | {"report_date"}
+    return [g for g in (ttp_columns, country_columns) if g] + [[c] for c in columns if c not in grouped]
+
+def frame_memory(df):
+    """
+    Deep memory footprint, counting categories shared between columns once.
+    """
+    total = int(df.index.memory_usage(deep=True))
+    seen = set()
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            total += series.cat.codes.nbytes
+            if series.dtype not in seen:
+                seen.add(series.dtype)
+                total += int(series.dtype.categories.memory_usage(deep=True))
+        else:
+            total += int(series.memory_usage(index=False, deep=True))
+    return total
+
+def _group_sample(frames, group):
+    """
+    First column of `group` holding any value, across `frames`; columns a
+    report lacks are all-NaN floats after alignment and say nothing about
+    the type. None when the whole group is empty.
+    """
+    for df in frames:
+        for col in group:
+            if df[col].notna().any():
+                return df[col]
+    return None
+
+@instrument()
+def optimize_report_frames(frames, columns=REQUIRED_COLUMNS):
+    """
+    Project report frames to `columns` plus the ttp_desc*/country_* and
+    report_date columns, align them, and convert text columns to categoricals
+    whose categories are shared across reports (and across all TTP / all
+    country columns) so concatenation stays categorical instead of falling
+    back to object. Numeric columns are downcast.
+    """
+    keep = {"report_date", "is_duplicate"}
+    projected = [df[[c for c in df.columns if is_report_column(c, columns) or c in keep]] for df in frames]
+    all_columns = list(dict.fromkeys(c for df in projected for c in df.columns))
+    projected = [df.reindex(columns=all_columns) for df in projected]
+
+    dtypes = {}
+    for group in _category_groups(all_columns):
+        sample = _group_sample(projected, group)
+        if sample is None or pd.api.types.is_numeric_dtype(sample) and not isinstance(sample.dtype, pd.CategoricalDtype):
+            continue
+        try:
+            values = set()
+            for df in projected:
+                for col in group:
+                    values.update(df[col].dropna().astype(object).unique())
+        except TypeError:
+            continue
+        dtype = pd.CategoricalDtype(sorted(values, key=str))
+        dtypes.update({col: dtype for col in group})
+
+    optimized = []
+    for df in projected:
+        df = df.astype(dtypes)
+        for col in df.columns:
+            if (col not in dtypes and col != "report_date" and pd.api.types.is_numeric_dtype(df[col])
+                    and not pd.api.types.is_bool_dtype(df[col])):
+                kind = "integer" if pd.api.types.is_integer_dtype(df[col]) else "float"
+                df[col] = pd.to_numeric(df[col], downcast=kind)
+        optimized.append(df)
+    return optimized
+
+DEDUP_INDEX = "dedup_index"
+DEDUP_INDEX_VERSION = "v1"
+
+def _normalized_text(values):
+    text = pd.Series(values, dtype=object).astype(str).str.strip().str.lower()
+    return text.where(pd.notna(values) & (text != "none"), "").to_numpy(dtype=object)
+
+def _normalized_set(df, columns):
+    """
+    Per-row sorted, de-duplicated, normalized values of `columns`, so the
+    column a TTP or country landed in does not affect the row hash.
+    """
+    if not columns:
+        return np.empty((len(df), 0), dtype=object)
+    values = _normalized_text(df[columns].to_numpy(dtype=object).ravel()).reshape(len(df), len(columns))
+    values.sort(axis=1)
+    values[:, 1:][values[:, 1:] == values[:, :-1]] = ""
+    values.sort(axis=1)
+    return values
+
+def row_hashes(df, text_columns=None):
+    """
+    64-bit hash of each row's normalized content: source and text fields,
+    TTP set and country set.
+    """
+    ttp_columns, country_columns = get_ttp_and_country_columns(df)
+    if text_columns is None:
+        text_columns = list(dict.fromkeys(REQUIRED_COLUMNS + DEDUP_TEXT_COLUMNS))
+    parts = {f"text_{c}": _normalized_text(df[c].to_numpy(dtype=object)) for c in text_columns if c in df.columns}
+    for name, columns in (("ttp", ttp_columns), ("country", country_columns)):
+        values = _normalized_set(df, columns)
+        parts.update({f"{name}_{i}": values[:, i] for i in range(values.shape[1])})
+    if not parts:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+@instrument(size_arg=None)
+def deduplicate_reports(reports, mode=DEDUP_MODE, cache_folder=CACHE_FOLDER, index_version=DEDUP_INDEX_VERSION):
+    """
+    Mark rows that repeat a row of an earlier report. `reports` is a list of
+    (path, frame) in date order; returns the frames with an `is_duplicate`
+    column ("flag") or without the duplicate rows ("collapse").
+
+    Row hashes and the first report of every hash are kept in a persistent
+    index under `cache_folder` (None disables it), so only reports added
+    since the last load are hashed and checked; the index is rebuilt from the
+    stored hashes when an older report changes.
+    """
+    if mode not in ("flag", "collapse"):
+        return [df for _, df in reports]
+    index = cache_folder and load_artifact(DEDUP_INDEX, index_version, cache_folder)
+    index = index or {"files": [], "seen": {}}
+    names = [os.path.basename(path) for path, _ in reports]
+    stats = [(os.stat(path).st_size, os.stat(path).st_mtime_ns) for path, _ in reports]
+
+    valid = 0
+    for entry, name, stat, (_, df) in zip(index["files"], names, stats, reports):
+        if (entry["name"], entry["stat"]) != (name, stat) or len(entry["hashes"]) != len(df):
+            break
+        valid += 1
+    files = index["files"][:valid]
+    seen = index["seen"]
+    if valid < len(index["files"]):
+        seen = {}
+        for entry in files:
+            for h in entry["hashes"].tolist():
+                seen.setdefault(h, entry["name"])
+
+    for (path, df), name, stat in list(zip(reports, names, stats))[valid:]:
+        hashes = row_hashes(df)
+        duplicate = np.fromiter((h in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+        for h in hashes.tolist():
+            seen.setdefault(h, name)
+        files.append({"name": name, "stat": stat, "hashes": hashes, "duplicate": duplicate})
+    if cache_folder and (valid < len(reports) or valid < len(index["files"])):
+        save_artifact(DEDUP_INDEX, index_version, {"files": files, "seen": seen}, cache_folder)
+
+    deduplicated = []
+    for (_, df), entry in zip(reports, files):
+        if mode == "collapse":
+            deduplicated.append(df[~entry["duplicate"]].reset_index(drop=True))
+        else:
+            deduplicated.append(df.assign(is_duplicate=entry["duplicate"]))
+    total = sum(int(entry["duplicate"].sum()) for entry in files)
+    logger.info(f"Deduplication ({mode}): {total} of {sum(len(df) for _, df in reports)} rows repeat an earlier report")
+    return deduplicated
+
+def loader_config_key():
+    """
+    Short hash of the settings that change what `load_local_reports` returns
+    with its defaults: the reader settings, the optimized projection,
+    deduplication and TTP canonicalization.
+    """
+    key = repr((REPORT_CACHE_VERSION, _reader_config_key(), REQUIRED_COLUMNS, LOAD_OPTIMIZED, DEDUP_MODE,
+                DEDUP_INDEX_VERSION, TTP_CANONICALIZE, TTP_SIMILARITY_THRESHOLD))
+    return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+@instrument(size_arg=None)
+def load_local_reports(folder=REPORTS_FOLDER, use_cache=True, cache_folder=CACHE_FOLDER,
+                       optimize=LOAD_OPTIMIZED, columns=REQUIRED_COLUMNS, dedup=DEDUP_MODE,
+                       canonicalize=TTP_CANONICALIZE):
+    """
+    Combined frame of every ttp_reports_* file in `folder`. With `optimize`,
+    only `columns` plus the TTP/country/date columns are kept as shared
+    categoricals; the before/after footprint is logged and stored in
+    `combined.attrs["memory"]`. Rows repeating an earlier report are flagged
+    or dropped according to `dedup` (see `deduplicate_reports`), after TTP
+    variants are mapped to their canonical string when `canonicalize`.
+    """
+    files = sorted(glob.glob(os.path.join(folder, "ttp_reports_*.*")), key=_report_sort_key)
+    reports = []
     for f in files:
         try:
-            if f.lower().endswith(".xlsx"):
-                xls = pd.ExcelFile(f)
-                sheet_name = "Human_Attacks" if "Human_Attacks" in xls.sheet_names else xls.sheet_names[0]
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-            else:
-                df = pd.read_csv(f)
-
-            date_str = os.path.basename(f).replace("ttp_reports_", "").split(".")[0]
-            df["report_date"] = pd.to_datetime(date_str, format="%d%m%y", errors="coerce")
-            all_data.append(df)
+            df = read_cached_report(f, cache_folder) if use_cache else None
+            if df is None:
+                df = read_report_file(f)
+                if use_cache:
+                    write_cached_report(f, df, cache_folder)
+            reports.append((f, df))
         except Exception as e:
-            st.warning(f"Could not read {f}: {e}")
+            reporting.warning(f"Could not read {f}: {e}")
             continue
 
+    index_version = DEDUP_INDEX_VERSION
+    if canonicalize and reports:
+        paths, frames = zip(*reports)
+        reports = list(zip(paths, canonicalize_ttps(list(frames), cache_folder=cache_folder if use_cache else None)))
+        index_version = f"{DEDUP_INDEX_VERSION}-canonical-{TTP_SIMILARITY_THRESHOLD}"
+    all_data = deduplicate_reports(reports, dedup, cache_folder if use_cache else None, index_version) if reports else []
+
     if all_data:
-        combined = pd.concat(all_data, ignore_index=True)
+        if optimize:
+            before = sum(frame_memory(df) for df in all_data)
+            all_data = optimize_report_frames(all_data, columns)
+        with stage("data_loader.concat", size=len(all_data)):
+            combined = pd.concat(all_data, ignore_index=True)
         combined = combined.dropna(subset=["report_date"])
         if combined.empty:
-            st.error("No valid data after combining reports.")
-            st.stop()
+            reporting.stop("No valid data after combining reports.")
+        if optimize:
+            after = frame_memory(combined)
+            combined.attrs["memory"] = {"before_bytes": before, "after_bytes": after}
+            logger.info(f"Report frame memory: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
         return combined
     else:
-        st.error("No report files found in 'reports/'.")
-        st.stop()
+        reporting.stop(f"No report files found in '{folder}/'.")
 
 def get_ttp_and_country_columns(df):
     ttp_columns = [c for c in df.columns if c.lower().startswith("ttp_desc")]
     country_columns = [c for c in df.columns if c.lower().startswith("country_")]
     return ttp_columns, country_columns
+
+@instrument()
+def flatten_ttp_values(df, columns, lower=False):
+    """
+    Flatten the values of `columns` into a list of strings, expanding list-like
+    cells and dropping missing values and the "None" sentinel.
+    """
+    values = []
+    for col in columns:
+        if col not in df.columns:
+            continue
+        for val in df[col].dropna():
+            if isinstance(val, (list, tuple, set)):
+                values.extend(str(x) for x in val if x not in [None, "None"])
+            elif str(val) != "None":
+                values.append(str(val))
+    if lower:
+        values = [v.lower() for v in values]
+    return values
+
+@instrument()
+def melt_ttp_country(df, ttp_columns, country_columns):
+    """
+    Long (TTP, country) frame with one row per TTP × country pairing in each
+    report row, as used by the Dashboard charts.
+    """
+    melted = df.melt(id_vars=country_columns, value_vars=ttp_columns,
+                     var_name="ttp_col", value_name="TTP")
+    if any(melted["TTP"].apply(lambda x: isinstance(x, (list, tuple, set)))):
+        melted = melted.explode("TTP")
+    melted = melted.dropna(subset=["TTP"])
+    melted = melted[melted["TTP"] != "None"]
+    melted = melted.melt(id_vars=["TTP"], value_vars=country_columns,
+                         var_name="country_col", value_name="country")
+    melted = melted.dropna(subset=["country"])
+    melted = melted[melted["country"] != "None"]
+    return melted
+
+def stack_columns(df, columns):
+    """
+    Long view of `columns`: (row positions, values) for every non-missing,
+    non-"None" cell, with list-like cells expanded. Values keep a shared
+    categorical dtype when the columns have one.
+    """
+    if not columns or df.empty:
+        return np.empty(0, dtype=np.int64), pd.Series([], dtype=object)
+    values = pd.concat([df[c].reset_index(drop=True) for c in columns], ignore_index=True)
+    rows = np.tile(np.arange(len(df), dtype=np.int64), len(columns))
+    if values.dtype == object and values.map(lambda x: isinstance(x, (list, tuple, set))).any():
+        values = pd.Series(values.values, index=rows).explode()
+        rows = values.index.values.astype(np.int64)
+        values = values.reset_index(drop=True)
+    mask = (values.notna() & (values != "None")).values
+    return rows[mask], values[mask].reset_index(drop=True)
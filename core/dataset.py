@@ -0,0 +1,265 @@
+"""
+Shared Dataset
+--------------
+Process-wide, read-only handle on the combined report frame. Every
+Streamlit session and page references the same `Dataset` instead of loading
+its own copy; a new version is built when the report files change and
+swapped in atomically, subject to a per-process memory budget.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import REPORTS_FOLDER, CACHE_FOLDER, DATASET_MEMORY_BUDGET_MB, DATASET_REFRESH_SECONDS
+from . import reporting
+from .artifacts import load_artifact, save_artifact
+from .data_loader import load_local_reports, get_ttp_and_country_columns, frame_memory, loader_config_key
+from .instrumentation import instrument
+
+
+def report_fingerprint(folder=REPORTS_FOLDER):
+    """
+    {file name: (size, mtime_ns)} for every report file in `folder`.
+    """
+    fingerprint = {}
+    for path in glob.glob(os.path.join(folder, "ttp_reports_*.*")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint[os.path.basename(path)] = (stat.st_size, stat.st_mtime_ns)
+    return fingerprint
+
+
+def fingerprint_version(fingerprint):
+    """
+    Dataset version of the report files in `fingerprint` loaded under the
+    current loader settings (`loader_config_key`), so artifacts persisted
+    per version are not reused after either changes.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"loader:{loader_config_key()};".encode())
+    for name, (size, mtime) in sorted(fingerprint.items()):
+        h.update(f"{name}:{size}:{mtime};".encode())
+    return h.hexdigest()
+
+
+def report_signature(report, columns):
+    """
+    Content hash of `columns` of one report slice, used to key per-report
+    segments of derived structures.
+    """
+    if report.empty or not columns:
+        return f"empty:{len(report)}"
+    hashed = pd.util.hash_pandas_object(report[columns].astype(object), index=False).to_numpy()
+    return f"{len(report)}:{int(hashed.sum(dtype=np.uint64))}:{int(np.bitwise_xor.reduce(hashed))}"
+
+
+class Dataset:
+    """
+    An immutable snapshot of the combined reports. Treat `frame` as read-only;
+    derived structures are memoized per version with `artifact()`.
+    """
+
+    def __init__(self, frame, folder, fingerprint):
+        if not frame["report_date"].is_monotonic_increasing:
+            frame = frame.sort_values("report_date", kind="stable", ignore_index=True)
+        self.frame = frame
+        self.folder = folder
+        self.fingerprint = fingerprint
+        self.version = fingerprint_version(fingerprint)
+        self.loaded_at = time.time()
+        self.ttp_columns, self.country_columns = get_ttp_and_country_columns(frame)
+        self.frame_bytes = frame_memory(frame)
+        self._artifacts = {}
+        self._artifact_bytes = {}
+        self._builders = {}
+        self._lock = threading.RLock()
+
+        days = frame["report_date"].values.astype("datetime64[D]").view("int64")
+        self._date_keys, self._date_starts = np.unique(days, return_index=True)
+        self._date_stops = np.append(self._date_starts[1:], len(days))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @staticmethod
+    def _day_key(value):
+        return np.datetime64(pd.Timestamp(value).date(), "D").astype("int64")
+
+    @property
+    def report_dates(self):
+        """
+        Report dates (datetime.date), oldest first.
+        """
+        return [d.item() for d in self._date_keys.astype("datetime64[D]")]
+
+    def date_offsets(self):
+        """
+        (report_date, start, stop) row offsets of each report partition.
+        """
+        return [
+            (d.item(), int(start), int(stop))
+            for d, start, stop in zip(self._date_keys.astype("datetime64[D]"), self._date_starts, self._date_stops)
+        ]
+
+    def get_report(self, date):
+        """
+        Rows of the report dated `date` as a slice of the shared frame.
+        """
+        i = np.searchsorted(self._date_keys, self._day_key(date))
+        if i == len(self._date_keys) or self._date_keys[i] != self._day_key(date):
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[self._date_starts[i]:self._date_stops[i]]
+
+    def row_range(self, start=None, end=None):
+        """
+        (first, stop) frame row positions of the reports dated within
+        [start, end] (either bound optional); (0, 0) when there are none.
+        """
+        lo = 0 if start is None else np.searchsorted(self._date_keys, self._day_key(start), side="left")
+        hi = len(self._date_keys) if end is None else np.searchsorted(self._date_keys, self._day_key(end), side="right")
+        if lo >= hi:
+            return 0, 0
+        return int(self._date_starts[lo]), int(self._date_stops[hi - 1])
+
+    def get_range(self, start=None, end=None):
+        """
+        Rows of every report dated within [start, end] (either bound optional)
+        as one contiguous slice of the shared frame.
+        """
+        first, stop = self.row_range(start, end)
+        return self.frame.iloc[first:stop]
+
+    def row_report_ids(self):
+        """
+        Position of each row's report in `report_dates`.
+        """
+        return np.repeat(np.arange(len(self._date_keys)), self._date_stops - self._date_starts)
+
+    def iter_reports(self):
+        for date, start, stop in self.date_offsets():
+            yield date, self.frame.iloc[start:stop]
+
+    @property
+    def memory_bytes(self):
+        return self.frame_bytes + sum(self._artifact_bytes.values())
+
+    def artifact(self, name, build, size_of=None):
+        """
+        Build-once derived structure (index, cube, sketch, ...) for this
+        version. `size_of` reports its bytes towards the memory budget.
+        """
+        with self._lock:
+            if name not in self._artifacts:
+                value = build(self)
+                self._artifacts[name] = value
+                self._builders[name] = (build, size_of)
+                if size_of is not None:
+                    self._artifact_bytes[name] = int(size_of(value))
+                    _check_budget(self)
+            return self._artifacts[name]
+
+    def artifact_builders(self):
+        """
+        {name: (build, size_of)} of the artifacts built for this version, so
+        a successor version can rebuild the same set.
+        """
+        with self._lock:
+            return dict(self._builders)
+
+    def cached_artifact(self, name, build, size_of=None, cache_folder=CACHE_FOLDER, builder_version=None):
+        """
+        Like `artifact()`, but also persisted in the artifact store so other
+        processes and restarts reuse it for the same dataset version (and
+        `builder_version`, for builders whose output changes with the code or
+        installed packages).
+        """
+        def load_or_build(dataset):
+            version = dataset.version if builder_version is None else f"{dataset.version}-{builder_version}"
+            value = load_artifact(name, version, cache_folder)
+            if value is None:
+                value = build(dataset)
+                save_artifact(name, version, value, cache_folder)
+            return value
+        return self.artifact(name, load_or_build, size_of)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "rows": len(self.frame),
+            "reports": len(self.fingerprint),
+            "frame_bytes": self.frame_bytes,
+            "artifact_bytes": dict(self._artifact_bytes),
+            "memory_bytes": self.memory_bytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+_lock = threading.Lock()
+_datasets = {}
+_last_checked = {}
+
+
+def _check_budget(dataset):
+    budget = DATASET_MEMORY_BUDGET_MB * 2**20
+    if dataset.memory_bytes > budget:
+        reporting.warning(
+            f"Shared dataset uses {dataset.memory_bytes / 2**20:.1f} MiB, "
+            f"above the {DATASET_MEMORY_BUDGET_MB} MiB budget."
+        )
+        return False
+    return True
+
+
+@instrument(size_arg=None)
+def get_shared_dataset(folder=REPORTS_FOLDER, refresh=True):
+    """
+    The current `Dataset` for `folder`, loading it on first use and
+    reloading (at most every DATASET_REFRESH_SECONDS) when report files were
+    added, changed or removed. Readers holding an older version keep a
+    consistent snapshot; new callers get the swapped-in one. A reload that
+    exceeds the memory budget keeps serving the previous version.
+    """
+    key = os.path.abspath(folder)
+    current = _datasets.get(key)
+    now = time.monotonic()
+    if current is not None and (not refresh or now - _last_checked.get(key, 0) < DATASET_REFRESH_SECONDS):
+        return current
+
+    fingerprint = report_fingerprint(folder)
+    _last_checked[key] = now
+    if current is not None and fingerprint_version(fingerprint) == current.version:
+        return current
+
+    with _lock:
+        current = _datasets.get(key)
+        if current is not None and fingerprint_version(fingerprint) == current.version:
+            return current
+        dataset = Dataset(load_local_reports(folder), folder, fingerprint)
+        if not _check_budget(dataset) and current is not None:
+            return current
+        _datasets[key] = dataset
+        return dataset
+
+
+def publish_dataset(dataset):
+    """
+    Atomically make `dataset` the shared version for its folder.
+    """
+    key = os.path.abspath(dataset.folder)
+    with _lock:
+        _datasets[key] = dataset
+        _last_checked[key] = time.monotonic()
+
+
+def clear_shared_datasets():
+    with _lock:
+        _datasets.clear()
+        _last_checked.clear()
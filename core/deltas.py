@@ -0,0 +1,91 @@
+"""
+Week-over-Week Delta Engine
+---------------------------
+Builds per-report count vectors for TTPs and countries in one vectorized
+pass over the history and classifies every value in each consecutive pair
+of reports as new, disappeared, rising or falling. The result is persisted
+in the artifact store per dataset version, so "what's new" is a lookup.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import stack_columns, frame_memory
+from .instrumentation import instrument
+
+DELTAS_ARTIFACT = "weekly_deltas.v1"
+STATUSES = np.array(["", "new", "disappeared", "rising", "falling"], dtype=object)
+
+
+def weekly_counts(dataset, columns):
+    """
+    (counts, labels): a reports × values int32 matrix of occurrences of each
+    distinct value of `columns`, rows aligned with `dataset.report_dates`.
+    """
+    rows, values = stack_columns(dataset.frame, columns)
+    n_weeks = len(dataset.report_dates)
+    if len(values) == 0:
+        return np.zeros((n_weeks, 0), dtype=np.int32), np.empty(0, dtype=object)
+    codes, uniques = pd.factorize(values)
+    weeks = dataset.row_report_ids()[rows]
+    flat = np.bincount(weeks * len(uniques) + codes, minlength=n_weeks * len(uniques))
+    return flat.reshape(n_weeks, len(uniques)).astype(np.int32), np.asarray(uniques, dtype=object)
+
+
+def _classify(counts):
+    prev, cur = counts[:-1], counts[1:]
+    status = np.zeros(cur.shape, dtype=np.int8)
+    status[(cur > prev) & (prev > 0)] = 3
+    status[(cur < prev) & (cur > 0)] = 4
+    status[(cur > 0) & (prev == 0)] = 1
+    status[(cur == 0) & (prev > 0)] = 2
+    return prev, cur, status
+
+
+@instrument(size_arg=None)
+def compute_weekly_deltas(dataset):
+    """
+    Long frame of every change between consecutive reports with columns
+    report_date, previous_date, kind ("ttp" / "country"), value, status,
+    previous_count, count and change.
+    """
+    dates = np.array(dataset.report_dates, dtype=object)
+    frames = []
+    for kind, columns in (("ttp", dataset.ttp_columns), ("country", dataset.country_columns)):
+        counts, labels = weekly_counts(dataset, columns)
+        if len(dates) < 2 or counts.shape[1] == 0:
+            continue
+        prev, cur, status = _classify(counts)
+        pair, col = np.nonzero(status)
+        frames.append(pd.DataFrame({
+            "report_date": dates[pair + 1],
+            "previous_date": dates[pair],
+            "kind": kind,
+            "value": labels[col],
+            "status": STATUSES[status[pair, col]],
+            "previous_count": prev[pair, col],
+            "count": cur[pair, col],
+            "change": cur[pair, col] - prev[pair, col],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["report_date", "previous_date", "kind", "value", "status",
+                                     "previous_count", "count", "change"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def get_weekly_deltas(dataset):
+    """
+    Deltas for `dataset`, memoized per version and persisted to the cache.
+    """
+    return dataset.cached_artifact(DELTAS_ARTIFACT, compute_weekly_deltas, size_of=frame_memory)
+
+
+def deltas_for_week(deltas, report_date, kind=None):
+    """
+    Changes of the report dated `report_date` against the one before it,
+    largest absolute change first.
+    """
+    week = deltas[deltas["report_date"] == report_date]
+    if kind is not None:
+        week = week[week["kind"] == kind]
+    return week.iloc[np.argsort(-week["change"].abs().values, kind="stable")]
@@ -0,0 +1,158 @@
+"""
+Figure Cache
+------------
+Bounded LRU cache of built Plotly figures, keyed by a fingerprint of the
+builder's inputs and the active plot theme, so Streamlit reruns that do not
+change a chart's data skip rebuilding it. Cached figures are returned as
+is (not re-parsed from JSON), so callers must treat them as read-only.
+"""
+
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import FIGURE_CACHE_MAX_BYTES
+
+def _update_fingerprint(h, value):
+    if isinstance(value, pd.DataFrame):
+        h.update(repr(list(value.columns)).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(repr(value.name).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (pd.Index, pd.api.extensions.ExtensionArray)):
+        h.update(pd.util.hash_pandas_object(pd.Series(value), index=False).values.tobytes())
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        h.update(value.dtype.str.encode())
+        h.update(repr(value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (set, frozenset)):
+        h.update(repr(sorted(map(str, value))).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(pd.util.hash_array(value.astype(object).ravel()).tobytes())
+    else:
+        h.update(repr(value).encode())
+    h.update(b"\x00")
+
+
+def figure_key(name, args, kwargs, theme):
+    """
+    Stable key for a figure built by `name` from `args`/`kwargs` under `theme`.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(name.encode())
+    h.update(json.dumps(theme, sort_keys=True).encode())
+    for value in args:
+        _update_fingerprint(h, value)
+    for key in sorted(kwargs):
+        h.update(key.encode())
+        _update_fingerprint(h, kwargs[key])
+    return h.hexdigest()
+
+
+def _payload_bytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes if value.dtype != object else sum(_payload_bytes(v) for v in value.ravel())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _payload_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 8 * len(value) + sum(_payload_bytes(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+
+def figure_bytes(fig):
+    """
+    Approximate payload size of a built figure: the bytes of its trace
+    arrays and layout values (including the template), measured on the
+    figure's own data without serializing it.
+    """
+    return _payload_bytes(fig.to_plotly_json())
+
+
+class FigureCache:
+    """
+    Thread-safe LRU of built figures bounded by their total `figure_bytes`.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, fig, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (fig, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+figure_cache = FigureCache()
+
+
+def cached_figure(theme_fn):
+    """
+    Decorator serving a figure builder's output from `figure_cache`. The
+    same Figure object is returned to every session and thread, so it must
+    not be mutated (no `update_layout`, `add_trace`, ...); call
+    `builder.uncached` for a figure to modify.
+    `theme_fn` returns the theme dict that participates in the cache key.
+    Builders returning None are not cached.
+    """
+    def decorator(builder):
+        @functools.wraps(builder)
+        def wrapper(*args, **kwargs):
+            key = figure_key(builder.__qualname__, args, kwargs, theme_fn())
+            fig = figure_cache.get(key)
+            if fig is not None:
+                return fig
+            fig = builder(*args, **kwargs)
+            if fig is not None:
+                figure_cache.put(key, fig, figure_bytes(fig))
+            return fig
+        wrapper.uncached = builder
+        return wrapper
+    return decorator
@@ -1,9 +1,10 @@
+import functools
 import pycountry
 import maxminddb
 import os
-import streamlit as st
 
 from config import ML_AVAILABLE
+from . import reporting
 
 def get_nordic_baltic_countries():
     return [
@@ -11,6 +12,7 @@ def get_nordic_baltic_countries():
         "Estonia", "Latvia", "Lithuania", "Poland", "Vietnam"
     ]
 
+@functools.lru_cache(maxsize=None)
 def country_to_iso3(name):
     try:
         return pycountry.countries.lookup(name).alpha_3
@@ -27,5 +29,5 @@ def ip_to_country(ip, mmdb_path="data/GeoLite2-Country.mmdb"):
                 return None
             return resp.get("country", {}).get("names", {}).get("en")
     except Exception as e:
-        st.warning(f"GeoIP lookup failed: {e}")
+        reporting.warning(f"GeoIP lookup failed: {e}")
         return None
@@ -0,0 +1,359 @@
+"""
+Bulk IP Geolocation
+-------------------
+Vectorized IP -> country resolution for indicator enrichment. An IP-range
+table (a local CSV, or the GeoLite2 .mmdb exported once) is compiled into
+sorted arrays: IPv4 bounds as uint32, IPv6 bounds as 16-byte big-endian
+strings, plus a country code per range. Whole address arrays then resolve
+with one `np.searchsorted` per family.
+
+Compiled arrays are saved with `np.save` under the cache folder per source
+file version and opened with `mmap_mode="r"`, so later loads map the files
+instead of parsing the source.
+"""
+
+import functools
+import glob
+import hashlib
+import heapq
+import ipaddress
+import json
+import os
+import shutil
+import socket
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER, GEOIP_RANGES_PATH
+from . import reporting
+from .instrumentation import instrument
+
+TABLE_FOLDER = "geoip"
+TABLE_VERSION = "v2"
+DEFAULT_SOURCES = ("ip_country.csv", "GeoLite2-Country-Blocks-IPv*.csv", "GeoLite2-Country.mmdb")
+IPV4_MAPPED_PREFIX = np.array([0] * 10 + [0xFF, 0xFF], dtype=np.uint8)
+ARRAYS = ("v4_start", "v4_end", "v4_code", "v6_start", "v6_end", "v6_code")
+
+
+def find_range_source(path=GEOIP_RANGES_PATH, data_folder="data"):
+    """
+    Source files of the range table: `path` (comma-separated for several
+    CSVs) or the first of DEFAULT_SOURCES found in `data_folder`.
+    """
+    if path:
+        paths = [p for p in path.split(",") if p]
+        return paths if all(os.path.exists(p) for p in paths) else None
+    for pattern in DEFAULT_SOURCES:
+        paths = sorted(glob.glob(os.path.join(data_folder, pattern)))
+        if paths:
+            return paths
+    return None
+
+
+def source_version(paths):
+    key = ";".join(f"{os.path.basename(p)}:{os.stat(p).st_size}:{os.stat(p).st_mtime_ns}" for p in paths)
+    return f"{TABLE_VERSION}-{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}"
+
+
+def parse_ipv4(addresses):
+    """
+    uint32 values of dotted IPv4 strings; invalid entries map to 0 and are
+    flagged in the returned mask.
+    """
+    addresses = list(addresses)
+    try:
+        packed = b"".join(map(socket.inet_aton, addresses))
+        return np.frombuffer(packed, dtype=">u4").astype(np.uint32), np.ones(len(addresses), dtype=bool)
+    except (OSError, TypeError):
+        values = np.zeros(len(addresses), dtype=np.uint32)
+        valid = np.zeros(len(addresses), dtype=bool)
+        for i, address in enumerate(addresses):
+            try:
+                values[i] = int.from_bytes(socket.inet_aton(address), "big")
+                valid[i] = True
+            except (OSError, TypeError):
+                pass
+        return values, valid
+
+
+def parse_ipv6(addresses):
+    """
+    16-byte big-endian values of IPv6 strings, with a validity mask.
+    """
+    addresses = list(addresses)
+    try:
+        packed = b"".join(socket.inet_pton(socket.AF_INET6, a) for a in addresses)
+        return np.frombuffer(packed, dtype="S16").copy(), np.ones(len(addresses), dtype=bool)
+    except (OSError, TypeError):
+        values = np.zeros(len(addresses), dtype="S16")
+        valid = np.zeros(len(addresses), dtype=bool)
+        for i, address in enumerate(addresses):
+            try:
+                values[i] = socket.inet_pton(socket.AF_INET6, address)
+                valid[i] = True
+            except (OSError, TypeError):
+                pass
+        return values, valid
+
+
+def _is_ipv6(addresses):
+    return np.fromiter((":" in a for a in addresses), dtype=bool, count=len(addresses))
+
+
+def _network_bounds(networks):
+    """
+    (first, last) address strings of CIDR networks.
+    """
+    bounds = [ipaddress.ip_network(n, strict=False) for n in networks]
+    return [str(n.network_address) for n in bounds], [str(n.broadcast_address) for n in bounds]
+
+
+def _read_csv_ranges(path):
+    """
+    (starts, ends, countries) of a range CSV: either `network` (CIDR) or
+    `start`/`end` address columns, with `country` (a name or code), or the
+    GeoLite2 blocks layout whose `geoname_id` is resolved through the
+    Locations-en file next to it.
+    """
+    df = pd.read_csv(path, dtype=object, keep_default_na=False)
+    if "country" not in df and "geoname_id" in df:
+        locations = glob.glob(os.path.join(os.path.dirname(path), "*Locations-en.csv"))
+        if not locations:
+            raise ValueError(f"{path}: geoname_id given but no *Locations-en.csv found")
+        names = pd.read_csv(locations[0], dtype=object, keep_default_na=False)
+        names = dict(zip(names["geoname_id"], names["country_name"]))
+        ids = df["geoname_id"].where(df["geoname_id"] != "", df.get("registered_country_geoname_id", ""))
+        df["country"] = ids.map(names)
+    df = df[df["country"].notna() & (df["country"] != "")]
+    if "network" in df:
+        starts, ends = _network_bounds(df["network"])
+    else:
+        starts, ends = df["start"].tolist(), df["end"].tolist()
+    return starts, ends, df["country"].tolist()
+
+
+def _read_mmdb_ranges(path):
+    import maxminddb
+    starts, ends, countries = [], [], []
+    with maxminddb.open_database(path) as reader:
+        for network, record in reader:
+            country = (record or {}).get("country") or (record or {}).get("registered_country") or {}
+            name = country.get("names", {}).get("en")
+            if name:
+                starts.append(str(network.network_address))
+                ends.append(str(network.broadcast_address))
+                countries.append(name)
+    return starts, ends, countries
+
+
+def _to_ints(values, family):
+    if family == 4:
+        return values.tolist()
+    return [int.from_bytes(v.ljust(16, b"\0"), "big") for v in values.tolist()]
+
+
+def _from_ints(values, family):
+    if family == 4:
+        return np.array(values, dtype=np.uint32)
+    return np.array([v.to_bytes(16, "big") for v in values], dtype="S16")
+
+
+def _flatten_ranges(first, last, codes, family):
+    """
+    Disjoint (first, last, codes) covering the same addresses as the sorted
+    inclusive ranges given, where nested or overlapping ranges are split and
+    each address keeps the code of the narrowest range containing it (on
+    ties, the one starting or listed later). Tables that are already disjoint pass through.
+    """
+    if len(first) < 2 or (first[1:] > last[:-1]).all():
+        return first, last, codes
+    starts, ends, labels = _to_ints(first, family), _to_ints(last, family), codes.tolist()
+    out_first, out_last, out_codes = [], [], []
+
+    def emit(start, end, code):
+        if out_codes and out_codes[-1] == code and out_last[-1] + 1 == start:
+            out_last[-1] = end
+        else:
+            out_first.append(start)
+            out_last.append(end)
+            out_codes.append(code)
+
+    i, n = 0, len(starts)
+    while i < n:
+        # A cluster: ranges chained by overlap, swept as elementary segments.
+        j, reach = i + 1, ends[i]
+        while j < n and starts[j] <= reach:
+            reach = max(reach, ends[j])
+            j += 1
+        if j == i + 1:
+            emit(starts[i], ends[i], labels[i])
+            i = j
+            continue
+        bounds = sorted({starts[k] for k in range(i, j)} | {ends[k] + 1 for k in range(i, j)})
+        active, k = [], i
+        for lo, hi in zip(bounds, bounds[1:]):
+            while k < j and starts[k] == lo:
+                heapq.heappush(active, (ends[k] - starts[k], -k))
+                k += 1
+            while active and ends[-active[0][1]] < lo:
+                heapq.heappop(active)
+            if active:
+                emit(lo, hi - 1, labels[-active[0][1]])
+        i = j
+    return (_from_ints(out_first, family), _from_ints(out_last, family),
+            np.array(out_codes, dtype=codes.dtype))
+
+
+class IPRangeTable:
+    """
+    Sorted, non-overlapping IPv4 and IPv6 ranges with a country code per
+    range; `countries` decodes the codes.
+    """
+
+    def __init__(self, arrays, countries):
+        self.arrays = arrays
+        self.countries = np.asarray(countries + [None], dtype=object)
+
+    @classmethod
+    def from_ranges(cls, starts, ends, countries):
+        """
+        Table of inclusive [start, end] address-string ranges; ranges that
+        do not parse, mix families or end before they start are skipped.
+        Nested or overlapping ranges are split so the most specific range
+        wins (see `_flatten_ranges`).
+        """
+        starts, ends = np.asarray(starts, dtype=object), np.asarray(ends, dtype=object)
+        labels, codes = np.unique(np.asarray(countries, dtype=object).astype(str), return_inverse=True)
+        is_v6 = _is_ipv6(starts)
+        arrays = {}
+        for family, mask, parse in ((4, ~is_v6, parse_ipv4), (6, is_v6, parse_ipv6)):
+            first, first_ok = parse(starts[mask])
+            last, last_ok = parse(ends[mask])
+            keep = first_ok & last_ok & (first <= last)
+            order = np.argsort(first[keep], kind="stable")
+            first, last, family_codes = _flatten_ranges(
+                first[keep][order], last[keep][order], codes[mask][keep][order].astype(np.int32), family)
+            arrays[f"v{family}_start"] = first
+            arrays[f"v{family}_end"] = last
+            arrays[f"v{family}_code"] = family_codes
+        return cls(arrays, labels.tolist())
+
+    def __len__(self):
+        return len(self.arrays["v4_start"]) + len(self.arrays["v6_start"])
+
+    def _lookup(self, family, values):
+        starts, ends, codes = (self.arrays[f"v{family}_{name}"] for name in ("start", "end", "code"))
+        i = np.searchsorted(starts, values, side="right") - 1
+        found = i >= 0
+        i = np.maximum(i, 0)
+        if len(starts):
+            found &= values <= ends[i]
+        else:
+            found[:] = False
+        return np.where(found, codes[i] if len(codes) else -1, -1)
+
+    def lookup_ipv4(self, values):
+        """
+        Country codes (-1 when unknown) of uint32 IPv4 addresses.
+        """
+        return self._lookup(4, np.asarray(values, dtype=np.uint32))
+
+    def lookup_ipv6(self, values):
+        """
+        Country codes (-1 when unknown) of 16-byte IPv6 addresses.
+        """
+        return self._lookup(6, np.asarray(values, dtype="S16"))
+
+    def resolve(self, addresses):
+        """
+        Country name (None when unknown or invalid) of each address string,
+        IPv4 and IPv6 mixed.
+        """
+        addresses = np.array([a if isinstance(a, str) else "" for a in addresses], dtype=object)
+        codes = np.full(len(addresses), -1, dtype=np.int64)
+        is_v6 = _is_ipv6(addresses)
+        for family, mask, parse, lookup in ((4, ~is_v6, parse_ipv4, self.lookup_ipv4),
+                                            (6, is_v6, parse_ipv6, self.lookup_ipv6)):
+            if mask.any():
+                values, valid = parse(addresses[mask])
+                positions = np.flatnonzero(mask)
+                if family == 6:
+                    # IPv4-mapped addresses (::ffff:a.b.c.d) resolve as IPv4.
+                    raw = values.view(np.uint8).reshape(-1, 16)
+                    mapped = valid & (raw[:, :12] == IPV4_MAPPED_PREFIX).all(axis=1)
+                    codes[positions[mapped]] = self.lookup_ipv4(raw[mapped, 12:].copy().view(">u4").ravel())
+                    valid &= ~mapped
+                codes[positions[valid]] = lookup(values[valid])
+        return self.countries[codes]
+
+    def save(self, folder):
+        tmp = folder + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), self.arrays[name])
+        with open(os.path.join(tmp, "countries.json"), "w") as f:
+            json.dump(self.countries[:-1].tolist(), f)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp, folder)
+
+    @classmethod
+    def load(cls, folder):
+        arrays = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(folder, "countries.json")) as f:
+            return cls(arrays, json.load(f))
+
+
+@instrument(size_arg=None)
+def compile_ip_table(paths):
+    """
+    IPRangeTable from range CSVs or an .mmdb file.
+    """
+    starts, ends, countries = [], [], []
+    for path in paths:
+        path_starts, path_ends, path_countries = (
+            _read_mmdb_ranges(path) if path.lower().endswith(".mmdb") else _read_csv_ranges(path))
+        starts.extend(path_starts)
+        ends.extend(path_ends)
+        countries.extend(path_countries)
+    return IPRangeTable.from_ranges(starts, ends, countries)
+
+
+@functools.lru_cache(maxsize=2)
+def _load_table(paths, version, cache_folder):
+    folder = os.path.join(cache_folder, TABLE_FOLDER, version)
+    if os.path.exists(os.path.join(folder, "countries.json")):
+        try:
+            return IPRangeTable.load(folder)
+        except (OSError, ValueError) as e:
+            reporting.warning(f"Could not map compiled IP table {folder}: {e}")
+    table = compile_ip_table(list(paths))
+    try:
+        table.save(folder)
+        return IPRangeTable.load(folder)
+    except OSError as e:
+        reporting.warning(f"Could not save compiled IP table: {e}")
+        return table
+
+
+def load_ip_table(path=None, cache_folder=CACHE_FOLDER):
+    """
+    Memory-mapped range table for `path` (default: see find_range_source),
+    compiled on first use; None without a source file.
+    """
+    paths = find_range_source(path) if path is not None else find_range_source()
+    if not paths:
+        return None
+    return _load_table(tuple(paths), source_version(paths), cache_folder)
+
+
+def ips_to_countries(addresses, path=None, cache_folder=CACHE_FOLDER):
+    """
+    Country name of each address in `addresses` (None when unknown), or
+    all None without a range source.
+    """
+    table = load_ip_table(path, cache_folder)
+    if table is None:
+        return np.full(len(addresses), None, dtype=object)
+    return table.resolve(addresses)
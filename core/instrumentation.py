@@ -0,0 +1,231 @@
+"""
+Hot-Path Instrumentation
+------------------------
+Opt-in per-stage timing for the core modules. When enabled, every
+`@instrument`-ed function and `stage()` block records wall time, call
+count, input size and (optionally) `peak_bytes`: how far traced memory
+rose above its level at stage entry. Results can be read with `snapshot()`,
+written as JSON, or written as collapsed stacks that flamegraph.pl /
+speedscope render directly; `profile()` wraps a cProfile run.
+
+Enable with CTI_INSTRUMENT=1 (CTI_INSTRUMENT_MEMORY=1 adds tracemalloc) or
+`instrumentation.enable()`. Disabled stages cost one flag check.
+
+tracemalloc's peak is process-global, so only one thread at a time (the
+first to open an outermost stage) measures memory; stages of other threads
+meanwhile record no peak. The measured increase still includes
+allocations made concurrently by other threads, so it bounds the stage's
+own footprint from above rather than isolating it.
+"""
+
+import cProfile
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from config import INSTRUMENTATION_ENABLED, INSTRUMENTATION_MEMORY
+
+_enabled = INSTRUMENTATION_ENABLED
+_track_memory = False
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {}
+_collapsed = {}
+_memory_owner = None
+
+
+def enable(track_memory=False):
+    global _enabled, _track_memory
+    _enabled = True
+    _track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled, _track_memory
+    _enabled = False
+    if _track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _track_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _collapsed.clear()
+
+
+def input_size(value):
+    """
+    Rows for frames/series/arrays, length for other sized containers, else None.
+    """
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _claim_memory(stack):
+    """
+    Whether this thread measures memory for a stage opened on `stack`: the
+    outermost stage claims tracemalloc if no other thread holds it.
+    """
+    global _memory_owner
+    if not (_track_memory and tracemalloc.is_tracing()):
+        return False
+    ident = threading.get_ident()
+    with _lock:
+        if _memory_owner is None and not stack:
+            _memory_owner = ident
+        return _memory_owner == ident
+
+
+def _release_memory(stack):
+    global _memory_owner
+    if not stack:
+        with _lock:
+            if _memory_owner == threading.get_ident():
+                _memory_owner = None
+
+
+def _record(name, path, elapsed, child_seconds, size, peak):
+    with _lock:
+        stats = _stats.setdefault(name, {
+            "calls": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "last_input_size": None,
+            "max_input_size": None,
+            "peak_bytes": None,
+        })
+        stats["calls"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        if size is not None:
+            stats["last_input_size"] = size
+            stats["max_input_size"] = max(stats["max_input_size"] or 0, size)
+        if peak is not None:
+            stats["peak_bytes"] = max(stats["peak_bytes"] or 0, peak)
+        self_us = int(max(elapsed - child_seconds, 0.0) * 1e6)
+        _collapsed[path] = _collapsed.get(path, 0) + self_us
+
+
+@contextmanager
+def stage(name, size=None):
+    """
+    Record the enclosed block as stage `name`, nested under any open stage.
+    """
+    if not _enabled:
+        yield
+        return
+
+    stack = _stack()
+    frame = {"name": name, "child_seconds": 0.0, "mem_start": None, "mem_peak": 0}
+    if _claim_memory(stack):
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["mem_peak"] = max(stack[-1]["mem_peak"], peak)
+        tracemalloc.reset_peak()
+        frame["mem_start"] = current
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        peak_bytes = None
+        if frame["mem_start"] is not None and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame["mem_peak"])
+            peak_bytes = max(peak - frame["mem_start"], 0)
+            if stack:
+                stack[-1]["mem_peak"] = max(stack[-1]["mem_peak"], peak)
+        if frame["mem_start"] is not None:
+            _release_memory(stack)
+        if stack:
+            stack[-1]["child_seconds"] += elapsed
+        path = ";".join([f["name"] for f in stack] + [name])
+        _record(name, path, elapsed, frame["child_seconds"], size, peak_bytes)
+
+
+def instrument(name=None, size_arg=0):
+    """
+    Decorator recording each call as a stage. `size_arg` is the positional
+    index of the argument whose size is logged (None to skip).
+    """
+    def decorator(fn):
+        stage_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            size = None
+            if size_arg is not None and len(args) > size_arg:
+                size = input_size(args[size_arg])
+            with stage(stage_name, size=size):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Per-stage statistics sorted by total time, slowest first.
+    """
+    with _lock:
+        rows = [{"stage": name, **stats} for name, stats in _stats.items()]
+    for row in rows:
+        row["mean_seconds"] = row["total_seconds"] / row["calls"] if row["calls"] else 0.0
+    return sorted(rows, key=lambda r: r["total_seconds"], reverse=True)
+
+
+def dump_json(path):
+    with open(path, "w") as f:
+        json.dump({"stages": snapshot()}, f, indent=2)
+
+
+def dump_collapsed(path):
+    """
+    Write stage self-times (microseconds) in collapsed-stack format.
+    """
+    with _lock:
+        lines = [f"{stack} {us}" for stack, us in sorted(_collapsed.items()) if us > 0]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + ("\n" if lines else ""))
+
+
+@contextmanager
+def profile(path):
+    """
+    Run the enclosed block under cProfile and write pstats output to `path`.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+if INSTRUMENTATION_MEMORY and _enabled:
+    enable(track_memory=True)
@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import streamlit as st
 from collections import Counter
 
 try:
@@ -14,10 +13,13 @@ try:
 except Exception:
     ML_AVAILABLE = False
 
+from . import reporting
+from .instrumentation import instrument
 from .geo_utils import get_nordic_baltic_countries
 
 # --- CLUSTERING ---
 
+@instrument()
 def ml_cluster_threat_patterns(all_ttps):
     """
     Cluster TTP strings using TF-IDF + KMeans with silhouette optimization.
@@ -59,11 +61,12 @@ def ml_cluster_threat_patterns(all_ttps):
 
         return clusters, cluster_info
     except Exception as e:
-        st.warning(f"Clustering analysis unavailable: {e}")
+        reporting.warning(f"Clustering analysis unavailable: {e}")
         return None, None
 
 # --- ANOMALY DETECTION ---
 
+@instrument()
 def ml_detect_anomalies(threat_vectors):
     """
     Use Isolation Forest to detect anomalous threat patterns.
@@ -82,11 +85,12 @@ def ml_detect_anomalies(threat_vectors):
         anomalies = np.where(anomaly_labels == -1)[0]
         return anomaly_scores, anomalies
     except Exception as e:
-        st.warning(f"Anomaly detection unavailable: {e}")
+        reporting.warning(f"Anomaly detection unavailable: {e}")
         return None, None
 
 # --- TIME SERIES FORECASTING ---
 
+@instrument()
 def ml_forecast_time_series(historical_data, periods=4):
     """
     Polynomial regression (degree 2) for time series forecasting.
@@ -94,8 +98,18 @@ def ml_forecast_time_series(historical_data, periods=4):
     """
     if not ML_AVAILABLE or len(historical_data) < 3:
         return None, None
+    daily_counts = historical_data.groupby('report_date').size().reset_index(name='count')
+    return ml_forecast_from_counts(daily_counts, periods)
+
+@instrument(size_arg=None)
+def ml_forecast_from_counts(daily_counts, periods=4):
+    """
+    `ml_forecast_time_series` over pre-aggregated (report_date, count) rows,
+    e.g. `cube.rollup(["report_date"], "rows")`.
+    """
+    if not ML_AVAILABLE or daily_counts['count'].sum() < 3:
+        return None, None
     try:
-        daily_counts = historical_data.groupby('report_date').size().reset_index(name='count')
         daily_counts = daily_counts.sort_values('report_date')
         if len(daily_counts) < 2:
             return None, None
@@ -137,9 +151,10 @@ def ml_forecast_time_series(historical_data, periods=4):
         trend = forecast_values[-1] - y[-1]
         return forecast_df, trend
     except Exception as e:
-        st.warning(f"Time series forecasting unavailable: {e}")
+        reporting.warning(f"Time series forecasting unavailable: {e}")
         return None, None
 
+@instrument()
 def ml_forecast_by_attack_type(trend_data, ttp_columns, top_n=5, periods=4):
     """
     Generate individual ML forecasts for each attack type.
@@ -154,15 +169,29 @@ def ml_forecast_by_attack_type(trend_data, ttp_columns, top_n=5, periods=4):
             melted = melted.explode("TTP")
         melted = melted.dropna(subset=["TTP"])
         melted = melted[melted["TTP"] != "None"]
+        counts = melted.groupby(["report_date", "TTP"], observed=True).size().reset_index(name="count")
+    except Exception as e:
+        reporting.warning(f"Attack-specific forecasting unavailable: {e}")
+        return None
+    return ml_forecast_by_attack_type_from_counts(counts, top_n, periods)
 
-        top_ttps = (melted.groupby("TTP").size()
+@instrument(size_arg=None)
+def ml_forecast_by_attack_type_from_counts(ttp_counts_by_date, top_n=5, periods=4):
+    """
+    `ml_forecast_by_attack_type` over pre-aggregated (report_date, TTP, count)
+    rows, e.g. `cube.rollup(["report_date", "TTP"], "ttps")`.
+    """
+    if not ML_AVAILABLE or ttp_counts_by_date.empty:
+        return None
+    try:
+        top_ttps = (ttp_counts_by_date.groupby("TTP", observed=True)["count"].sum()
                     .sort_values(ascending=False)
                     .head(top_n).index.tolist())
 
         forecasts = {}
         for ttp in top_ttps:
-            ttp_data = melted[melted["TTP"] == ttp]
-            ttp_counts = ttp_data.groupby('report_date').size().reset_index(name='count')
+            ttp_data = ttp_counts_by_date[ttp_counts_by_date["TTP"] == ttp]
+            ttp_counts = ttp_data.groupby('report_date')['count'].sum().reset_index(name='count')
             ttp_counts = ttp_counts.sort_values('report_date')
             if len(ttp_counts) < 2:
                 continue
@@ -209,7 +238,7 @@ def ml_forecast_by_attack_type(trend_data, ttp_columns, top_n=5, periods=4):
             }
         return forecasts
     except Exception as e:
-        st.warning(f"Attack-specific forecasting unavailable: {e}")
+        reporting.warning(f"Attack-specific forecasting unavailable: {e}")
         return None
 
 # --- EXECUTIVE SUMMARY, THREAT ACTORS, PRIORITIZATION, GEO FORECAST, NLP, RESOURCE ALLOCATION, COURSES ---
@@ -8,7 +8,9 @@ and emerging patterns from TTP descriptions using TF‑IDF.
 import pandas as pd
 import numpy as np
 from collections import Counter
-import streamlit as st
+
+from . import reporting
+from .instrumentation import instrument
 
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
@@ -17,6 +19,7 @@ except Exception:
     ML_AVAILABLE = False
 
 
+@instrument()
 def extract_nlp_intelligence(report_data, ttp_columns):
     """
     Extract key intelligence using NLP techniques.
@@ -100,5 +103,5 @@ def extract_nlp_intelligence(report_data, ttp_columns):
         }
 
     except Exception as e:
-        st.warning(f"NLP intelligence extraction unavailable: {e}")
+        reporting.warning(f"NLP intelligence extraction unavailable: {e}")
         return None
@@ -5,8 +5,15 @@ Uses TF‑IDF, frequency analysis, and trend forecasting
 to recommend training courses, simulations, and zero‑day briefings.
 """
 
+import functools
 from collections import Counter
-import streamlit as st
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import stack_columns
+from .instrumentation import instrument, stage
+from .ml_models import ml_forecast_from_counts
 
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
@@ -14,7 +21,28 @@ try:
 except Exception:
     ML_AVAILABLE = False
 
+GROUPINGS = ("week", "country", "source")
+# Bump when build_batch_recommendations changes its output.
+RECOMMENDATIONS_VERSION = "v1"
+TOP_TTPS = 15
+TFIDF_FEATURES = 20
+TOP_KEYWORDS = 10
+
+THREAT_CATEGORIES = {
+    'phishing': ['phishing', 'email', 'spear', 'social engineering', 'credential'],
+    'malware': ['malware', 'ransomware', 'trojan', 'virus', 'payload'],
+    'exploitation': ['exploit', 'vulnerability', 'zero-day', 'cve', 'patch'],
+    'lateral': ['lateral', 'movement', 'privilege', 'escalation', 'persistence'],
+    'data': ['exfiltration', 'data theft', 'extraction', 'stealing'],
+    'ai': ['ai', 'deepfake', 'machine learning', 'automated', 'generated'],
+    'supply_chain': ['supply chain', 'third party', 'vendor', 'partner'],
+    'cloud': ['cloud', 'saas', 'azure', 'aws', 'o365'],
+    'mobile': ['mobile', 'smartphone', 'app', 'byod'],
+    'iot': ['iot', 'smart device', 'connected']
+}
 
+
+@instrument()
 def recommend_courses(trend_data, ttp_columns, forecast_trend):
     """
     ML-powered course recommendations using TF-IDF and pattern analysis.
@@ -47,7 +75,7 @@ def recommend_courses(trend_data, ttp_columns, forecast_trend):
     # TF-IDF scoring
     if ML_AVAILABLE and len(all_ttps) > 5:
         try:
-            vectorizer = TfidfVectorizer(max_features=20)
+            vectorizer = TfidfVectorizer(max_features=TFIDF_FEATURES)
             tfidf_matrix = vectorizer.fit_transform(all_ttps)
             feature_names = vectorizer.get_feature_names_out()
             tfidf_scores = tfidf_matrix.sum(axis=0).A1
@@ -56,7 +84,7 @@ def recommend_courses(trend_data, ttp_columns, forecast_trend):
                 zip(feature_names, tfidf_scores),
                 key=lambda x: x[1],
                 reverse=True
-            )[:10]
+            )[:TOP_KEYWORDS]
 
             recommendations['ml_confidence'] = 0.90
 
@@ -69,31 +97,25 @@ def recommend_courses(trend_data, ttp_columns, forecast_trend):
 
     # Frequency analysis
     ttp_counter = Counter(all_ttps)
-    top_ttps = ttp_counter.most_common(15)
-
-    # Category mapping
-    threat_categories = {
-        'phishing': ['phishing', 'email', 'spear', 'social engineering', 'credential'],
-        'malware': ['malware', 'ransomware', 'trojan', 'virus', 'payload'],
-        'exploitation': ['exploit', 'vulnerability', 'zero-day', 'cve', 'patch'],
-        'lateral': ['lateral', 'movement', 'privilege', 'escalation', 'persistence'],
-        'data': ['exfiltration', 'data theft', 'extraction', 'stealing'],
-        'ai': ['ai', 'deepfake', 'machine learning', 'automated', 'generated'],
-        'supply_chain': ['supply chain', 'third party', 'vendor', 'partner'],
-        'cloud': ['cloud', 'saas', 'azure', 'aws', 'o365'],
-        'mobile': ['mobile', 'smartphone', 'app', 'byod'],
-        'iot': ['iot', 'smart device', 'connected']
-    }
+    top_ttps = ttp_counter.most_common(TOP_TTPS)
 
     # Weighted scoring
-    category_scores = {cat: 0.0 for cat in threat_categories}
+    category_scores = {cat: 0.0 for cat in THREAT_CATEGORIES}
 
     for ttp, count in top_ttps:
-        for category, keywords in threat_categories.items():
+        for category, keywords in THREAT_CATEGORIES.items():
             if any(keyword in ttp for keyword in keywords):
                 importance_boost = 1.5 if any(k in ttp for k, _ in top_keywords) else 1.0
                 category_scores[category] += count * importance_boost
 
+    return _fill_recommendations(recommendations, category_scores, forecast_trend)
+
+
+def _fill_recommendations(recommendations, category_scores, forecast_trend):
+    """
+    Courses, simulations and briefings for the four highest-scoring threat
+    categories, with baseline items for any list left empty.
+    """
     sorted_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)
 
     trend_modifier = "Advanced" if forecast_trend and forecast_trend > 0 else "Foundational"
@@ -162,3 +184,176 @@ def recommend_courses(trend_data, ttp_columns, forecast_trend):
         ]
 
     return recommendations
+
+
+# -------------------------------
+# Batch recommendations
+# -------------------------------
+def _group_memberships(dataset, by):
+    """
+    (rows, codes, labels): the groups of `by` each frame row belongs to; a
+    row belongs to every country it mentions.
+    """
+    frame = dataset.frame
+    if by == "week":
+        return np.arange(len(frame)), dataset.row_report_ids(), list(dataset.report_dates)
+    if by == "country":
+        rows, values = stack_columns(frame, dataset.country_columns)
+    else:
+        values = frame["source"] if "source" in frame.columns else pd.Series([], dtype=object)
+        keep = (values.notna() & (values != "None")).to_numpy()
+        rows, values = np.flatnonzero(keep), values[keep]
+    codes, labels = pd.factorize(np.asarray(values, dtype=object).astype(str), sort=True)
+    pairs = np.unique(rows.astype(np.int64) * max(len(labels), 1) + codes)
+    rows, codes = np.divmod(pairs, max(len(labels), 1))
+    return rows, codes, list(labels)
+
+
+def _expand(occurrence_rows, member_rows, member_codes, n_rows):
+    """
+    (occurrence, group) for every pairing of an occurrence with a group of
+    its row, ordered by occurrence.
+    """
+    per_row = np.bincount(member_rows, minlength=n_rows)
+    order = np.argsort(member_rows, kind="stable")
+    starts = np.cumsum(per_row) - per_row
+    repeats = per_row[occurrence_rows]
+    occurrence = np.repeat(np.arange(len(occurrence_rows)), repeats)
+    within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return occurrence, member_codes[order][starts[occurrence_rows[occurrence]] + within]
+
+
+def _term_matrix(texts):
+    """
+    (T, terms): TTP × term counts under the TfidfVectorizer analyzer, with
+    terms in the vectorizer's (sorted) feature order.
+    """
+    analyze = TfidfVectorizer().build_analyzer()
+    tokens = [analyze(text) for text in texts]
+    terms = sorted({t for doc in tokens for t in doc})
+    position = {t: i for i, t in enumerate(terms)}
+    T = np.zeros((len(texts), len(terms)), dtype=np.float64)
+    for i, doc in enumerate(tokens):
+        for t in doc:
+            T[i, position[t]] += 1
+    return T, np.asarray(terms, dtype=object)
+
+
+def _top_keywords(T, terms, counts):
+    """
+    The top keywords `recommend_courses` derives for a group whose distinct
+    TTPs have term rows `T` and occurrence `counts`: TF-IDF over one
+    document per occurrence, limited to TFIDF_FEATURES terms. None when the
+    group has no terms (the vectorizer's empty-vocabulary error).
+    """
+    tf = counts @ T
+    vocabulary = np.flatnonzero(tf)
+    if not len(vocabulary):
+        return None
+    if len(vocabulary) > TFIDF_FEATURES:
+        # Same selection (and tie order) as CountVectorizer._limit_features.
+        chosen = (-tf[vocabulary]).argsort()[:TFIDF_FEATURES]
+        mask = np.zeros(len(vocabulary), dtype=bool)
+        mask[chosen] = True
+        vocabulary = vocabulary[mask]
+    n_docs = counts.sum()
+    df = counts @ (T[:, vocabulary] > 0)
+    weights = T[:, vocabulary] * (np.log((1 + n_docs) / (1 + df)) + 1)
+    norms = np.sqrt((weights ** 2).sum(axis=1, keepdims=True))
+    weights = np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+    scores = counts @ weights
+    return sorted(zip(terms[vocabulary], scores), key=lambda x: x[1], reverse=True)[:TOP_KEYWORDS]
+
+
+def _group_trends(dataset, by, rows, codes, n_groups, periods):
+    """
+    Forecast trend per group: for weeks, the trend of all reports up to
+    that week (as the headless run computes it); otherwise the trend of the
+    group's own rows per report.
+    """
+    report_dates = pd.to_datetime(np.array(dataset.report_dates, dtype="datetime64[D]"))
+    per_report = np.bincount(codes * len(report_dates) + dataset.row_report_ids()[rows],
+                             minlength=n_groups * len(report_dates)).reshape(n_groups, len(report_dates))
+    if by == "week":
+        totals = per_report.sum(axis=0)
+        series = [totals[:i + 1] for i in range(n_groups)]
+    else:
+        series = list(per_report)
+    trends = []
+    for counts in series:
+        present = np.flatnonzero(counts)
+        history = pd.DataFrame({"report_date": report_dates[present], "count": counts[present]})
+        trends.append(ml_forecast_from_counts(history, periods=periods)[1])
+    return trends
+
+
+@instrument(size_arg=None)
+def build_batch_recommendations(dataset, by="week", periods=4):
+    """
+    `recommend_courses` output for every group of `by` ("week", "country" or
+    "source"), as {group: recommendations}. TTP occurrences, their TF-IDF
+    term rows and category matches are computed once for the whole history
+    and shared by all groups; each group only reduces its own counts.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping '{by}', expected one of {GROUPINGS}")
+    member_rows, member_codes, labels = _group_memberships(dataset, by)
+    n_groups = len(labels)
+
+    with stage("recommendations.features"):
+        t_rows, t_values = stack_columns(dataset.frame, dataset.ttp_columns)
+        value_codes, uniques = pd.factorize(t_values)
+        texts, ttp_of_value = np.unique(np.array([str(u).lower() for u in uniques], dtype=object),
+                                        return_inverse=True)
+        ttp_codes = ttp_of_value[value_codes]
+        categories = np.array([[any(k in text for k in keywords) for keywords in THREAT_CATEGORIES.values()]
+                               for text in texts], dtype=bool).reshape(len(texts), len(THREAT_CATEGORIES))
+        if ML_AVAILABLE:
+            T, terms = _term_matrix(texts)
+
+    with stage("recommendations.group_counts"):
+        occurrence, groups = _expand(t_rows, member_rows, member_codes, len(dataset.frame))
+        keys = groups * max(len(texts), 1) + ttp_codes[occurrence]
+        unique, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        group_of, ttp_of = np.divmod(unique, max(len(texts), 1))
+        # Counter.most_common order: count, then first appearance in the group.
+        order = np.lexsort((occurrence[first], -counts, group_of))
+        group_of, ttp_of, counts = group_of[order], ttp_of[order], counts[order]
+        bounds = np.searchsorted(group_of, np.arange(n_groups + 1))
+
+    trends = _group_trends(dataset, by, member_rows, member_codes, n_groups, periods)
+    names = list(THREAT_CATEGORIES)
+    results = {}
+    for g, label in enumerate(labels):
+        recommendations = {
+            'priority_courses': [],
+            'priority_simulations': [],
+            'priority_zero_day': [],
+            'ml_confidence': 0.0
+        }
+        ttps, group_counts = ttp_of[bounds[g]:bounds[g + 1]], counts[bounds[g]:bounds[g + 1]]
+        if not len(ttps):
+            results[label] = recommendations
+            continue
+
+        top_keywords = None
+        if ML_AVAILABLE and group_counts.sum() > 5:
+            top_keywords = _top_keywords(T[ttps], terms, group_counts.astype(np.float64))
+        recommendations['ml_confidence'] = 0.65 if top_keywords is None else 0.90
+
+        top, top_counts = ttps[:TOP_TTPS], group_counts[:TOP_TTPS]
+        boost = np.array([1.5 if any(k in texts[t] for k, _ in top_keywords or []) else 1.0 for t in top])
+        scores = (top_counts * boost) @ categories[top]
+        results[label] = _fill_recommendations(recommendations, dict(zip(names, scores.tolist())), trends[g])
+    return results
+
+
+def batch_recommendations(dataset, by="week", periods=4):
+    """
+    {group: recommendations} for every group of `by`, cached per dataset
+    version, RECOMMENDATIONS_VERSION and whether TF-IDF keywords are
+    available (see build_batch_recommendations).
+    """
+    build = functools.partial(build_batch_recommendations, by=by, periods=periods)
+    builder_version = f"{RECOMMENDATIONS_VERSION}-{'tfidf' if ML_AVAILABLE else 'counts'}"
+    return dataset.cached_artifact(f"recommendations_{by}_p{periods}", build, builder_version=builder_version)
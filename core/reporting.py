@@ -0,0 +1,118 @@
+"""
+Reporting Hook
+--------------
+Routes user-facing messages from the core modules to Streamlit when running
+inside a Streamlit session and to the standard `logging` module otherwise,
+so the analytics can run headless (batch jobs, profiling, the HTTP API).
+"""
+
+import logging
+
+logger = logging.getLogger("cti")
+
+
+class ReportsUnavailableError(RuntimeError):
+    """Raised by headless reporters when analysis cannot continue."""
+
+
+class LoggingReporter:
+    def info(self, message, sidebar=False):
+        logger.info(message)
+
+    def success(self, message, sidebar=False):
+        logger.info(message)
+
+    def warning(self, message, sidebar=False):
+        logger.warning(message)
+
+    def error(self, message, sidebar=False):
+        logger.error(message)
+
+    def stop(self, message):
+        logger.error(message)
+        raise ReportsUnavailableError(message)
+
+
+class StreamlitReporter:
+    """
+    Messages raised outside the session's script thread (e.g. in the
+    analytics worker pool or the report watcher) go to the logger, as
+    Streamlit cannot place them; `stop()` there raises like the headless
+    reporter, since `st.stop()` only halts a script run.
+    """
+
+    @staticmethod
+    def _in_script():
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True) is not None
+
+    def _emit(self, kind, message, sidebar):
+        import streamlit as st
+        if not self._in_script():
+            getattr(LoggingReporter(), kind)(message)
+            return
+        getattr(st.sidebar if sidebar else st, kind)(message)
+
+    def info(self, message, sidebar=False):
+        self._emit("info", message, sidebar)
+
+    def success(self, message, sidebar=False):
+        self._emit("success", message, sidebar)
+
+    def warning(self, message, sidebar=False):
+        self._emit("warning", message, sidebar)
+
+    def error(self, message, sidebar=False):
+        self._emit("error", message, sidebar)
+
+    def stop(self, message):
+        import streamlit as st
+        if not self._in_script():
+            LoggingReporter().stop(message)
+        st.error(message)
+        st.stop()
+
+
+_reporter = None
+
+
+def _in_streamlit():
+    try:
+        from streamlit import runtime
+        return runtime.exists()
+    except Exception:
+        return False
+
+
+def set_reporter(reporter):
+    """
+    Install `reporter` for all core modules; pass None to restore auto-detection.
+    """
+    global _reporter
+    _reporter = reporter
+
+
+def get_reporter():
+    if _reporter is not None:
+        return _reporter
+    return StreamlitReporter() if _in_streamlit() else LoggingReporter()
+
+
+def info(message, sidebar=False):
+    get_reporter().info(message, sidebar=sidebar)
+
+
+def success(message, sidebar=False):
+    get_reporter().success(message, sidebar=sidebar)
+
+
+def warning(message, sidebar=False):
+    get_reporter().warning(message, sidebar=sidebar)
+
+
+def error(message, sidebar=False):
+    get_reporter().error(message, sidebar=sidebar)
+
+
+def stop(message):
+    get_reporter().stop(message)
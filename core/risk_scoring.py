@@ -1,3 +1,8 @@
+from .cube import UNKNOWN_SOURCE
+from .data_loader import flatten_ttp_values
+from .geo_utils import get_nordic_baltic_countries
+from .instrumentation import instrument
+
 def calculate_iso_risk_score(ttp_count, country_count, source_count, regional_focus=False):
     regional_multiplier = 1.2 if regional_focus else 1.0
     threat_frequency = min(ttp_count / 50, 1.0) * 30 * regional_multiplier
@@ -8,8 +13,12 @@ def calculate_iso_risk_score(ttp_count, country_count, source_count, regional_fo
     return min(total_score, 100)
 
 def calculate_nist_risk_score(ttp_count, country_count, unique_techniques, regional_focus=False):
+    """
+    `unique_techniques` is the distinct techniques or just their number.
+    """
     regional_multiplier = 1.15 if regional_focus else 1.0
-    likelihood = min(len(unique_techniques) / 30, 1.0) * 40 * regional_multiplier
+    unique_count = unique_techniques if isinstance(unique_techniques, (int, float)) else len(unique_techniques)
+    likelihood = min(unique_count / 30, 1.0) * 40 * regional_multiplier
     impact = min(country_count / 15, 1.0) * 35 * regional_multiplier
     vulnerability = min(ttp_count / 40, 1.0) * 25
     total_score = likelihood + impact + vulnerability
@@ -22,3 +31,73 @@ def get_risk_level(score):
         return "MEDIUM", "#ffaa00"
     else:
         return "LOW", "#44ff44"
+
+@instrument()
+def score_report(report, ttp_columns, all_countries, selected_countries=None):
+    """
+    ISO 27005 / NIST SP 800-30 scores for one report and the counts behind them.
+    `all_countries` is the candidate country list the geographic filter applies to.
+    """
+    ttps = flatten_ttp_values(report, ttp_columns)
+    sources_count = report['source'].nunique() if 'source' in report.columns else 0
+    return _score(len(ttps), set(ttps), all_countries, selected_countries, sources_count)
+
+@instrument(size_arg=None)
+def score_report_from_cube(cube, report_date, all_countries, selected_countries=None):
+    """
+    `score_report` for the report dated `report_date`, read from a count cube
+    (core.cube) instead of the report rows.
+    """
+    ttp_counts = cube.rollup(["TTP"], "ttps", start=report_date, end=report_date)
+    sources = cube.rollup(["source"], "rows", start=report_date, end=report_date)
+    sources_count = int((sources["source"] != UNKNOWN_SOURCE).sum())
+    return _score(int(ttp_counts["count"].sum()), set(ttp_counts["TTP"]), all_countries,
+                  selected_countries, sources_count)
+
+@instrument(size_arg=None)
+def score_range_from_sketches(sketches, start=None, end=None):
+    """
+    Approximate scores over every report dated within [start, end], from
+    per-report sketches (core.sketches): distinct TTPs, countries and sources
+    are HyperLogLog estimates. No geographic filter applies.
+    """
+    unique_count = sketches.distinct("TTP", start, end)
+    metrics = _scores(sketches.total("TTP", start, end), unique_count, sketches.distinct("country", start, end),
+                      sketches.distinct("source", start, end), regional_focus=False)
+    return {**metrics, 'unique_ttps_count': unique_count}
+
+def _score(total_ttp_count, unique_techniques, all_countries, selected_countries, sources_count):
+    nordic_baltic = get_nordic_baltic_countries()
+
+    if selected_countries:
+        country_count = len([c for c in all_countries if c in selected_countries])
+    else:
+        country_count = len(all_countries)
+    regional_focus = bool(selected_countries and any(c in nordic_baltic for c in selected_countries))
+
+    metrics = _scores(total_ttp_count, len(unique_techniques), country_count, sources_count, regional_focus)
+    return {
+        'total_ttp_count': total_ttp_count,
+        'unique_ttps_count': len(unique_techniques),
+        'unique_techniques': unique_techniques,
+        **metrics,
+    }
+
+def _scores(total_ttp_count, unique_count, country_count, sources_count, regional_focus):
+    iso_score = calculate_iso_risk_score(total_ttp_count, country_count, sources_count, regional_focus)
+    nist_score = calculate_nist_risk_score(total_ttp_count, country_count, unique_count, regional_focus)
+    iso_level, iso_color = get_risk_level(iso_score)
+    nist_level, nist_color = get_risk_level(nist_score)
+
+    return {
+        'total_ttp_count': total_ttp_count,
+        'country_count': country_count,
+        'sources_count': sources_count,
+        'regional_focus': regional_focus,
+        'iso_score': iso_score,
+        'iso_level': iso_level,
+        'iso_color': iso_color,
+        'nist_score': nist_score,
+        'nist_level': nist_level,
+        'nist_color': nist_color,
+    }
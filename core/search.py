@@ -0,0 +1,168 @@
+"""
+TTP Search Index
+----------------
+Inverted index over the ttp_desc* text: token -> rows that mention it. The
+index is a list of per-report segments, each a sorted vocabulary with CSR
+posting lists of row offsets within the report. Segments are keyed by a
+hash of the report's TTP columns and kept in the artifact store, so a new
+or changed report only builds its own segment.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER
+from .artifacts import load_artifact, save_artifact
+from .data_loader import stack_columns
+from .dataset import report_signature
+from .instrumentation import instrument, stage
+
+SEGMENTS_ARTIFACT = "search_segments"
+SEGMENTS_VERSION = "v1"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens; ATT&CK IDs such as T1566.002 stay one token.
+    """
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def build_segment(report, ttp_columns):
+    """
+    (vocabulary, indptr, postings) for one report: postings[indptr[i]:indptr[i + 1]]
+    are the sorted row offsets whose TTPs contain vocabulary[i].
+    """
+    rows, values = stack_columns(report, ttp_columns)
+    if len(values) == 0:
+        return np.empty(0, dtype=object), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32)
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind="stable")
+    rows_by_code = rows[order].astype(np.int32)
+    code_bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+
+    token_codes = {}
+    for code, value in enumerate(uniques):
+        for token in set(tokenize(value)):
+            token_codes.setdefault(token, []).append(code)
+
+    vocabulary = np.array(sorted(token_codes), dtype=object)
+    postings = []
+    for token in vocabulary:
+        token_rows = [rows_by_code[code_bounds[c]:code_bounds[c + 1]] for c in token_codes[token]]
+        postings.append(np.unique(np.concatenate(token_rows)))
+    indptr = np.concatenate(([0], np.cumsum([len(p) for p in postings]))).astype(np.int64)
+    return vocabulary, indptr, np.concatenate(postings).astype(np.int32)
+
+
+def _segment_rows(segment, term):
+    """
+    Rows of a segment containing any token that starts with `term`.
+    """
+    vocabulary, indptr, postings = segment
+    lo = np.searchsorted(vocabulary, term, side="left")
+    hi = np.searchsorted(vocabulary, term + "\uffff", side="left")
+    if lo == hi:
+        return np.empty(0, dtype=np.int32)
+    if hi - lo == 1:
+        return postings[indptr[lo]:indptr[hi]]
+    return np.unique(postings[indptr[lo]:indptr[hi]])
+
+
+class SearchIndex:
+    """
+    Per-report segments of one dataset version, with their row offsets in
+    the shared frame.
+    """
+
+    def __init__(self, segments):
+        self.segments = segments  # [(report_date, start, segment)]
+
+    def lookup(self, query):
+        """
+        Frame row positions whose TTPs match every term of `query` (each term
+        as a token prefix), oldest report first.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        matches = []
+        for _, start, segment in self.segments:
+            rows = _segment_rows(segment, terms[0])
+            for term in terms[1:]:
+                if len(rows) == 0:
+                    break
+                rows = np.intersect1d(rows, _segment_rows(segment, term), assume_unique=True)
+            if len(rows):
+                matches.append(rows.astype(np.int64) + start)
+        return np.concatenate(matches) if matches else np.empty(0, dtype=np.int64)
+
+    def nbytes(self):
+        return sum(
+            indptr.nbytes + postings.nbytes + sum(len(t) for t in vocabulary)
+            for _, _, (vocabulary, indptr, postings) in self.segments
+        )
+
+
+@instrument(size_arg=None)
+def build_search_index(dataset, cache_folder=CACHE_FOLDER):
+    """
+    Search index for `dataset`, reusing stored segments of unchanged reports.
+    """
+    stored = load_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, cache_folder) or {}
+    segments, current = [], {}
+    for report_date, start, stop in dataset.date_offsets():
+        report = dataset.frame.iloc[start:stop]
+        signature = report_signature(report, dataset.ttp_columns)
+        segment = stored.get(signature)
+        if segment is None:
+            with stage("search.build_segment", size=len(report)):
+                segment = build_segment(report, dataset.ttp_columns)
+        current[signature] = segment
+        segments.append((report_date, start, segment))
+    if current.keys() != stored.keys():
+        save_artifact(SEGMENTS_ARTIFACT, SEGMENTS_VERSION, current, cache_folder)
+    return SearchIndex(segments)
+
+
+def get_search_index(dataset):
+    return dataset.artifact("search_index", build_search_index, size_of=SearchIndex.nbytes)
+
+
+@instrument(size_arg=None)
+def search_ttps(dataset, query, limit=None, within=None):
+    """
+    Rows of `dataset` whose TTP descriptions match `query`, as a dict with
+    the matching rows, per-report-date counts, per-country counts and the
+    TTP descriptions of those rows that contain a query term. `within` (a
+    RowBitmap) limits the matches to its rows.
+    """
+    rows = get_search_index(dataset).lookup(query)
+    if within is not None:
+        rows = rows[np.isin(rows, within.rows(), assume_unique=True)]
+    matched = dataset.frame.iloc[rows]
+    by_date = (matched.groupby("report_date").size().rename("count").reset_index()
+               if len(matched) else pd.DataFrame(columns=["report_date", "count"]))
+
+    _, countries = stack_columns(matched, dataset.country_columns)
+    by_country = countries.value_counts().rename_axis("country").reset_index(name="count")
+    by_country = by_country[by_country["count"] > 0]
+
+    terms = tokenize(query)
+    _, ttps = stack_columns(matched, dataset.ttp_columns)
+    ttp_counts = ttps.value_counts()
+    ttp_counts = ttp_counts[ttp_counts > 0]
+    keep = [any(tok.startswith(term) for tok in tokenize(value) for term in terms)
+            for value in ttp_counts.index.astype(object)]
+    by_ttp = ttp_counts[keep].rename_axis("TTP").reset_index(name="count")
+
+    return {
+        "rows": matched if limit is None else matched.head(limit),
+        "total": len(matched),
+        "by_date": by_date,
+        "by_country": by_country,
+        "by_ttp": by_ttp,
+    }
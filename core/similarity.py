@@ -0,0 +1,190 @@
+"""
+TTP Similarity
+--------------
+Near-duplicate detection for free-text TTP descriptions. Strings are
+embedded as character n-gram TF-IDF vectors and bucketed with random-
+hyperplane LSH, so only strings sharing a band key are scored instead of
+every pair in the vocabulary.
+
+The canonical mapping (variant -> representative) is built greedily, most
+frequent strings first, kept in the artifact store and extended only with
+strings not seen before, so representatives stay stable between loads.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER, TTP_SIMILARITY_THRESHOLD
+from .artifacts import load_artifact, save_artifact
+from .instrumentation import instrument
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    SIMILARITY_AVAILABLE = True
+except Exception:
+    SIMILARITY_AVAILABLE = False
+
+CANONICAL_ARTIFACT = "ttp_canonical"
+LSH_BANDS = 24
+LSH_BAND_BITS = 16
+LSH_WINDOW = 16
+PAIR_CHUNK = 200_000
+
+
+def normalize_ttp(text):
+    return re.sub(r"\s+", " ", str(text).strip().lower())
+
+
+class TTPSimilarityIndex:
+    """
+    Char n-gram TF-IDF vectors of `strings` with LSH band keys: strings whose
+    keys agree in any band are candidate neighbors, scored by exact cosine.
+    """
+
+    def __init__(self, strings, seed=0):
+        self.strings = list(strings)
+        self.vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 4), dtype=np.float32)
+        self.vectors = self.vectorizer.fit_transform([normalize_ttp(s) for s in self.strings]).tocsr()
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((self.vectors.shape[1], LSH_BANDS * LSH_BAND_BITS)).astype(np.float32)
+        bits = (self.vectors @ planes) > 0
+        weights = 1 << np.arange(LSH_BAND_BITS, dtype=np.int64)
+        self.band_keys = bits.reshape(len(self.strings), LSH_BANDS, LSH_BAND_BITS) @ weights
+
+    def candidate_pairs(self):
+        """
+        Unique (i, j), i < j, sharing a band key. Within a band, strings are
+        sorted by key and paired with the next LSH_WINDOW entries, which caps
+        the work spent on oversized buckets.
+        """
+        n = len(self.strings)
+        codes = []
+        for band in range(LSH_BANDS):
+            keys = self.band_keys[:, band]
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            for d in range(1, min(LSH_WINDOW, n - 1) + 1):
+                same = sorted_keys[d:] == sorted_keys[:-d]
+                if not same.any():
+                    break
+                a, b = order[:-d][same], order[d:][same]
+                codes.append(np.minimum(a, b) * n + np.maximum(a, b))
+        if not codes:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        codes = np.unique(np.concatenate(codes))
+        return codes // n, codes % n
+
+    def similar_pairs(self, threshold, start=0):
+        """
+        (i, j, cosine) arrays of candidate pairs with cosine ≥ `threshold`,
+        limited to pairs involving a string at position `start` or later.
+        """
+        a, b = self.candidate_pairs()
+        a, b = a[b >= start], b[b >= start]
+        scores = np.empty(len(a), dtype=np.float32)
+        for lo in range(0, len(a), PAIR_CHUNK):
+            hi = lo + PAIR_CHUNK
+            scores[lo:hi] = np.asarray(
+                self.vectors[a[lo:hi]].multiply(self.vectors[b[lo:hi]]).sum(axis=1)).ravel()
+        keep = scores >= threshold
+        return a[keep], b[keep], scores[keep]
+
+    def neighbors(self, i, threshold, k=None):
+        """
+        [(j, cosine)] of strings sharing a band with `i` whose cosine is at
+        least `threshold`, most similar first.
+        """
+        candidates = np.flatnonzero((self.band_keys == self.band_keys[i]).any(axis=1))
+        candidates = candidates[candidates != i]
+        if not len(candidates):
+            return []
+        scores = (self.vectors[candidates] @ self.vectors[i].T).toarray().ravel()
+        keep = scores >= threshold
+        order = np.argsort(-scores[keep], kind="stable")[:k]
+        return list(zip(candidates[keep][order].tolist(), scores[keep][order].tolist()))
+
+
+@instrument(size_arg=None)
+def build_canonical_mapping(counts, previous=None, threshold=TTP_SIMILARITY_THRESHOLD):
+    """
+    {string: canonical string} for every string in `counts` (a value ->
+    frequency Series). Strings already in `previous` keep their mapping;
+    new ones, most frequent first, map to the most similar canonical string
+    above `threshold` or become canonical themselves.
+    """
+    previous = dict(previous or {})
+    new = [s for s in counts.sort_values(ascending=False, kind="stable").index if s not in previous]
+    if not new or not SIMILARITY_AVAILABLE:
+        return {**previous, **{s: s for s in new}}
+
+    leaders = sorted(set(previous.values()))
+    index = TTPSimilarityIndex(leaders + new)
+    a, b, scores = index.similar_pairs(threshold, start=len(leaders))
+    src, dst = np.concatenate([a, b]), np.concatenate([b, a])
+    scores = np.concatenate([scores, scores])
+    order = np.argsort(src, kind="stable")
+    src, dst, scores = src[order], dst[order], scores[order]
+    bounds = np.searchsorted(src, np.arange(len(index.strings) + 1))
+
+    is_leader = np.zeros(len(index.strings), dtype=bool)
+    is_leader[:len(leaders)] = True
+    mapping = previous
+    for i in range(len(leaders), len(index.strings)):
+        nbrs, nbr_scores = dst[bounds[i]:bounds[i + 1]], scores[bounds[i]:bounds[i + 1]]
+        nbr_scores = nbr_scores[is_leader[nbrs]]
+        if len(nbr_scores):
+            mapping[index.strings[i]] = index.strings[nbrs[is_leader[nbrs]][np.argmax(nbr_scores)]]
+        else:
+            mapping[index.strings[i]] = index.strings[i]
+            is_leader[i] = True
+    return mapping
+
+
+def find_similar_ttps(strings, query, threshold=0.5, k=10):
+    """
+    [(string, cosine)] of the `k` entries of `strings` most similar to `query`.
+    """
+    if not SIMILARITY_AVAILABLE:
+        return []
+    strings = [s for s in dict.fromkeys(strings) if s != query]
+    index = TTPSimilarityIndex(strings + [query])
+    return [(index.strings[j], score) for j, score in index.neighbors(len(strings), threshold, k)]
+
+
+@instrument(size_arg=None)
+def canonicalize_ttps(frames, threshold=TTP_SIMILARITY_THRESHOLD, cache_folder=CACHE_FOLDER):
+    """
+    Rewrite the ttp_desc* values of `frames` to their canonical variant,
+    extending the cached mapping with strings not seen before.
+    """
+    columns = [[c for c in df.columns if str(c).lower().startswith("ttp_desc")] for df in frames]
+    values = pd.concat(
+        [df[col].astype(object) for df, cols in zip(frames, columns) for col in cols],
+        ignore_index=True,
+    ) if any(columns) else pd.Series([], dtype=object)
+    values = values.dropna()
+    counts = values[values != "None"].value_counts()
+
+    version = f"v1-{threshold}"
+    previous = load_artifact(CANONICAL_ARTIFACT, version, cache_folder) if cache_folder else None
+    mapping = previous or {}
+    if not set(counts.index) <= mapping.keys():
+        mapping = build_canonical_mapping(counts, mapping, threshold)
+        if cache_folder:
+            save_artifact(CANONICAL_ARTIFACT, version, mapping, cache_folder)
+
+    changes = {s: c for s, c in mapping.items() if s != c and s in counts.index}
+    if not changes:
+        return frames
+    canonical = []
+    for df, cols in zip(frames, columns):
+        df = df.copy()
+        for col in cols:
+            mask = df[col].isin(changes.keys())
+            if mask.any():
+                values = df[col].astype(object)
+                df[col] = values.where(~mask, values.map(changes))
+        canonical.append(df)
+    return canonical
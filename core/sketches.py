@@ -0,0 +1,246 @@
+"""
+Range Sketches
+--------------
+Fixed-size per-report summaries for questions over long date ranges:
+
+- HyperLogLog registers estimate the number of distinct TTPs, countries
+  and sources (relative error about 1.04 / sqrt(2**SKETCH_HLL_PRECISION));
+- space-saving summaries keep the SKETCH_TOP_CAPACITY most frequent values
+  with an upper-bound count and a maximum overestimate, for top-k.
+
+Both merge across reports (register max; summed counters), so a range is
+answered by merging its reports' sketches instead of rescanning rows.
+Sketches are keyed by a content hash of each report and kept in the
+artifact store next to the other per-report segments.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_FOLDER, SKETCH_HLL_PRECISION, SKETCH_TOP_CAPACITY
+from .artifacts import load_artifact, save_artifact
+from .data_loader import stack_columns
+from .dataset import report_signature
+from .instrumentation import instrument, stage
+
+SEGMENTS_ARTIFACT = "sketch_segments"
+SEGMENTS_VERSION = "v1"
+DIMENSIONS = ("TTP", "country", "source")
+
+
+def _bit_length(values):
+    """
+    Bit length of each uint64, exact (via two 32-bit halves that float64
+    represents exactly).
+    """
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    high_bits = np.frexp(high)[1]
+    return np.where(high > 0, high_bits + 32, np.frexp(low)[1])
+
+
+class HyperLogLog:
+    """
+    2**precision 8-bit registers over 64-bit value hashes.
+    """
+
+    def __init__(self, precision=SKETCH_HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        values = pd.Series(values, dtype=object).dropna().to_numpy()
+        if not len(values):
+            return self
+        hashes = pd.util.hash_array(values)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    @classmethod
+    def merge(cls, sketches):
+        sketches = list(sketches)
+        if not sketches:
+            return cls()
+        return cls(sketches[0].precision, np.maximum.reduce([s.registers for s in sketches]))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)
+        return raw
+
+    def nbytes(self):
+        return self.registers.nbytes
+
+
+class SpaceSaving:
+    """
+    Heavy-hitter summary of at most `capacity` values. Each kept value has
+    `counts` (an upper bound on its true count) and `errors` (how much of
+    that may be overestimate); any value not kept occurred at most `floor`
+    times. `total` is the exact number of occurrences summarized.
+    """
+
+    def __init__(self, values, counts, errors, floor=0, total=0, capacity=SKETCH_TOP_CAPACITY):
+        self.values = values
+        self.counts = counts
+        self.errors = errors
+        self.floor = floor
+        self.total = total
+        self.capacity = capacity
+
+    @classmethod
+    def from_counts(cls, counts, capacity=SKETCH_TOP_CAPACITY):
+        """
+        Summary of an exact value -> count Series: the `capacity` largest
+        counts are kept exactly, the largest dropped count becomes the floor.
+        """
+        counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+        kept, dropped = counts.iloc[:capacity], counts.iloc[capacity:]
+        return cls(np.asarray(kept.index, dtype=object), kept.to_numpy(np.int64),
+                   np.zeros(len(kept), dtype=np.int64), int(dropped.max()) if len(dropped) else 0,
+                   int(counts.sum()), capacity)
+
+    @classmethod
+    def merge(cls, summaries, capacity=SKETCH_TOP_CAPACITY):
+        """
+        Combined summary: a value's count is the sum of its counts, taking
+        each summary's floor where it was not kept, truncated to `capacity`.
+        """
+        summaries = list(summaries)
+        total_floor = sum(s.floor for s in summaries)
+        total = sum(s.total for s in summaries)
+        if not summaries or not any(len(s.values) for s in summaries):
+            return cls(np.empty(0, dtype=object), np.empty(0, dtype=np.int64),
+                       np.empty(0, dtype=np.int64), total_floor, total, capacity)
+        parts = pd.DataFrame({
+            "value": np.concatenate([s.values for s in summaries]),
+            "count": np.concatenate([s.counts - s.floor for s in summaries]),
+            "error": np.concatenate([s.errors - s.floor for s in summaries]),
+        })
+        merged = parts.groupby("value", sort=False)[["count", "error"]].sum() + total_floor
+        merged = merged.sort_values("count", ascending=False, kind="stable")
+        kept, dropped = merged.iloc[:capacity], merged.iloc[capacity:]
+        floor = max(total_floor, int(dropped["count"].max()) if len(dropped) else 0)
+        return cls(np.asarray(kept.index, dtype=object), kept["count"].to_numpy(np.int64),
+                   kept["error"].to_numpy(np.int64), floor, total, capacity)
+
+    def top(self, k=10):
+        """
+        The `k` largest values with columns value, count (upper bound) and
+        lower_bound; `guaranteed` marks values certain to be in the true top k.
+        """
+        n = min(k, len(self.values))
+        lower = self.counts[:n] - self.errors[:n]
+        threshold = self.counts[n] if len(self.values) > n else self.floor
+        return pd.DataFrame({
+            "value": self.values[:n],
+            "count": self.counts[:n],
+            "lower_bound": lower,
+            "guaranteed": lower >= threshold,
+        })
+
+    def nbytes(self):
+        return self.counts.nbytes + self.errors.nbytes + sum(len(str(v)) for v in self.values)
+
+
+def _dimension_values(report, ttp_columns, country_columns):
+    sources = report["source"].astype(object) if "source" in report.columns else pd.Series([], dtype=object)
+    sources = sources[sources.notna() & (sources != "None")]
+    return {
+        "TTP": stack_columns(report, ttp_columns)[1].astype(object),
+        "country": stack_columns(report, country_columns)[1].astype(object),
+        "source": sources,
+    }
+
+
+def build_segment(report, ttp_columns, country_columns, precision=SKETCH_HLL_PRECISION,
+                  capacity=SKETCH_TOP_CAPACITY):
+    """
+    {dimension: (HyperLogLog, SpaceSaving)} for one report.
+    """
+    segment = {}
+    for dimension, values in _dimension_values(report, ttp_columns, country_columns).items():
+        counts = values.value_counts()
+        segment[dimension] = (HyperLogLog(precision).add(counts.index),
+                              SpaceSaving.from_counts(counts, capacity))
+    return segment
+
+
+class RangeSketches:
+    """
+    Per-report sketches of one dataset version, aligned with `report_dates`.
+    """
+
+    def __init__(self, report_dates, segments):
+        self.report_dates = list(report_dates)
+        self.segments = segments
+
+    def nbytes(self):
+        return sum(hll.nbytes() + top.nbytes() for segment in self.segments for hll, top in segment.values())
+
+    def _selected(self, start, end):
+        keys = np.array(self.report_dates, dtype="datetime64[D]")
+        lo = 0 if start is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(start).date(), "D"), side="left")
+        hi = len(keys) if end is None else np.searchsorted(keys, np.datetime64(pd.Timestamp(end).date(), "D"), side="right")
+        return self.segments[lo:hi]
+
+    def _check(self, dimension):
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}', expected one of {DIMENSIONS}")
+
+    def distinct(self, dimension, start=None, end=None):
+        """
+        Estimated number of distinct `dimension` values in [start, end].
+        """
+        self._check(dimension)
+        return int(round(HyperLogLog.merge(s[dimension][0] for s in self._selected(start, end)).estimate()))
+
+    def total(self, dimension, start=None, end=None):
+        """
+        Exact number of `dimension` occurrences in [start, end].
+        """
+        self._check(dimension)
+        return sum(s[dimension][1].total for s in self._selected(start, end))
+
+    def top(self, dimension, k=10, start=None, end=None):
+        """
+        Estimated `k` most frequent `dimension` values in [start, end]; see
+        SpaceSaving.top for the columns.
+        """
+        self._check(dimension)
+        summaries = [s[dimension][1] for s in self._selected(start, end)]
+        return SpaceSaving.merge(summaries).top(k)
+
+
+@instrument(size_arg=None)
+def build_range_sketches(dataset, cache_folder=CACHE_FOLDER):
+    """
+    Sketches for `dataset`, reusing stored sketches of unchanged reports.
+    """
+    columns = dataset.ttp_columns + dataset.country_columns + (["source"] if "source" in dataset.frame else [])
+    version = f"{SEGMENTS_VERSION}-p{SKETCH_HLL_PRECISION}-k{SKETCH_TOP_CAPACITY}"
+    stored = load_artifact(SEGMENTS_ARTIFACT, version, cache_folder) or {}
+    segments, current = [], {}
+    for report_date, start, stop in dataset.date_offsets():
+        report = dataset.frame.iloc[start:stop]
+        signature = report_signature(report, columns)
+        segment = stored.get(signature)
+        if segment is None:
+            with stage("sketches.build_segment", size=len(report)):
+                segment = build_segment(report, dataset.ttp_columns, dataset.country_columns)
+        current[signature] = segment
+        segments.append(segment)
+    if current.keys() != stored.keys():
+        save_artifact(SEGMENTS_ARTIFACT, version, current, cache_folder)
+    return RangeSketches(dataset.report_dates, segments)
+
+
+def get_range_sketches(dataset):
+    return dataset.artifact("range_sketches", build_range_sketches, size_of=RangeSketches.nbytes)
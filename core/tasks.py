@@ -0,0 +1,104 @@
+"""
+Background Analytics
+--------------------
+Process-wide worker pool for page analytics. A page submits its independent
+analytics as one batch keyed by the filter state, renders each result as
+soon as it completes, and a new key from the same session cancels the
+previous batch. Cancelled jobs that have not started are dropped; jobs
+already running finish, but their results are no longer read.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+
+from config import ANALYTICS_WORKERS
+from .instrumentation import stage
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYTICS_WORKERS, thread_name_prefix="cti-analytics")
+        return _executor
+
+
+class Result:
+    """
+    Argument placeholder for the result of a job listed earlier in a batch.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+
+class AnalyticsBatch:
+    """
+    Futures for named jobs, submitted in the given order. `jobs` maps a name
+    to (fn, args) or (fn, args, kwargs); a `Result(name)` argument waits for
+    and is replaced by the result of that earlier job.
+    """
+
+    def __init__(self, key, jobs):
+        self.key = key
+        self.cancelled = False
+        self.futures = {}
+        executor = get_executor()
+        for name, (fn, *rest) in jobs.items():
+            args = rest[0] if rest else ()
+            kwargs = rest[1] if len(rest) > 1 else {}
+            self.futures[name] = executor.submit(self._run, name, fn, args, kwargs)
+
+    def _run(self, name, fn, args, kwargs):
+        args = [self.result(a.name) if isinstance(a, Result) else a for a in args]
+        with stage(f"tasks.{name}"):
+            return fn(*args, **kwargs)
+
+    def result(self, name, timeout=None):
+        return self.futures[name].result(timeout)
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self.futures.values():
+            future.cancel()
+
+    def as_completed(self, names=None, timeout=None):
+        """
+        Yield (name, result, error) for `names` (default: all) in completion
+        order; `error` is the exception a job raised, else None.
+        """
+        pending = {self.futures[n]: n for n in (names or self.futures)}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending and not self.cancelled:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                return
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    yield name, future.result(), None
+                except CancelledError:
+                    return
+                except Exception as e:
+                    yield name, None, e
+
+
+def submit_analytics(state, key, jobs, slot="analytics_batch"):
+    """
+    The batch for `key` stored in `state` (e.g. Streamlit session state),
+    reusing it on reruns with the same key and cancelling the stored batch
+    when the key changed.
+    """
+    current = state.get(slot)
+    if current is not None:
+        if current.key == key and not current.cancelled:
+            return current
+        current.cancel()
+    batch = AnalyticsBatch(key, jobs)
+    state[slot] = batch
+    return batch
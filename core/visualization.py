@@ -1,9 +1,21 @@
+import functools
+import json
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import pycountry
 import streamlit as st
+from . import instrumentation
+from .figure_cache import cached_figure, figure_cache
+from .instrumentation import instrument, stage
 from .risk_scoring import get_risk_level
 
+try:
+    from scipy.cluster.hierarchy import linkage, leaves_list
+    SCIPY_AVAILABLE = True
+except Exception:
+    SCIPY_AVAILABLE = False
+
 def create_modern_plot_theme():
     return {
         'paper_bgcolor': '#050505',
@@ -13,6 +25,8 @@ def create_modern_plot_theme():
         'margin': {'l': 0, 'r': 0, 't': 40, 'b': 20}
     }
 
+@instrument(size_arg=None)
+@cached_figure(create_modern_plot_theme)
 def plot_risk_gauge(score, framework):
     level, color = get_risk_level(score)
     fig = go.Figure(go.Indicator(
@@ -45,29 +59,198 @@ def plot_risk_gauge(score, framework):
     fig.update_layout(**theme)
     return fig
 
-def plot_heatmap(df, x_col, y_col, title, x_order=None, y_order=None, height=500):
+@functools.lru_cache(maxsize=1)
+def _globe_locations():
+    return np.array([c.alpha_3 for c in pycountry.countries])
+
+@functools.lru_cache(maxsize=1)
+def _globe_base_figure():
+    locations = _globe_locations()
+    fig = go.Figure(go.Choropleth(
+        locations=locations,
+        z=np.zeros(len(locations), dtype=np.int8),
+        zmin=0,
+        zmax=1,
+        colorscale=[[0, '#1a1a1a'], [1, '#ffff00']],
+        showscale=False,
+        marker_line_color='#ffff00',
+        marker_line_width=1
+    ))
+    fig.update_geos(
+        projection_type="orthographic",
+        showcoastlines=True, coastlinecolor="#ffff00",
+        showland=True, landcolor="#2a2a2a",
+        showocean=True, oceancolor="#0a0a0a",
+        showframe=False, bgcolor="#0a0a0a"
+    )
+    fig.update_layout(
+        **create_modern_plot_theme(),
+        title={'text': 'Global Threat Distribution', 'y': 0.95, 'x': 0.5, 'xanchor': 'center'},
+        height=400
+    )
+    return fig
+
+def globe_z_values(iso_codes, counts=None):
+    """
+    z-vector aligned with the globe's ISO3 locations: 1/0 presence when
+    `counts` is None, otherwise the summed counts per ISO3 code.
+    """
+    locations = _globe_locations()
+    iso_codes = np.asarray(iso_codes, dtype=object)
+    if counts is None:
+        return np.isin(locations, iso_codes).astype(np.int8)
+    z = np.zeros(len(locations), dtype=np.float32)
+    positions = pd.Index(locations).get_indexer(iso_codes)
+    found = positions >= 0
+    np.add.at(z, positions[found], np.asarray(counts, dtype=np.float32)[found])
+    return z
+
+@instrument()
+@cached_figure(create_modern_plot_theme)
+def plot_threat_globe(iso_codes, counts=None):
+    """
+    Orthographic choropleth built from a precomputed base layer; only the
+    z-vector changes between calls. Pass `counts` aligned with `iso_codes`
+    to shade by event count instead of presence.
+    """
+    fig = go.Figure(_globe_base_figure())
+    z_values = globe_z_values(iso_codes, counts)
+    if counts is None:
+        fig.update_traces(z=z_values)
+    else:
+        fig.update_traces(
+            z=z_values,
+            zmax=max(float(z_values.max()), 1.0),
+            colorscale=[[0, '#1a1a1a'], [0.5, '#ffaa00'], [1, '#ffff00']],
+            hovertemplate="%{location}<br>Threat Events: %{z}<extra></extra>"
+        )
+    return fig
+
+@instrument()
+@cached_figure(create_modern_plot_theme)
+def plot_ttp_bar(ttp_counts):
+    fig = go.Figure(go.Bar(
+        x=ttp_counts["count"],
+        y=ttp_counts["TTP"],
+        orientation="h",
+        text=ttp_counts["count"],
+        textposition="auto",
+        marker=dict(
+            color=ttp_counts["count"],
+            colorscale=[[0, '#ffaa00'], [1, '#ffff00']],
+            line=dict(color='#ffff00', width=1)
+        )
+    ))
+    fig.update_layout(
+        **create_modern_plot_theme(),
+        title={'text': 'Top Human-Targeted Techniques', 'y': 0.95, 'x': 0.5, 'xanchor': 'center'},
+        height=400,
+        yaxis=dict(automargin=True, tickfont=dict(size=10))
+    )
+    return fig
+
+@instrument()
+@cached_figure(create_modern_plot_theme)
+def plot_country_bar(country_counts):
+    fig = go.Figure(go.Bar(
+        x=country_counts["country"],
+        y=country_counts["count"],
+        text=country_counts["count"],
+        textposition="auto",
+        marker=dict(
+            color=country_counts["count"],
+            colorscale=[[0, '#ffaa00'], [1, '#ffff00']],
+            line=dict(color='#ffff00', width=1)
+        )
+    ))
+    fig.update_layout(
+        **create_modern_plot_theme(),
+        height=400,
+        xaxis=dict(tickangle=45, tickfont=dict(size=10)),
+        yaxis=dict(title=dict(text="Threat Events", font=dict(color='#ffff00')))
+    )
+    return fig
+
+def _bucket_top_n(pivot, axis, limit, other_label):
+    """
+    Keep the `limit` - 1 largest labels along `axis` and sum the rest into
+    `other_label`, so `limit` labels remain. A label already named
+    `other_label` is merged into the bucket.
+    """
+    totals = pivot.sum(axis=1 - axis)
+    if limit is None or len(totals) <= limit:
+        return pivot
+    keep = totals.drop(other_label, errors="ignore").nlargest(max(limit, 1) - 1).index
+    if axis == 0:
+        rest = pivot.drop(index=keep).sum(axis=0)
+        pivot = pivot.loc[keep]
+        pivot.loc[other_label] = rest
+    else:
+        rest = pivot.drop(columns=keep).sum(axis=1)
+        pivot = pivot[keep].copy()
+        pivot[other_label] = rest
+    return pivot
+
+def _hierarchical_order(values):
+    """
+    Leaf order of an average-linkage clustering over the rows of `values`.
+    Falls back to descending row totals when scipy is unavailable.
+    """
+    if len(values) < 3 or not SCIPY_AVAILABLE:
+        return np.argsort(-values.sum(axis=1), kind="stable")
+    return leaves_list(linkage(values, method="average", metric="euclidean"))
+
+def _apply_order(pivot, axis, order, cluster, other_label):
+    labels = pivot.index if axis == 0 else pivot.columns
+    if order:
+        ordered = [label for label in order if label in labels]
+        ordered += [label for label in labels if label not in ordered]
+    elif cluster:
+        body = [label for label in labels if label != other_label]
+        block = pivot.loc[body] if axis == 0 else pivot[body].T
+        ordered = [body[i] for i in _hierarchical_order(block.values)]
+        ordered += [label for label in labels if label == other_label]
+    else:
+        return pivot
+    return pivot.reindex(index=ordered) if axis == 0 else pivot.reindex(columns=ordered)
+
+@instrument()
+@cached_figure(create_modern_plot_theme)
+def build_heatmap_figure(df, x_col, y_col, title, x_order=None, y_order=None, height=500,
+                         max_x=30, max_y=30, other_label="Other", cluster=False,
+                         max_text_cells=400):
+    """
+    Build a bounded-size heatmap from a long (x, y, count) frame.
+
+    Only the `max_x` / `max_y` busiest labels are drawn, the remainder is summed
+    into an `other_label` bucket. Cell labels are dropped once the grid exceeds
+    `max_text_cells`, and counts are shipped as a float32 typed array with empty
+    cells left as gaps so the figure payload does not grow with the data.
+    """
     if df.empty:
-        st.info("No data available to display heatmap.")
-        return
+        return None
 
-    pivot = df.pivot(index=y_col, columns=x_col, values="count").fillna(0)
-    if y_order:
-        pivot = pivot.reindex(index=y_order, fill_value=0)
-    if x_order:
-        pivot = pivot.reindex(columns=x_order, fill_value=0)
+    pivot = df.pivot_table(index=y_col, columns=x_col, values="count",
+                           aggfunc="sum", fill_value=0, observed=True)
+    pivot = _bucket_top_n(pivot, 0, max_y, other_label)
+    pivot = _bucket_top_n(pivot, 1, max_x, other_label)
+    pivot = _apply_order(pivot, 0, y_order, cluster, other_label)
+    pivot = _apply_order(pivot, 1, x_order, cluster, other_label)
 
-    z_values = pivot.values
-    text_values = np.where(z_values > 0, z_values.astype(int), "")
+    z_values = pivot.values.astype(np.float32)
+    z_values[z_values == 0] = np.nan
+    show_text = z_values.size <= max_text_cells
 
     fig = go.Figure(go.Heatmap(
         z=z_values,
-        x=list(pivot.columns),
-        y=list(pivot.index),
+        x=[str(c) for c in pivot.columns],
+        y=[str(i) for i in pivot.index],
         colorscale=[[0, '#1a1a1a'], [0.5, '#ffaa00'], [1, '#ffff00']],
-        text=text_values,
-        texttemplate="%{text}",
+        zmin=0,
+        texttemplate="%{z}" if show_text else None,
         textfont={"size": 10, "color": "#ffffff"},
         hovertemplate=f"{x_col}: %{{x}}<br>{y_col}: %{{y}}<br>Count: %{{z}}<extra></extra>",
+        hoverongaps=False,
         showscale=True,
         xgap=2,
         ygap=2
@@ -80,4 +263,40 @@ def plot_heatmap(df, x_col, y_col, title, x_order=None, y_order=None, height=500
         xaxis={'showgrid': False, 'tickangle': 45},
         yaxis={'showgrid': False}
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+def plot_heatmap(df, x_col, y_col, title, x_order=None, y_order=None, height=500, **kwargs):
+    fig = build_heatmap_figure(df, x_col, y_col, title, x_order=x_order, y_order=y_order,
+                               height=height, **kwargs)
+    if fig is None:
+        st.info("No data available to display heatmap.")
+        return
+    with stage("visualization.render_heatmap"):
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_diagnostics_panel():
+    """
+    Collapsible per-stage timing table for the current process, shown only
+    when instrumentation is enabled.
+    """
+    if not instrumentation.is_enabled():
+        return
+    with st.expander("Diagnostics", expanded=False):
+        rows = instrumentation.snapshot()
+        if rows:
+            table = pd.DataFrame(rows)
+            table["total_ms"] = table["total_seconds"] * 1000
+            table["mean_ms"] = table["mean_seconds"] * 1000
+            table["peak_increase_mib"] = table["peak_bytes"].astype(float) / 2**20
+            st.dataframe(
+                table[["stage", "calls", "total_ms", "mean_ms", "max_input_size", "peak_increase_mib"]],
+                use_container_width=True, hide_index=True
+            )
+            st.download_button("Download stage metrics (JSON)",
+                               json.dumps({"stages": rows}, indent=2),
+                               file_name="cti_stage_metrics.json", mime="application/json")
+        else:
+            st.write("No stages recorded yet.")
+        st.caption(f"Figure cache: {figure_cache.stats()}")
+        if st.button("Reset metrics"):
+            instrumentation.reset()
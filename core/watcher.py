@@ -0,0 +1,181 @@
+"""
+Report Folder Watcher
+---------------------
+Polls REPORTS_FOLDER for added, modified and removed `ttp_reports_*` files
+and publishes a new shared `Dataset` when they settle. Only the changed
+files are parsed again (the others come from the per-report cache), and
+the artifacts the previous version had built are rebuilt for the new one
+before it is published: per-report segments (cube, co-occurrence,
+sketches, search) are keyed by report content, so only the affected
+report dates are recomputed, while whole-version artifacts (deltas,
+forecasts, models) follow the new version key. Open sessions pick up the
+new version on their next rerun.
+"""
+
+import glob
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from config import REPORTS_FOLDER, CACHE_FOLDER, WATCH_INTERVAL_SECONDS
+from . import reporting
+from .data_loader import load_local_reports, report_date_from_path
+from .dataset import Dataset, report_fingerprint, get_shared_dataset, publish_dataset, fingerprint_version
+from .instrumentation import instrument, stage
+
+logger = logging.getLogger(__name__)
+
+
+def diff_fingerprints(old, new):
+    """
+    {"added", "modified", "removed"}: sorted report file names that differ
+    between two `report_fingerprint` results.
+    """
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "modified": sorted(name for name in new.keys() & old.keys() if new[name] != old[name]),
+        "removed": sorted(old.keys() - new.keys()),
+    }
+
+
+def affected_dates(changes):
+    """
+    Report dates of the changed files (files without a parsable date are
+    skipped).
+    """
+    dates = {report_date_from_path(name) for names in changes.values() for name in names}
+    return sorted(d.date() for d in dates if pd.notna(d))
+
+
+def _drop_cached_reports(names, cache_folder):
+    for name in names:
+        for path in glob.glob(os.path.join(cache_folder, "reports", glob.escape(name) + ".*.pkl")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def warm_artifacts(dataset):
+    """
+    Build the report-keyed artifacts (count cube, co-occurrence, sketches,
+    search index, weekly deltas) for `dataset`, so their stores under the
+    cache folder are current for other processes.
+    """
+    from .cooccurrence import get_cooccurrence, COOCCURRENCE_AVAILABLE
+    from .cube import get_count_cube
+    from .deltas import get_weekly_deltas
+    from .search import get_search_index
+    from .sketches import get_range_sketches
+
+    for get in (get_count_cube, get_range_sketches, get_search_index, get_weekly_deltas):
+        get(dataset)
+    if COOCCURRENCE_AVAILABLE:
+        get_cooccurrence(dataset)
+    else:
+        logger.info("Skipping the co-occurrence index: scipy is not installed.")
+
+
+@instrument(size_arg=None)
+def refresh_dataset(previous, fingerprint, changes, cache_folder=CACHE_FOLDER):
+    """
+    New `Dataset` of `previous.folder` after `changes`, with the artifacts
+    `previous` had built already rebuilt; it is not published.
+    """
+    _drop_cached_reports(changes["removed"], cache_folder)
+    dataset = Dataset(load_local_reports(previous.folder, cache_folder=cache_folder), previous.folder, fingerprint)
+    for name, (build, size_of) in previous.artifact_builders().items():
+        with stage(f"watcher.rebuild.{name}"):
+            try:
+                dataset.artifact(name, build, size_of)
+            except Exception as e:
+                logger.warning("Could not rebuild %s for the new reports: %s", name, e)
+    return dataset
+
+
+class ReportWatcher:
+    """
+    Polls `folder` every `interval` seconds. A change is applied once the
+    folder has looked the same for two polls in a row, so files still being
+    copied are not read half-written. `on_publish(dataset, changes)` is
+    called after each new version is published.
+    """
+
+    def __init__(self, folder=REPORTS_FOLDER, interval=WATCH_INTERVAL_SECONDS, on_publish=None,
+                 cache_folder=CACHE_FOLDER):
+        self.folder = folder
+        self.interval = interval
+        self.on_publish = on_publish
+        self.cache_folder = cache_folder
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """
+        Check the folder once; returns the applied changes, or None.
+        """
+        current = get_shared_dataset(self.folder, refresh=False)
+        fingerprint = report_fingerprint(self.folder)
+        if fingerprint_version(fingerprint) == current.version:
+            self._pending = None
+            return None
+        if fingerprint != self._pending:
+            self._pending = fingerprint
+            return None
+        self._pending = None
+
+        changes = diff_fingerprints(current.fingerprint, fingerprint)
+        if not fingerprint:
+            logger.warning("All report files were removed from %s/; keeping the loaded version.", self.folder)
+            return None
+        logger.info("Report changes in %s: %s (dates %s)", self.folder,
+                    {kind: len(names) for kind, names in changes.items()}, affected_dates(changes))
+        dataset = refresh_dataset(current, fingerprint, changes, self.cache_folder)
+        publish_dataset(dataset)
+        logger.info("Published dataset version %s (%d rows)", dataset.version, len(dataset))
+        if self.on_publish is not None:
+            self.on_publish(dataset, changes)
+        return changes
+
+    def run(self):
+        """
+        Poll until `stop()` is called.
+        """
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except reporting.ReportsUnavailableError:
+                pass
+            except Exception:
+                logger.exception("Report watcher failed to refresh %s", self.folder)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="cti-report-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def start_watcher(folder=REPORTS_FOLDER, interval=WATCH_INTERVAL_SECONDS):
+    """
+    The process-wide background watcher of `folder`, started on first use.
+    """
+    key = os.path.abspath(folder)
+    with _watchers_lock:
+        if key not in _watchers:
+            _watchers[key] = ReportWatcher(folder, interval).start()
+        return _watchers[key]
@@ -1,29 +1,42 @@
+import time
+
 import streamlit as st
-import pandas as pd
 
-from core.data_loader import load_local_reports, get_ttp_and_country_columns
+from core.attack import get_ttp_groups, regroup_ttps, UNMAPPED
+from core.bitmaps import get_country_bitmaps
+from core.cooccurrence import get_cooccurrence, COOCCURRENCE_AVAILABLE
+from core.cube import get_count_cube
+from core.dataset import get_shared_dataset
+from core.deltas import get_weekly_deltas, deltas_for_week
+from core.search import search_ttps
+from core.sketches import get_range_sketches
 from core.geo_utils import get_nordic_baltic_countries, country_to_iso3
-from core.risk_scoring import calculate_iso_risk_score, calculate_nist_risk_score, get_risk_level
-from core.visualization import plot_risk_gauge, plot_heatmap, create_modern_plot_theme
-import plotly.graph_objects as go
-import pycountry
+from core.risk_scoring import score_report_from_cube, score_range_from_sketches
+from core.visualization import (
+    plot_risk_gauge,
+    plot_heatmap,
+    plot_threat_globe,
+    plot_ttp_bar,
+    plot_country_bar,
+    render_diagnostics_panel,
+)
 
 st.set_page_config(page_title="Dashboard", page_icon="📊", layout="wide")
 
-items = load_local_reports()
-ttp_columns, country_columns = get_ttp_and_country_columns(items)
+dataset = get_shared_dataset()
+items = dataset.frame
+ttp_columns, country_columns = dataset.ttp_columns, dataset.country_columns
 
 st.markdown('<h2 class="glow-text">WEEKLY THREAT INTELLIGENCE OVERVIEW</h2>', unsafe_allow_html=True)
 
-report_dates = sorted(items['report_date'].dt.date.unique(), reverse=True)
+report_dates = dataset.report_dates[::-1]
 selected_date = st.selectbox("Select Intelligence Report Period", report_dates, index=0)
-selected_report = items[items['report_date'].dt.date == selected_date]
+selected_report = dataset.get_report(selected_date)
 
-# Multi-country filter
-all_countries = []
-if country_columns:
-    all_countries = pd.Series(pd.concat([selected_report[col] for col in country_columns], ignore_index=True))
-    all_countries = sorted(all_countries.dropna().unique().tolist())
+# Multi-country filter, resolved on the per-country row bitmaps
+country_index = get_country_bitmaps(dataset)
+report_rows = dataset.row_range(selected_date, selected_date)
+all_countries = country_index.countries_in(*report_rows)
 
 nordic_baltic_countries = get_nordic_baltic_countries()
 default_countries = [c for c in nordic_baltic_countries if c in all_countries]
@@ -35,34 +48,15 @@ selected_countries = st.multiselect(
 )
 
 # Metrics
-if ttp_columns:
-    all_ttps = pd.Series(pd.concat([selected_report[col] for col in ttp_columns], ignore_index=True))
-    all_ttps_flat = []
-    unique_techniques = set()
-    for val in all_ttps:
-        if isinstance(val, (list, tuple, set)):
-            vals = [str(x) for x in val if x not in [None, "None"]]
-            all_ttps_flat.extend(vals)
-            unique_techniques.update(vals)
-        elif pd.notna(val) and str(val) != "None":
-            all_ttps_flat.append(str(val))
-            unique_techniques.add(str(val))
-    unique_ttps_count = len(unique_techniques)
-    total_ttp_count = len(all_ttps_flat)
-else:
-    unique_ttps_count = 0
-    total_ttp_count = 0
-    unique_techniques = set()
-
-country_count = len([c for c in all_countries if c in selected_countries]) if selected_countries else len(all_countries)
-sources_count = selected_report['source'].nunique() if 'source' in selected_report.columns else 0
-regional_focus = bool(selected_countries and any(c in nordic_baltic_countries for c in selected_countries))
-
-iso_score = calculate_iso_risk_score(total_ttp_count, country_count, sources_count, regional_focus)
-nist_score = calculate_nist_risk_score(total_ttp_count, country_count, unique_techniques, regional_focus)
-
-iso_level, iso_color = get_risk_level(iso_score)
-nist_level, nist_color = get_risk_level(nist_score)
+cube = get_count_cube(dataset)
+metrics = score_report_from_cube(cube, selected_date, all_countries, selected_countries)
+unique_ttps_count = metrics['unique_ttps_count']
+sources_count = metrics['sources_count']
+iso_score, iso_level, iso_color = metrics['iso_score'], metrics['iso_level'], metrics['iso_color']
+nist_score, nist_level, nist_color = metrics['nist_score'], metrics['nist_level'], metrics['nist_color']
+ttp_groups = get_ttp_groups(dataset)
+attack_ids = ttp_groups.loc[ttp_groups["TTP"].isin(metrics['unique_techniques']), "technique"]
+attack_id_count = attack_ids[attack_ids != UNMAPPED].nunique()
 
 with st.sidebar:
     st.markdown("""
@@ -85,7 +79,7 @@ with col1:
     st.markdown(f"""
     <div class="metric-container">
         <h3 style="margin: 0; color: #ffff00;">{unique_ttps_count}</h3>
-        <p style="margin: 5px 0 0 0; color: #cccccc;">MITRE TTPs</p>
+        <p style="margin: 5px 0 0 0; color: #cccccc;">MITRE TTPs · {attack_id_count} ATT&CK IDs</p>
     </div>
     """, unsafe_allow_html=True)
 with col2:
@@ -110,103 +104,137 @@ with col4:
     </div>
     """, unsafe_allow_html=True)
 
+if "is_duplicate" in selected_report:
+    carried = int(selected_report["is_duplicate"].sum())
+    if carried:
+        st.caption(f"{carried} of {len(selected_report)} incidents repeat an earlier report "
+                   "(set DEDUP_MODE=collapse to exclude them).")
+
+if selected_countries:
+    involved = country_index.any(selected_countries).restrict(*report_rows).count()
+    caption = f"{involved} of {len(selected_report)} incidents involve the selected countries"
+    if len(selected_countries) > 1:
+        caption += f", {country_index.all(selected_countries).restrict(*report_rows).count()} involve all of them"
+    st.caption(caption + ".")
+
+week_deltas = deltas_for_week(get_weekly_deltas(dataset), selected_date)
+if not week_deltas.empty:
+    st.markdown('<h3 class="glow-text">What\'s New This Week</h3>', unsafe_allow_html=True)
+    st.caption(f"Compared with the report of {week_deltas['previous_date'].iloc[0]}")
+    for kind, label in (("ttp", "Techniques"), ("country", "Countries")):
+        kind_deltas = week_deltas[week_deltas["kind"] == kind]
+        if kind_deltas.empty:
+            continue
+        st.markdown(f"**{label}**")
+        delta_cols = st.columns(4)
+        for col, status in zip(delta_cols, ("new", "rising", "falling", "disappeared")):
+            changed = kind_deltas[kind_deltas["status"] == status].head(5)
+            col.markdown(f"*{status.title()}* ({(kind_deltas['status'] == status).sum()})")
+            for row in changed.itertuples():
+                col.write(f"• {row.value} ({row.previous_count} → {row.count})")
+
 if country_columns and ttp_columns:
-    melted = selected_report.melt(id_vars=country_columns, value_vars=ttp_columns,
-                                  var_name="ttp_col", value_name="TTP")
-    if any(melted["TTP"].apply(lambda x: isinstance(x, (list, tuple, set)))):
-        melted = melted.explode("TTP")
-    melted = melted.dropna(subset=["TTP"])
-    melted = melted[melted["TTP"] != "None"]
-    melted = melted.melt(id_vars=["TTP"], value_vars=country_columns,
-                         var_name="country_col", value_name="country")
-    melted = melted.dropna(subset=["country"])
-    melted = melted[melted["country"] != "None"]
-
-    if selected_countries:
-        melted = melted[melted["country"].isin(selected_countries)]
-
-    if not melted.empty:
+    cells = cube.dice(selected_date, selected_date, {"country": selected_countries or None})
+
+    ttp_grouping = st.radio("Group techniques by", ["Description", "ATT&CK technique", "ATT&CK tactic"],
+                            horizontal=True)
+    attack_level = {"ATT&CK technique": "technique", "ATT&CK tactic": "tactic"}.get(ttp_grouping)
+
+    def ttp_rollup(by):
+        counts = cells.rollup(by)
+        if attack_level is None:
+            return counts
+        counts = regroup_ttps(counts, ttp_groups, attack_level)
+        return counts.groupby(by, as_index=False)["count"].sum().sort_values("count", ascending=False)
+
+    country_counts = cells.rollup(["country"])
+
+    if not country_counts.empty:
         col_globe, col_ttp = st.columns([1, 1.5])
 
-        all_countries_series = pd.Series(pd.concat([selected_report[col] for col in country_columns], ignore_index=True))
-        all_countries_series = all_countries_series.dropna()[all_countries_series != "None"]
-        if selected_countries:
-            all_countries_series = all_countries_series[all_countries_series.isin(selected_countries)]
-        iso_codes = all_countries_series.map(country_to_iso3).dropna().unique()
-        all_iso = [c.alpha_3 for c in pycountry.countries]
-        z_values = [1 if code in iso_codes else 0 for code in all_iso]
-
-        fig_globe = go.Figure(go.Choropleth(
-            locations=all_iso,
-            z=z_values,
-            colorscale=[[0, '#1a1a1a'], [1, '#ffff00']],
-            showscale=False,
-            marker_line_color='#ffff00',
-            marker_line_width=1
-        ))
-        fig_globe.update_geos(
-            projection_type="orthographic",
-            showcoastlines=True, coastlinecolor="#ffff00",
-            showland=True, landcolor="#2a2a2a",
-            showocean=True, oceancolor="#0a0a0a",
-            showframe=False, bgcolor="#0a0a0a"
-        )
-        fig_globe.update_layout(
-            **create_modern_plot_theme(),
-            title={'text': 'Global Threat Distribution', 'y': 0.95, 'x': 0.5, 'xanchor': 'center'},
-            height=400
-        )
+        report_countries = cells.rollup(["country"], "countries")["country"]
+        iso_codes = report_countries.map(country_to_iso3).dropna().unique()
+
+        if col_globe.checkbox("Shade by event count", value=False):
+            globe_counts = country_counts.assign(iso3=country_counts["country"].map(country_to_iso3))
+            globe_counts = globe_counts.dropna(subset=["iso3"])
+            fig_globe = plot_threat_globe(globe_counts["iso3"].values, globe_counts["count"].values)
+        else:
+            fig_globe = plot_threat_globe(iso_codes)
         col_globe.plotly_chart(fig_globe, use_container_width=True)
 
-        ttp_counts = (melted.groupby("TTP").size()
-                      .reset_index(name="count")
-                      .sort_values("count", ascending=False).head(10))
-
-        fig_ttp = go.Figure(go.Bar(
-            x=ttp_counts["count"],
-            y=ttp_counts["TTP"],
-            orientation="h",
-            text=ttp_counts["count"],
-            textposition="auto",
-            marker=dict(
-                color=ttp_counts["count"],
-                colorscale=[[0, '#ffaa00'], [1, '#ffff00']],
-                line=dict(color='#ffff00', width=1)
-            )
-        ))
-        fig_ttp.update_layout(
-            **create_modern_plot_theme(),
-            title={'text': 'Top Human-Targeted Techniques', 'y': 0.95, 'x': 0.5, 'xanchor': 'center'},
-            height=400,
-            yaxis=dict(automargin=True, tickfont=dict(size=10))
-        )
-        col_ttp.plotly_chart(fig_ttp, use_container_width=True)
+        ttp_counts = ttp_rollup(["TTP"]).head(10)
 
-        country_counts = (melted.groupby("country").size()
-                          .reset_index(name="count")
-                          .sort_values("count", ascending=False))
+        fig_ttp = plot_ttp_bar(ttp_counts)
+        col_ttp.plotly_chart(fig_ttp, use_container_width=True)
 
         st.markdown('<h3 class="glow-text">Geographic Threat Distribution</h3>', unsafe_allow_html=True)
-        fig_country = go.Figure(go.Bar(
-            x=country_counts["country"],
-            y=country_counts["count"],
-            text=country_counts["count"],
-            textposition="auto",
-            marker=dict(
-                color=country_counts["count"],
-                colorscale=[[0, '#ffaa00'], [1, '#ffff00']],
-                line=dict(color='#ffff00', width=1)
-            )
-        ))
-        fig_country.update_layout(
-            **create_modern_plot_theme(),
-            height=400,
-            xaxis=dict(tickangle=45, tickfont=dict(size=10)),
-            yaxis=dict(title=dict(text="Threat Events", font=dict(color='#ffff00')))
-        )
+        fig_country = plot_country_bar(country_counts)
         st.plotly_chart(fig_country, use_container_width=True)
 
         st.markdown('<h3 class="glow-text">Threat Technique Heatmap</h3>', unsafe_allow_html=True)
-        heat_data = melted.groupby(["country", "TTP"]).size().reset_index(name="count")
+        heat_data = ttp_rollup(["country", "TTP"])
         plot_heatmap(heat_data, x_col="country", y_col="TTP",
                      title="MITRE Techniques × Geographic Distribution", height=600)
+
+if ttp_columns and COOCCURRENCE_AVAILABLE:
+    st.markdown('<h3 class="glow-text">Technique Co-occurrence</h3>', unsafe_allow_html=True)
+    cooccurrence = get_cooccurrence(dataset)
+    col_window, col_rank = st.columns(2)
+    window = col_window.radio("Reports", ["Selected report", "Last 4 reports", "All reports"], horizontal=True)
+    ranking = col_rank.radio("Rank pairs by", ["count", "lift", "pmi"], horizontal=True)
+    position = dataset.report_dates.index(selected_date)
+    start, end = {
+        "Selected report": (selected_date, selected_date),
+        "Last 4 reports": (dataset.report_dates[max(position - 3, 0)], selected_date),
+        "All reports": (None, None),
+    }[window]
+
+    col_pairs_heat, col_pairs = st.columns([1.5, 1])
+    pair_counts = cooccurrence.pair_frame(start, end)
+    pair_order = pair_counts.groupby("TTP_a")["count"].sum().sort_values(ascending=False).index.tolist()
+    with col_pairs_heat:
+        plot_heatmap(pair_counts, x_col="TTP_a", y_col="TTP_b", title="Techniques Reported in the Same Incident",
+                     x_order=pair_order, y_order=pair_order, height=500)
+    top_pairs = cooccurrence.top_pairs(start, end, k=15, by=ranking)
+    col_pairs.dataframe(top_pairs.round({"support": 3, "lift": 2, "pmi": 2}),
+                        hide_index=True, use_container_width=True)
+elif ttp_columns:
+    st.info("Technique co-occurrence needs scipy; install it with `pip install scipy` to enable this section.")
+
+with st.expander("Archive Range Summary"):
+    sketches = get_range_sketches(dataset)
+    range_start, range_end = st.select_slider("Report range", options=dataset.report_dates,
+                                              value=(dataset.report_dates[0], dataset.report_dates[-1]))
+    range_metrics = score_range_from_sketches(sketches, range_start, range_end)
+    range_cols = st.columns(5)
+    range_cols[0].metric("Distinct TTPs (≈)", range_metrics["unique_ttps_count"])
+    range_cols[1].metric("Countries (≈)", range_metrics["country_count"])
+    range_cols[2].metric("Sources (≈)", range_metrics["sources_count"])
+    range_cols[3].metric("ISO Risk Score", f"{range_metrics['iso_score']:.0f}")
+    range_cols[4].metric("NIST Risk Score", f"{range_metrics['nist_score']:.0f}")
+    col_range_ttps, col_range_countries = st.columns(2)
+    col_range_ttps.dataframe(sketches.top("TTP", 10, range_start, range_end), hide_index=True,
+                             use_container_width=True)
+    col_range_countries.dataframe(sketches.top("country", 10, range_start, range_end), hide_index=True,
+                                  use_container_width=True)
+    st.caption("Distinct counts are HyperLogLog estimates; top values show an upper-bound count and a "
+               "lower bound, exact while a value stays within every report's summary.")
+
+st.markdown('<h3 class="glow-text">Search Threat Archive</h3>', unsafe_allow_html=True)
+query = st.text_input("Search TTP descriptions across all reports", placeholder="e.g. phishing, T1566, social eng")
+only_selected = st.checkbox("Only incidents involving the selected countries", value=False,
+                            disabled=not selected_countries)
+if query:
+    start = time.perf_counter()
+    within = country_index.any(selected_countries) if only_selected and selected_countries else None
+    results = search_ttps(dataset, query, within=within)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    st.caption(f"{results['total']} matching incidents in {len(results['by_date'])} reports ({elapsed_ms:.0f} ms)")
+    if results["total"]:
+        col_dates, col_countries, col_ttps = st.columns(3)
+        col_dates.dataframe(results["by_date"], hide_index=True, use_container_width=True)
+        col_countries.dataframe(results["by_country"], hide_index=True, use_container_width=True)
+        col_ttps.dataframe(results["by_ttp"], hide_index=True, use_container_width=True)
+
+render_diagnostics_panel()
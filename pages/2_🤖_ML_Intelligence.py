@@ -1,38 +1,39 @@
 import streamlit as st
-import pandas as pd
 
-from core.data_loader import load_local_reports, get_ttp_and_country_columns
+from core.bitmaps import get_country_bitmaps
+from core.dataset import get_shared_dataset
 from core.geo_utils import get_nordic_baltic_countries
-from core.risk_scoring import calculate_iso_risk_score, calculate_nist_risk_score
+from core.risk_scoring import score_report
 from core.ml_models import (
     ml_generate_executive_summary,
     ml_threat_actor_profiling,
     ml_automated_threat_prioritization,
     ml_nordic_geographic_risk_forecast,
+    ml_resource_allocation_optimizer,
 )
 from core.nlp_intel import extract_nlp_intelligence
 from core.recommendations import recommend_courses
+from core.tasks import submit_analytics, Result
+from core.visualization import render_diagnostics_panel
 
 st.set_page_config(page_title="ML Intelligence", page_icon="🤖", layout="wide")
 
 # Load data
-items = load_local_reports()
-ttp_columns, country_columns = get_ttp_and_country_columns(items)
+dataset = get_shared_dataset()
+items = dataset.frame
+ttp_columns, country_columns = dataset.ttp_columns, dataset.country_columns
 
 st.markdown('<h2 class="glow-text">ADVANCED ML INTELLIGENCE CENTER</h2>', unsafe_allow_html=True)
 
 # -------------------------------
 # DATA SELECTION
 # -------------------------------
-report_dates = sorted(items['report_date'].dt.date.unique(), reverse=True)
+report_dates = dataset.report_dates[::-1]
 selected_date = st.selectbox("Select Intelligence Report Period", report_dates, index=0)
-selected_report = items[items['report_date'].dt.date == selected_date]
+selected_report = dataset.get_report(selected_date)
 
 # Country filter
-all_countries = []
-if country_columns:
-    all_countries = pd.Series(pd.concat([items[col] for col in country_columns], ignore_index=True))
-    all_countries = sorted(all_countries.dropna().unique().tolist())
+all_countries = get_country_bitmaps(dataset).labels
 
 nordic_baltic = get_nordic_baltic_countries()
 default_countries = [c for c in nordic_baltic if c in all_countries]
@@ -42,95 +43,68 @@ selected_countries = st.multiselect("Geographic Filter", options=all_countries,
 # -------------------------------
 # BASELINE METRICS
 # -------------------------------
-if ttp_columns:
-    all_ttps = pd.Series(pd.concat([selected_report[col] for col in ttp_columns], ignore_index=True))
-    all_ttps_flat = []
-    unique_techniques = set()
-    for val in all_ttps:
-        if isinstance(val, (list, tuple, set)):
-            vals = [str(x) for x in val if x not in [None, "None"]]
-            all_ttps_flat.extend(vals)
-            unique_techniques.update(vals)
-        elif pd.notna(val) and str(val) != "None":
-            all_ttps_flat.append(str(val))
-            unique_techniques.add(str(val))
-    unique_ttps_count = len(unique_techniques)
-    total_ttp_count = len(all_ttps_flat)
-else:
-    unique_ttps_count = 0
-    total_ttp_count = 0
-    unique_techniques = set()
-
-country_count = len([c for c in all_countries if c in selected_countries]) if selected_countries else len(all_countries)
-sources_count = selected_report['source'].nunique() if 'source' in selected_report.columns else 0
-regional_focus = bool(selected_countries and any(c in nordic_baltic for c in selected_countries))
-
-iso_score = calculate_iso_risk_score(total_ttp_count, country_count, sources_count, regional_focus)
-nist_score = calculate_nist_risk_score(total_ttp_count, country_count, unique_techniques, regional_focus)
+metrics = score_report(selected_report, ttp_columns, all_countries, selected_countries)
+iso_score = metrics['iso_score']
+nist_score = metrics['nist_score']
 
 # -------------------------------
-# EXECUTIVE SUMMARY
+# BACKGROUND ANALYTICS
 # -------------------------------
-st.markdown("""
-<div style="margin-top: 20px; margin-bottom: 30px; padding: 20px; 
-background: linear-gradient(145deg, #1a1a1a, #2a2a2a); 
-border: 2px solid #00aaff; border-radius: 15px;">
-    <h3 class="glow-text">ML-POWERED SUMMARY</h3>
-</div>
-""", unsafe_allow_html=True)
-
-with st.spinner("Running machine learning analysis..."):
-    summary, threat_color = ml_generate_executive_summary(
-        selected_report, ttp_columns, country_columns, iso_score, nist_score
-    )
-
-st.markdown(f"""
-<div style="padding: 25px; background: linear-gradient(145deg, #2a2a2a, #1a1a1a); 
-border-left: 4px solid {threat_color}; border-radius: 10px; margin-top: 20px;">
-    <h4 style="color: {threat_color}; margin-top: 0;">
-        THREAT LEVEL: {summary['threat_level']}
-        <span style="font-size: 12px; color: #00aaff; margin-left: 10px;">
-            ML Confidence: {summary['ml_confidence']*100:.0f}%
-        </span>
-    </h4>
-</div>
-""", unsafe_allow_html=True)
-
-# Display insights
-if summary['key_insights']:
-    st.subheader("Key Intelligence Insights")
-    for insight in summary['key_insights']:
-        st.write(f"• {insight}")
-
-if summary['attack_patterns']:
-    st.subheader("ML-Detected Attack Patterns")
-    for pattern in summary['attack_patterns']:
-        st.write(f"• {pattern}")
+# Submitted together as soon as the filters are known; a new date or country
+# selection cancels the previous batch for this session.
+batch = submit_analytics(st.session_state, (dataset.version, selected_date, tuple(selected_countries)), {
+    "summary": (ml_generate_executive_summary,
+                (selected_report, ttp_columns, country_columns, iso_score, nist_score)),
+    "actors": (ml_threat_actor_profiling, (selected_report, ttp_columns)),
+    "prioritized": (ml_automated_threat_prioritization,
+                    (selected_report, ttp_columns, country_columns, iso_score, nist_score)),
+    "geo_forecast": (ml_nordic_geographic_risk_forecast, (items, country_columns), {"periods": 4}),
+    "nlp": (extract_nlp_intelligence, (selected_report, ttp_columns)),
+    "allocation": (ml_resource_allocation_optimizer, (Result("prioritized"), iso_score, nist_score)),
+})
 
-if summary['recommendations']:
-    st.subheader("Strategic Recommendations")
-    for rec in summary['recommendations']:
-        st.write(f"• {rec}")
 
 # -------------------------------
-# ML MODULE TABS
+# EXECUTIVE SUMMARY
 # -------------------------------
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
-    "Threat Actor Profiling",
-    "Automated Threat Prioritization",
-    "Geographic Risk Forecast",
-    "NLP Intelligence Extraction",
-    "Resource Allocation Optimizer"
-])
+def render_summary(result):
+    if not result:
+        st.info("Executive summary unavailable for this report.")
+        return
+    summary, threat_color = result
+    st.markdown(f"""
+    <div style="padding: 25px; background: linear-gradient(145deg, #2a2a2a, #1a1a1a); 
+    border-left: 4px solid {threat_color}; border-radius: 10px; margin-top: 20px;">
+        <h4 style="color: {threat_color}; margin-top: 0;">
+            THREAT LEVEL: {summary['threat_level']}
+            <span style="font-size: 12px; color: #00aaff; margin-left: 10px;">
+                ML Confidence: {summary['ml_confidence']*100:.0f}%
+            </span>
+        </h4>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Display insights
+    if summary['key_insights']:
+        st.subheader("Key Intelligence Insights")
+        for insight in summary['key_insights']:
+            st.write(f"• {insight}")
+
+    if summary['attack_patterns']:
+        st.subheader("ML-Detected Attack Patterns")
+        for pattern in summary['attack_patterns']:
+            st.write(f"• {pattern}")
+
+    if summary['recommendations']:
+        st.subheader("Strategic Recommendations")
+        for rec in summary['recommendations']:
+            st.write(f"• {rec}")
+
 
 # -------------------------------
 # TAB 1 — THREAT ACTOR PROFILING
 # -------------------------------
-with tab1:
-    st.markdown("<h3 class='glow-text'>Threat Actor Profiling</h3>", unsafe_allow_html=True)
-    with st.spinner("Analyzing threat actor patterns..."):
-        actor_profiles = ml_threat_actor_profiling(selected_report, ttp_columns)
-
+def render_actors(actor_profiles):
     if actor_profiles:
         cols = st.columns(len(actor_profiles))
         for col, (actor_name, profile) in zip(cols, actor_profiles.items()):
@@ -157,16 +131,11 @@ with tab1:
     else:
         st.info("Insufficient data for threat actor profiling.")
 
+
 # -------------------------------
 # TAB 2 — AUTOMATED THREAT PRIORITIZATION
 # -------------------------------
-with tab2:
-    st.markdown("<h3 class='glow-text'>Automated Threat Prioritization</h3>", unsafe_allow_html=True)
-    with st.spinner("Calculating threat priority scores..."):
-        prioritized = ml_automated_threat_prioritization(
-            selected_report, ttp_columns, country_columns, iso_score, nist_score
-        )
-
+def render_prioritized(prioritized):
     if prioritized:
         for threat in prioritized[:5]:
             st.markdown(f"""
@@ -191,14 +160,11 @@ with tab2:
     else:
         st.info("Unable to calculate threat priorities.")
 
+
 # -------------------------------
 # TAB 3 — GEOGRAPHIC RISK FORECAST
 # -------------------------------
-with tab3:
-    st.markdown("<h3 class='glow-text'>Geographic Risk Forecast</h3>", unsafe_allow_html=True)
-    with st.spinner("Forecasting regional threat risks..."):
-        geo_forecasts = ml_nordic_geographic_risk_forecast(items, country_columns, periods=4)
-
+def render_geo_forecast(geo_forecasts):
     if geo_forecasts:
         for country, forecast in geo_forecasts.items():
             color = {
@@ -222,14 +188,11 @@ with tab3:
     else:
         st.info("Insufficient historical data for forecasting.")
 
+
 # -------------------------------
 # TAB 4 — NLP INTELLIGENCE EXTRACTION
 # -------------------------------
-with tab4:
-    st.markdown("<h3 class='glow-text'>NLP Intelligence Extraction</h3>", unsafe_allow_html=True)
-    with st.spinner("Extracting intelligence..."):
-        intel = extract_nlp_intelligence(selected_report, ttp_columns)
-
+def render_nlp(intel):
     if intel:
         col1, col2, col3 = st.columns(3)
 
@@ -251,18 +214,11 @@ with tab4:
     else:
         st.info("Not enough data for NLP extraction.")
 
+
 # -------------------------------
 # TAB 5 — RESOURCE ALLOCATION OPTIMIZER
 # -------------------------------
-with tab5:
-    st.markdown("<h3 class='glow-text'>Resource Allocation Optimizer</h3>", unsafe_allow_html=True)
-
-    with st.spinner("Optimizing resource allocation..."):
-        prioritized = ml_automated_threat_prioritization(
-            selected_report, ttp_columns, country_columns, iso_score, nist_score
-        )
-        allocation = ml_resource_allocation_optimizer(prioritized, iso_score, nist_score)
-
+def render_allocation(allocation):
     if allocation:
         st.subheader("Recommended Budget Distribution")
         for category, pct in allocation['allocations']:
@@ -276,3 +232,53 @@ with tab5:
         st.write(f"**{allocation['urgency']}** — {allocation['budget_recommendation']}")
     else:
         st.info("Not enough data for resource optimization.")
+
+
+# -------------------------------
+# LAYOUT
+# -------------------------------
+st.markdown("""
+<div style="margin-top: 20px; margin-bottom: 30px; padding: 20px; 
+background: linear-gradient(145deg, #1a1a1a, #2a2a2a); 
+border: 2px solid #00aaff; border-radius: 15px;">
+    <h3 class="glow-text">ML-POWERED SUMMARY</h3>
+</div>
+""", unsafe_allow_html=True)
+slots = {"summary": st.empty()}
+
+tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    "Threat Actor Profiling",
+    "Automated Threat Prioritization",
+    "Geographic Risk Forecast",
+    "NLP Intelligence Extraction",
+    "Resource Allocation Optimizer"
+])
+panels = [
+    (tab1, "actors", "Threat Actor Profiling", "Analyzing threat actor patterns..."),
+    (tab2, "prioritized", "Automated Threat Prioritization", "Calculating threat priority scores..."),
+    (tab3, "geo_forecast", "Geographic Risk Forecast", "Forecasting regional threat risks..."),
+    (tab4, "nlp", "NLP Intelligence Extraction", "Extracting intelligence..."),
+    (tab5, "allocation", "Resource Allocation Optimizer", "Optimizing resource allocation..."),
+]
+slots["summary"].info("Running machine learning analysis...")
+for tab, name, title, pending in panels:
+    tab.markdown(f"<h3 class='glow-text'>{title}</h3>", unsafe_allow_html=True)
+    slots[name] = tab.empty()
+    slots[name].info(pending)
+
+renderers = {
+    "summary": render_summary,
+    "actors": render_actors,
+    "prioritized": render_prioritized,
+    "geo_forecast": render_geo_forecast,
+    "nlp": render_nlp,
+    "allocation": render_allocation,
+}
+for name, result, error in batch.as_completed():
+    with slots[name].container():
+        if error is not None:
+            st.error(f"{name.replace('_', ' ').title()} failed: {error}")
+        else:
+            renderers[name](result)
+
+render_diagnostics_panel()